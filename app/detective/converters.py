@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Cast the cells of an uploaded csv file into the python values expected by
+# the models. Each column is compiled once (from the header) into a cast
+# function so the type of the field isn't looked up again for every cell.
+# -----------------------------------------------------------------------------
+from django.utils.timezone import utc
+import datetime
+import re
+
+DATE_SEPARATOR = re.compile(r'[^\d]')
+TRUE_VALUES    = ("true", "1", "yes", "y", "on")
+FALSE_VALUES   = ("false", "0", "no", "n", "off")
+
+class CastingError(Exception):
+    """ Raised when a cell can't be casted into the type of its column """
+    def __init__(self, column, value, type, error):
+        self.column = column
+        self.value  = value
+        self.type   = type
+        self.error  = error
+        super(CastingError, self).__init__(error)
+
+def to_unicode(value):
+    return value.decode('utf-8') if isinstance(value, str) else unicode(value)
+
+def to_int(value):
+    return int(value)
+
+def to_float(value):
+    return float(value.replace(",", "."))
+
+def to_date(value):
+    return datetime.datetime(*map(int, DATE_SEPARATOR.split(value)[:3])).replace(tzinfo=utc)
+
+def to_bool(value):
+    lower = value.strip().lower()
+    if lower in TRUE_VALUES:  return True
+    if lower in FALSE_VALUES: return False
+    raise ValueError("'%s' is not a boolean" % value)
+
+def get_converter(column_type):
+    """ Returns the function to cast a decoded cell into the given type """
+    if column_type is None or column_type == "__sources__":
+        return None
+    if "Integer" in column_type: return to_int
+    if "Float"   in column_type: return to_float
+    if "Date"    in column_type: return to_date
+    if "Boolean" in column_type: return to_bool
+    return None
+
+class RowConverter(object):
+    """
+    Compile a list of (column, column_type) (as built by the bulk upload from
+    the header of a file) into a converter for the rows of this file.
+    Rows must start with their id (which is not casted).
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        # (index in the row, column name, column type, cast function, is a source)
+        self.casts = [
+            (i + 1, column, column_type, get_converter(column_type), column_type == "__sources__")
+            for i, (column, column_type) in enumerate(columns)
+        ]
+
+    def convert(self, row):
+        """
+        Returns a tuple (data, sources) for the given row.
+        Raises a CastingError (with the data casted so far) at the first
+        value which can't be casted.
+        """
+        data    = {}
+        sources = {}
+        for index, column, column_type, cast, is_source in self.casts:
+            value = row[index]
+            if not value: continue
+            value = to_unicode(value)
+            if is_source:
+                sources[column] = value
+                continue
+            if cast is not None:
+                try:
+                    value = cast(value)
+                except Exception as e:
+                    error = CastingError(column=column, value=value, type=column_type, error=str(e))
+                    error.data = data
+                    raise error
+            data[column] = value
+        return data, sources
+
+    def convert_batch(self, rows):
+        """
+        Cast a batch of rows column by column: the cast function of each
+        column is applied over the whole column. Returns a list of
+        (row, data, sources, error) where error is None or the CastingError
+        of the row (its first value which can't be casted, as with convert).
+        """
+        datas   = [ {} for row in rows ]
+        sources = [ {} for row in rows ]
+        errors  = [ None ] * len(rows)
+        for index, column, column_type, cast, is_source in self.casts:
+            values = sources if is_source else datas
+            for i, row in enumerate(rows):
+                # The rest of a row is ignored after its first error
+                if errors[i] is not None: continue
+                value = row[index]
+                if not value: continue
+                value = to_unicode(value)
+                if cast is not None:
+                    try:
+                        value = cast(value)
+                    except Exception as e:
+                        errors[i] = CastingError(column=column, value=value, type=column_type, error=str(e))
+                        errors[i].data = datas[i]
+                        continue
+                values[i][column] = value
+        return [
+            (row, data, None, error) if error else (row, data, source, None)
+            for row, data, source, error in zip(rows, datas, sources, errors)
+        ]
+
+# EOF
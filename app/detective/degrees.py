@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Sample of the most connected entities of a topic (see
+# summary/graph?max_nodes=N). The degree of an entity is its number of
+# relationships within the ontology, counted by the sampling query itself:
+# nothing is stored, so it can't go stale whatever wrote the graph (API,
+# admin, neo4django...) and the sample never writes on a GET.
+# -----------------------------------------------------------------------------
+from neo4django.db            import connection
+from app.detective.rows       import row_class
+from app.detective.utils      import get_relationship_types, topic_cache
+
+# Largest sample of summary/graph
+MAX_SAMPLE = 1000
+
+# Same shape as the leafs of get_leafs_and_edges
+Leaf = row_class(("_id", "_type", "name"))
+
+def relations_list(topic):
+    return ", ".join("'%s'" % relation for relation in sorted(get_relationship_types(topic)))
+
+def topic_leafs(topic):
+    """ Cypher clauses selecting every entity of the topic as `leaf` """
+    return """
+        START root=node(0)
+        MATCH root-[:`<<TYPE>>`]->(type)-[:`<<INSTANCE>>`]->(leaf)
+        WHERE type.app_label = '{app_label}'
+        AND not(has(leaf._relationship))
+    """.format(app_label=topic.app_label())
+
+def compute_sample(topic, max_nodes):
+    """
+    The `max_nodes` most connected entities of the topic, the edges among
+    them and the number of entities left out by type.
+    """
+    models    = set(model.__name__.lower() for model in topic.get_models())
+    relations = relations_list(topic)
+    leafs     = {}
+    # Entities without relationships are never sampled
+    if relations:
+        query = """
+            {start}
+            WITH leaf, type
+            MATCH (leaf)-[r]-()
+            WHERE type(r) IN [{relations}]
+            RETURN ID(leaf) as id, leaf.name? as name, type.model_name as model_name, count(r) as degree
+            ORDER BY degree DESC, id
+            LIMIT {limit}
+        """.format(start=topic_leafs(topic), relations=relations, limit=int(max_nodes))
+        for row in connection.cypher(query).to_dicts():
+            if row["model_name"].lower() in models:
+                leafs[row["id"]] = Leaf(_id=row["id"], _type=row["model_name"], name=row["name"])
+    # Number of entities by type
+    query = """
+        {start}
+        RETURN type.model_name as model_name, count(leaf) as count
+    """.format(start=topic_leafs(topic))
+    omitted = dict( (row["model_name"], row["count"]) for row in connection.cypher(query).to_dicts()
+                    if row["model_name"].lower() in models )
+    for leaf in leafs.values():
+        omitted[leaf._type] -= 1
+    edges = []
+    if leafs:
+        ids   = ",".join(map(str, leafs.keys()))
+        query = """
+            START A=node({ids})
+            MATCH (A)-[rel]->(B)
+            WHERE type(rel) IN [{relations}]
+            AND ID(B) IN [{ids}]
+            RETURN ID(A) as head, type(rel) as relation, ID(B) as tail
+        """.format(ids=ids, relations=relations)
+        edges = [ [row["head"], row["relation"], row["tail"]] for row in connection.cypher(query).to_dicts() ]
+    return leafs, edges, omitted
+
+def get_sample(topic, max_nodes):
+    max_nodes = min(max(int(max_nodes), 1), MAX_SAMPLE)
+    return topic_cache.get_or_compute(topic, "graph_sample_%d" % max_nodes, compute_sample,
+                                      args=(topic, max_nodes),
+                                      tags=lambda: topic_cache.topic_tags(topic))
+
+# EOF
@@ -1,4 +1,7 @@
 # images & file exceptions
 class UnavailableImage(Exception): pass
 class NotAnImage(Exception): pass
-class OversizedFile(Exception): pass
\ No newline at end of file
+class OversizedFile(Exception): pass
+
+# cache exceptions
+class ComputingElsewhere(Exception): pass
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Explore the neighborhood of a node step by step: a breadth-first expansion
+# bounded by hop, by node (fan-out) and in total, so a call on a hub takes the
+# same time as a call on any node. The nodes left to explore come with a
+# cursor to expand them in the next call: the neighbors are ordered by
+# relationship id and a cursor holds the last one explored.
+# -----------------------------------------------------------------------------
+from django.core           import signing
+from neo4django.db         import connection
+from app.detective.neomatch import get_pool
+from app.detective.rows    import row_class
+from app.detective.utils   import get_relationship_types
+
+MAX_DEPTH      = 3
+MAX_FANOUT     = 100
+MAX_NODES      = 500
+DEFAULT_DEPTH  = 2
+DEFAULT_FANOUT = 20
+DEFAULT_NODES  = 100
+CURSOR_SALT    = "app.detective.expansion"
+
+# Same shape as the leafs of get_leafs_and_edges
+Leaf = row_class(("_id", "_type", "name"))
+
+def make_cursor(node_id, after=-1):
+    """ Token to expand the given node from its relationship after `after` """
+    return signing.dumps([node_id, after], salt=CURSOR_SALT)
+
+def read_cursor(cursor):
+    """ Returns the node id and the last relationship of the given cursor or raises ValueError """
+    try:
+        node_id, after = signing.loads(cursor, salt=CURSOR_SALT)
+        return int(node_id), int(after)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+def get_leaf(topic, node_id):
+    """ Returns the given node as a leaf, or None if it isn't an entity of the topic """
+    query = """
+        START root=node({root})
+        MATCH (root)<-[:`<<INSTANCE>>`]-(type)
+        WHERE type.app_label = '{app_label}'
+        RETURN ID(root) as id, root.name? as name, type.model_name as model_name
+    """.format(root=int(node_id), app_label=topic.app_label())
+    try:
+        rows = connection.cypher(query).to_dicts()
+    except Exception:
+        # The node doesn't exist
+        return None
+    if not rows: return None
+    return Leaf(_id=rows[0]["id"], _type=rows[0]["model_name"], name=rows[0]["name"])
+
+def get_neighbors(topic, node_id, relations, after, limit):
+    """ At most `limit` neighbors of the given node, through relationships after `after` """
+    query = """
+        START n=node({node})
+        MATCH (n)-[r]-(m)<-[:`<<INSTANCE>>`]-(type)
+        WHERE type.app_label = '{app_label}'
+        AND type(r) IN [{relations}]
+        AND not(has(m._relationship))
+        AND ID(r) > {after}
+        RETURN ID(r) as rel, ID(startNode(r)) as head, type(r) as relation, ID(m) as id, m.name? as name, type.model_name as model_name
+        ORDER BY rel
+        LIMIT {limit}
+    """.format(
+        node      = int(node_id),
+        app_label = topic.app_label(),
+        relations = ", ".join("'%s'" % relation for relation in relations),
+        after     = int(after),
+        limit     = int(limit)
+    )
+    return connection.cypher(query).to_dicts()
+
+def expand(topic, root, depth=DEFAULT_DEPTH, fanout=DEFAULT_FANOUT, max_nodes=DEFAULT_NODES, after=-1):
+    """
+    Expand the neighborhood of the given root leaf hop by hop, up to `depth`
+    hops, `fanout` neighbors by node and `max_nodes` nodes. The neighbors of
+    the root start after its relationship `after`.
+    Returns a tuple (leafs by id, edges, cursors by id of the nodes which
+    have neighbors left to explore).
+    """
+    relations = sorted(get_relationship_types(topic))
+    models    = set(model.__name__.lower() for model in topic.get_models())
+    leafs     = { root._id: root }
+    edges     = set()
+    cursors   = {}
+    frontier  = [ (root._id, after) ] if relations else []
+    for hop in range(depth):
+        if not frontier: break
+        # One more neighbor tells if there are others left
+        query   = lambda (node_id, node_after): get_neighbors(topic, node_id, relations, node_after, fanout + 1)
+        results = get_pool().map(query, frontier) if len(frontier) > 1 else map(query, frontier)
+        expanded = []
+        for (node_id, node_after), rows in zip(frontier, results):
+            if len(leafs) >= max_nodes:
+                # Not explored at all
+                cursors[node_id] = make_cursor(node_id, node_after)
+                continue
+            if len(rows) > fanout:
+                rows = rows[:fanout]
+                cursors[node_id] = make_cursor(node_id, rows[-1]["rel"])
+            for index, row in enumerate(rows):
+                if row["model_name"].lower() not in models: continue
+                if row["id"] not in leafs:
+                    if len(leafs) >= max_nodes:
+                        last = rows[index - 1]["rel"] if index else node_after
+                        cursors[node_id] = make_cursor(node_id, last)
+                        break
+                    leafs[row["id"]] = Leaf(_id=row["id"], _type=row["model_name"], name=row["name"])
+                    expanded.append( (row["id"], -1) )
+                tail = row["id"] if row["head"] == node_id else node_id
+                edges.add( (row["head"], row["relation"], tail) )
+        frontier = expanded
+    # The nodes reached by the last hop haven't been expanded
+    for node_id, node_after in frontier:
+        cursors.setdefault(node_id, make_cursor(node_id, node_after))
+    return leafs, [ list(edge) for edge in sorted(edges) ], cursors
+
+# EOF
@@ -1,17 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from app.detective                      import graph
-from app.detective.neomatch             import Neomatch
+from app.detective                      import expansion, graph
+from app.detective.neomatch             import Neomatch, query_all
 from app.detective.sustainability       import dummy_model_to_ressource
+from app.detective.validators           import get_model_validator
 from app.detective.utils                import import_class, get_model_topic, \
                                                 get_leafs_and_edges, get_topic_from_request, \
                                                 iterate_model_fields, topic_cache, \
-                                                download_url, \
-                                                get_image, is_local
+                                                is_local
 from app.detective.topics.common.models import FieldSource
 from app.detective.topics.common.user   import UserNestedResource
+from app.detective.thumbnails           import get_thumbnails
+from app.detective                      import media
+from app.detective.rows                 import to_simple
 from app.detective.models               import Topic
-from app.detective.exceptions           import UnavailableImage, NotAnImage, OversizedFile
+from app.middleware.cache               import volatile_response, private_response
 from app.detective.paginator            import resource_paginator
 from django                             import forms
 from django.conf                        import settings
@@ -26,7 +29,7 @@ from neo4jrestclient                    import client
 from neo4django.db                      import connection
 from neo4django.db.models               import NodeModel
 from neo4django.db.models.relationships import MultipleNodes
-from tastypie                           import fields
+from tastypie                           import fields, http
 from tastypie.authentication            import Authentication, SessionAuthentication, BasicAuthentication, MultiAuthentication
 from tastypie.authorization             import DjangoAuthorization
 from tastypie.constants                 import ALL
@@ -34,13 +37,10 @@ from tastypie.exceptions                import Unauthorized
 from tastypie.resources                 import ModelResource
 from tastypie.serializers               import Serializer
 from tastypie.utils                     import trailing_slash
-from easy_thumbnails.exceptions         import InvalidImageFormatError
-from easy_thumbnails.files              import get_thumbnailer
 
 import json
 import re
 import logging
-import bleach
 import os
 
 logger = logging.getLogger(__name__)
@@ -142,6 +142,8 @@ class IndividualResource(ModelResource):
             if field_object.use_in == 'detail':
                 # We use a custom method
                 field_object.use_in = self.use_in
+        # In paged detail mode, the sources are paged with the related nodes
+        self.fields["field_sources"].use_in = lambda bundle=None: self.use_in(bundle) and "rel_limit" not in bundle.request.GET
 
     def prepend_urls(self):
         params = (self._meta.resource_name, trailing_slash())
@@ -153,7 +155,10 @@ class IndividualResource(ModelResource):
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/patch/sources/(?P<source_pk>[0-9]*)%s$" % params, self.wrap_view('get_patch_source'), name="api_get_patch_source"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/authors%s$" % params, self.wrap_view('get_authors'), name="api_get_authors"),
             url(r"^(?P<resource_name>%s)/bulk_upload%s$" % params, self.wrap_view('bulk_upload'), name="api_bulk_upload"),
+            url(r"^(?P<resource_name>%s)/batch%s$" % params, self.wrap_view('get_batch'), name="api_get_batch"),
+            url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/graph/expand%s$" % params, self.wrap_view('get_graph_expand'), name="api_get_graph_expand"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/graph%s$" % params, self.wrap_view('get_graph'), name="api_get_graph"),
+            url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/related/(?P<field>\w[\w-]*)%s$" % params, self.wrap_view('get_related'), name="api_get_related"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/relationships%s$" % params, self.wrap_view('get_relationships'), name="api_get_relationships"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/relationships/(?P<field>\w[\w-]*)%s$" % params, self.wrap_view('get_relationships'), name="api_get_relationships_field"),
             url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/relationships/(?P<field>\w[\w-]*)/(?P<end>\w[\w-]*)%s$" % params, self.wrap_view('get_relationships'), name="api_get_relationships_field_end"),
@@ -214,16 +219,11 @@ class IndividualResource(ModelResource):
             # Find fields of the queryset's model
             return model._meta.fields
         else:
-            fields = [f for f in model._meta.fields if f.name == name]
-            return fields[0] if len(fields) else None
+            return get_model_validator(model).fields.get(name, None)
 
     def get_model_field(self, name, model=None):
         if model is None: model = self.get_model()
-        target = None
-        for field in self.get_model_fields(model=model):
-            if field.name == name:
-                target = field
-        return target
+        return get_model_validator(model).fields.get(name, None)
 
     def need_to_many_field(self, field):
         # Limit the definition of the new fields
@@ -267,6 +267,7 @@ class IndividualResource(ModelResource):
 
 
     def dehydrate(self, bundle):
+        from app.detective.topics.common.jobs import enqueue_image_ingestion, get_image_ingestion_status
         # Get the request from the bundle
         request = bundle.request
         # Show additional field following the model's rules
@@ -287,58 +288,45 @@ class IndividualResource(ModelResource):
         for field in bundle.data:
             # Image field
             if field == 'image' and self.use_in(bundle):
-                # Get thumbnails
-                try:
-                    url_or_path = bundle.data[field]
-                    # Remove host for local url
-                    if is_local(request, url_or_path or ''):
-                        # By removing the host, we'll force django
-                        # to read the file instead of downloading it
-                        url_or_path = url_or_path.split( request.get_host() )[1]
-                        url_or_path = url_or_path.replace(settings.MEDIA_URL, '/')
-                    try:
-                        #  Use a file instance and download external only
-                        #  on detail view (to avoid heavy loading)
-                        image = get_image(url_or_path, download_external=self.use_in(bundle))
-                    # The given url is not a valid image
-                    except (NotAnImage, OversizedFile):
-                        # Save the new URL to avoid reloading it
-                        setattr(bundle.obj, field, None)
-                        bundle.obj.save()
+                # The image may be downloaded by a job
+                status = get_image_ingestion_status(bundle.obj.id)
+                if status and status["field"] == field:
+                    to_add[field + '_status'] = status["status"]
+                    # Wait for the job to display the image
+                    if status["status"] in ("pending", "downloading"):
+                        volatile_response(bundle.request)
                         continue
-                    # The image might be temporary unvailable
-                    except UnavailableImage: continue
-                    # Skip none value
-                    if image is None: continue
-                    # Build the media url using the request
-                    media_url = request.build_absolute_uri(settings.MEDIA_URL)
-                    # Extract public name
-                    public_name = lambda i: os.path.join(media_url,  i.replace(settings.MEDIA_ROOT, '').strip('/') )
-                    # Return the public url
-                    bundle.data[field] = public_name(image.name)
-                    # The image url changed...
-                    if getattr(bundle.obj, field) != public_name(image.name):
-                        # Save the new URL to avoid reloading it
-                        setattr(bundle.obj, field, public_name(image.name))
-                        bundle.obj.save()
-                    # Create thumbnailer with the file
-                    thumbnailer = get_thumbnailer(image.name)
-
-                    to_add[field + '_thumbnail'] = {
-                        key : public_name(thumbnailer.get_thumbnail({
-                            'size': size,
-                            'crop': True
-                        }).name)
-                        for key, size in settings.THUMBNAIL_SIZES.items()
-                    }
-                except InvalidImageFormatError:
+                url = bundle.data[field]
+                # Skip none value
+                if not url: continue
+                # Build the media url using the request
+                media_url = request.build_absolute_uri(settings.MEDIA_URL)
+                # Find the name of the image within the storage
+                if url.startswith(media_url):
+                    name = url[len(media_url):]
+                elif is_local(request, url):
+                    name = url.split( request.get_host() )[1].replace(settings.MEDIA_URL, '/').strip('/')
+                else:
+                    # This image was never downloaded (ie: from a bulk upload)
+                    if not status:
+                        enqueue_image_ingestion(request.current_topic, bundle.obj.id, field, url, media_url)
+                        to_add[field + '_status'] = "pending"
+                        volatile_response(bundle.request)
+                    continue
+                # Thumbnails are generated by a worker
+                thumbnails = get_thumbnails(name)
+                # They aren't available yet
+                if thumbnails is None:
+                    volatile_response(bundle.request)
+                    continue
+                # The image isn't valid
+                if not thumbnails:
                     to_add[field + '_thumbnail'] = ''
-                # Ignore missing image error
-                except IOError:
-                    to_add[field] = ''
-                    # Removes unusable image
-                    setattr(bundle.obj, field, None)
-                    bundle.obj.save()
+                    continue
+                to_add[field + '_thumbnail'] = {
+                    key : os.path.join(media_url, thumbnail.strip('/'))
+                    for key, thumbnail in thumbnails.items()
+                }
 
             # Convert tuple to array for better serialization
             if type( getattr(bundle.obj, field, None) ) is tuple:
@@ -387,8 +375,8 @@ class IndividualResource(ModelResource):
         # Create an object to build the bundle
         obj = node.properties
         obj["id"] = node.id
-        # update the cache
-        topic_cache.incr_version(request.current_topic)
+        # invalidate the values depending on the instances of this model
+        topic_cache.invalidate(request.current_topic, [ topic_cache.model_tag(model) ])
         # Return a new bundle
         return self.build_bundle(obj=model._neo4j_instance(node), data=obj, request=request)
 
@@ -404,28 +392,137 @@ class IndividualResource(ModelResource):
         return model._neo4j_instance( node )
 
     def get_detail(self, request, **kwargs):
+        # Only the first related nodes of each field may be asked
+        rel_limit = request.GET.get("rel_limit", None)
+        try:
+            rel_limit = max(int(rel_limit), 1) if rel_limit is not None else None
+        except ValueError:
+            return self.error_response(request, {"errors": "rel_limit must be an integer."}, response_class=http.HttpBadRequest)
         basic_bundle = self.build_bundle(request=request)
         kwargs["bundle"] = basic_bundle
         obj    = self.obj_get(**kwargs)
         bundle = self.build_bundle(obj=obj, request=request)
         bundle = self.full_dehydrate(bundle)
-        bundle = self.alter_detail_data_to_serialize(request, bundle, True)
+        bundle = self.alter_detail_data_to_serialize(request, bundle, True, rel_limit=rel_limit)
         return self.create_response(request, bundle)
 
-    def alter_detail_data_to_serialize(self, request, bundle, nested=False):
+    def alter_detail_data_to_serialize(self, request, bundle, nested=False, rel_limit=None):
         model = self.get_model()
         # Get relationships fields
-        fields = [ f for f in model._meta.fields if f.get_internal_type() == 'Relationship']
-        node_rels = bundle.obj.node.relationships.all()
-        # If the nested parameter is True, this set
-        node_to_retreive = set()
-        # Resolve relationships manualy
+        fields = self.get_relationship_fields(model)
+        # Ids of the related nodes by field
+        related_ids = self.get_related_ids(bundle.obj, model)
+        # Paged mode: only the first related nodes of each field are returned
+        if rel_limit is not None:
+            bundle.data["_relationships"] = {}
         for field in fields:
+            ids = related_ids[field.name]
+            if rel_limit is not None:
+                ids = sorted(ids)
+                bundle.data["_relationships"][field.name] = {
+                    "count": len(ids),
+                    # Cursor to get the next related nodes (see get_related)
+                    "next" : rel_limit if len(ids) > rel_limit else None
+                }
+                ids = ids[:rel_limit]
+            # Save the list into properities
+            bundle.data[field.name] = ids
+        # Nested mode to true: we need to retreive every node
+        if nested:
+            # Ids of the nodes to retreive for each target model
+            node_to_retreive = {}
+            for field in fields:
+                if bundle.data[field.name]:
+                    node_to_retreive.setdefault(self.get_target_model(field), set()).update(bundle.data[field.name])
+            # Get the nodes of every target model with only their
+            # fields, indexed by id
+            nodes = {}
+            for target_model, ids in node_to_retreive.items():
+                nodes[target_model] = self.get_nodes_properties(target_model, ids)
+            # Populate the relationships field with there node instance
+            for field in fields:
+                target_model = self.get_target_model(field)
+                bundle.data[field.name] = self.validate_related_nodes(target_model, bundle.data[field.name], nodes.get(target_model, {}))
+        # Show additional field following the model's rules
+        rules = request.current_topic.get_rules().model(self.get_model()).all()
+        # Filter rules to keep only Neomatch instance.
+        # Neomatch is a class to create programmaticly a search related to
+        # this node.
+        neomatches = dict( (key, rule) for key, rule in rules.items() if isinstance(rule, Neomatch) )
+        # All additional relationships
+        bundle.data.update( self.query_neomatches(request.current_topic, neomatches, bundle.obj.id) )
+        return bundle
+
+    def query_neomatches(self, topic, neomatches, root):
+        """
+        Returns the results of the given Neomatch rules for the given node.
+        Results are cached until the topic changes and the missing ones are
+        queried concurrently.
+        """
+        results   = {}
+        misses    = {}
+        cache_key = lambda key: "neomatch_%s_%s_%s" % (self.get_model().__name__, key, root)
+        cached    = topic_cache.get_many(topic, [ cache_key(key) for key in neomatches ])
+        for key, rule in neomatches.items():
+            result = cached.get(cache_key(key), None)
+            if result is None: misses[key] = rule
+            else: results[key] = result
+        if misses:
+            for key, result in query_all(misses, root).items():
+                topic_cache.set(topic, cache_key(key), result, tags=self.get_neomatch_tags(topic, misses[key]))
+                results[key] = result
+        return results
+
+    def get_neomatch_tags(self, topic, neomatch):
+        """ Cache tags of the result of the given Neomatch rule """
+        rel_types = neomatch.relationship_types()
+        # The rule may follow any relationship
+        if rel_types is None: return topic_cache.topic_tags(topic)
+        # The names of the results come from the target model
+        target = neomatch.target_model
+        if isinstance(target, basestring): target = target.split(".")[-1]
+        return [ topic_cache.model_tag(target) ] + [ topic_cache.relationship_tag(t) for t in rel_types ]
+
+    def get_cache_tags(self, pk, data):
+        """ Cache tags to invalidate when the given data is set to the given entity """
+        tags = [ topic_cache.entity_tag(pk) ]
+        for field_name in data:
+            field = self.get_model_field(field_name)
+            if field is None: continue
+            if field.get_internal_type() == 'Relationship':
+                tags.append( topic_cache.relationship_tag(field._type) )
+            else:
+                # Literal values (ie: the name) can be read for any entity of the model
+                tags.append( topic_cache.model_tag(self.get_model()) )
+        return tags
+
+    def get_relationship_fields(self, model=None):
+        if model is None: model = self.get_model()
+        return [ f for f in model._meta.fields if f.get_internal_type() == 'Relationship']
+
+    def get_related_ids(self, obj, model=None):
+        """
+        Returns a dictionary of field name -> ids of the nodes related to
+        `obj` through this field.
+        """
+        if model is None: model = self.get_model()
+        # Group the relationships by type in one pass
+        rels_by_type = {}
+        for rel in obj.node.relationships.all():
+            rels_by_type.setdefault(rel.type, []).append(rel)
+        # Index the fields informations by relationship type and name
+        related_fields = {}
+        for f in iterate_model_fields(model):
+            if f.get("rel_type") and "name" in f:
+                related_fields.setdefault((f["rel_type"], f["name"]), []).append(f)
+        related_ids = {}
+        # Resolve relationships manualy
+        for field in self.get_relationship_fields(model):
             # Get relationships for this fields
-            field_rels = [ rel for rel in node_rels[:] if rel.type == field._type]
+            field_rels = rels_by_type.get(field._type, [])
             # Filter relationships to keep only the well oriented relationships
             # get the related field informations
-            related_field = [f for f in iterate_model_fields(model) if "rel_type" in f and f["rel_type"] == field._type and "name" in f and f["name"] == field._BoundRelationship__attname]
+            related_field = related_fields.get((field._type, field._BoundRelationship__attname), None)
             if related_field:
                 # Note (edouard): check some assertions in case I forgot something
                 assert len(related_field) == 1, related_field
@@ -433,40 +530,113 @@ class IndividualResource(ModelResource):
                 # choose the end point to check
                 end_point_side = "start" if related_field[0]["direction"] == "out" else "end"
                 # filter the relationship
-                field_rels = [rel for rel in field_rels if getattr(rel, end_point_side).id == bundle.obj.id]
+                field_rels = [rel for rel in field_rels if getattr(rel, end_point_side).id == obj.id]
             # Get node ids for those relationships
-            field_oposites = [ graph.opposite(rel, bundle.obj.id) for rel in field_rels ]
-            # Save the list into properities
-            bundle.data[field.name] = field_oposites
-            # Nested mode to true: we need to retreive every node
-            if nested: node_to_retreive = set(list(node_to_retreive) + field_oposites)
-        # There is node to extract for the graph
-        if len(node_to_retreive):
-            # Build the query to get all node in one request
-            query = "start n=node(%s) RETURN ID(n), n" % ",".join(map(str, node_to_retreive))
-            # Get all nodes as raw values to avoid unintended request to the graph
-            nodes = connection.query(query, returns=(int, dict))
-            # Helper lambda to retreive a node
-            retreive_node = lambda idx: next(n[1]["data"] for n in nodes if n[0] == idx)
-            # Populate the relationships field with there node instance
-            for field in fields:
-                # Retreive the list of ids
-                for i, idx in enumerate(bundle.data[field.name]):
-                    rel_node = retreive_node(idx)
-                    # Save the id which is not a node property
-                    rel_node["id"] = idx
-                    # Update value
-                    bundle.data[field.name][i] = self.validate(rel_node, field.target_model, allow_missing=True)
-        # Show additional field following the model's rules
-        rules = request.current_topic.get_rules().model(self.get_model()).all()
-        # All additional relationships
-        for key in rules:
-            # Filter rules to keep only Neomatch instance.
-            # Neomatch is a class to create programmaticly a search related to
-            # this node.
-            if isinstance(rules[key], Neomatch):
-                bundle.data[key] = rules[key].query(bundle.obj.id)
-        return bundle
+            related_ids[field.name] = [ graph.opposite(rel, obj.id) for rel in field_rels ]
+        return related_ids
+
+    def get_related_page(self, obj, field, offset, limit, model=None):
+        """
+        Returns the number of nodes related to `obj` through the given field
+        and the ids of the ones within the given page (ordered by id).
+        """
+        if model is None: model = self.get_model()
+        # Only the well oriented relationships (see get_related_ids)
+        direction = None
+        for f in iterate_model_fields(model):
+            if f.get("rel_type") == field._type and f.get("name") == field._BoundRelationship__attname:
+                direction = f["direction"]
+        patterns = { "out": "(n)-[:`{0}`]->(m)", "in": "(n)<-[:`{0}`]-(m)" }
+        pattern  = patterns.get(direction, "(n)-[:`{0}`]-(m)").format(field._type)
+        query = """
+            START n=node({id})
+            MATCH {pattern}
+        """.format(id=int(obj.id), pattern=pattern)
+        count = connection.cypher(query + "RETURN count(m) as count").to_dicts()[0]["count"]
+        page  = "RETURN ID(m) as id ORDER BY id SKIP {0} LIMIT {1}".format(int(offset), int(limit))
+        ids   = [ row["id"] for row in connection.cypher(query + page).to_dicts() ] if count > offset else []
+        return count, ids
+
+    def validate_related_nodes(self, target_model, ids, nodes):
+        """ Returns the properties of the given nodes (validated) in the order of `ids` """
+        related = []
+        for idx in ids:
+            rel_node = nodes[idx]
+            # Save the id which is not a node property
+            rel_node["id"] = idx
+            related.append( self.validate(rel_node, target_model, allow_missing=True) )
+        return related
+
+    def get_related(self, request, **kwargs):
+        """
+        Page through the related nodes of one field (or through the sources
+        of the entity with the field `field_sources`).
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        bundle = self.build_bundle(request=request)
+        # User allowed to read this model
+        self.authorized_read_detail(self.get_object_list(bundle.request), bundle)
+        try:
+            offset = max(int(request.GET.get("offset", 0)), 0)
+            limit  = max(int(request.GET.get("limit", 20)), 1)
+        except ValueError:
+            return self.error_response(request, {"errors": "offset and limit must be integers."}, response_class=http.HttpBadRequest)
+        model = self.get_model()
+        # The node must be an instance of this model
+        try: node = self.get_instances(model, [int(kwargs["pk"])]).get(int(kwargs["pk"]), None)
+        except ValueError: node = None
+        if node is None: raise Http404("Not found.")
+        obj = model._neo4j_instance(node)
+        if kwargs["field"] == "field_sources":
+            sources = sorted(FieldSource.objects.filter(individual=obj.id), key=lambda source: source.id)
+            count   = len(sources)
+            resource = FieldSourceResource()
+            objects  = [
+                resource.full_dehydrate(resource.build_bundle(obj=source, request=request), for_list=True)
+                for source in sources[offset:offset + limit]
+            ]
+        else:
+            fields = dict( (f.name, f) for f in self.get_relationship_fields() )
+            if kwargs["field"] not in fields: raise Http404("Unkown relationship field.")
+            field        = fields[kwargs["field"]]
+            target_model = self.get_target_model(field)
+            count, ids   = self.get_related_page(obj, field, offset, limit)
+            nodes        = self.get_nodes_properties(target_model, ids) if ids else {}
+            objects      = self.validate_related_nodes(target_model, ids, nodes)
+        self.log_throttled_access(request)
+        return self.create_response(request, {
+            "objects": objects,
+            "meta": {
+                "count" : count,
+                "offset": offset,
+                "limit" : limit,
+                "next"  : offset + limit if offset + limit < count else None
+            }
+        })
+
+    def get_target_model(self, field):
+        if type(field.target_model) == str:
+            return import_class(field.target_model)
+        return field.target_model
+
+    def get_nodes_properties(self, model, ids):
+        """
+        Returns a dictionary of node id -> properties for the given nodes,
+        fetching only the literal fields of the given model.
+        """
+        names = [ name for name, f in get_model_validator(model).fields.items() if hasattr(f, "_property") and name != "id" ]
+        query = "START n=node({ids}) RETURN ID(n) as id{properties}".format(
+            ids=",".join(map(str, ids)),
+            properties="".join(", n.`{0}`? as `{0}`".format(name) for name in names)
+        )
+        nodes = {}
+        for row in connection.cypher(query).to_dicts():
+            idx = row.pop("id")
+            # Missing properties are not returned
+            nodes[idx] = dict((k, v) for k, v in row.items() if v is not None)
+        return nodes
 
     def get_search(self, request, **kwargs):
         self.method_check(request, allowed=['get'])
@@ -496,6 +666,7 @@ class IndividualResource(ModelResource):
     def get_mine(self, request, **kwargs):
         self.method_check(request, allowed=['get'])
         self.throttle_check(request)
+        private_response(request)
 
         limit = int(request.GET.get('limit', 20))
 
@@ -529,30 +700,28 @@ class IndividualResource(ModelResource):
 
     def convert(self, properties, model=None):
         if model is None: model = self.get_model()
-        validate = False
-        # Iterate until the whole properties object validates
-        while not validate:
-            try:
-                self.validate(properties, model=model)
-                validate = True
-            except ValidationError as e:
-                # Convert each key
-                for key in e.message_dict.keys():
-                    value = self.convert_field(key, properties[key], model=model)
-                    # Skip unconvertible values
-                    if value is None: del properties[key]
-                    # Save the value
-                    else: properties[key] = value
+        validator = get_model_validator(model)
+        # Every invalid key is found in one pass
+        cleaned_data, errors = validator.clean(properties)
+        for key in errors:
+            value = self.convert_field(key, properties[key], model=model)
+            # Skip unconvertible values
+            if value is None: del properties[key]
+            # Save the value
+            else: properties[key] = value
+        if errors:
+            # Remove the values which still don't validate once converted
+            cleaned_data, errors = validator.clean(properties)
+            for key in errors: del properties[key]
         return properties
 
     def convert_field(self, name, value, model=None):
         if model is None: model = self.get_model()
+        validator = get_model_validator(model)
         # Find the model's field
-        field = self.get_model_field(name, model)
+        field = validator.fields[name]
         # Find the field type
         fieldtype = field._property.get_internal_type()
-        # Get the field widget
-        formfield = field._property.formfield()
         # Choose the best way to convert
         try:
             if fieldtype == 'BooleanField':
@@ -562,99 +731,22 @@ class IndividualResource(ModelResource):
             elif fieldtype == 'DateTimeField':
                 return forms.DateTimeField().clean(value)
             else:
-                return formfield.clean(value)
+                return validator.formfield(name).clean(value)
         # Wrong convettion result to a None value
         except (ValueError, TypeError, ValidationError):
             return None
 
     def validate(self, data, model=None, allow_missing=False):
         if model is None: model = self.get_model()
-        cleaned_data = {}
-        for field_name in data:
-            field = self.get_model_field(field_name, model)
-            if field is not None:
-                # Boolean field must be validate manually
-                if field.get_internal_type() == 'BooleanField':
-                    if type(data[field_name]) is not bool:
-                        raise ValidationError({field_name: 'Must be a boolean value'})
-                        if not allow_missing:
-                            raise ValidationError({field_name: 'Must be a boolean value'})
-                        # Skip this field
-                        else: continue
-                    cleaned_data[field_name] = data[field_name]
-                # DateTime field must be validate manually
-                elif field.get_internal_type() == 'DateTimeField':
-                    # Create a native datetimefield
-                    formfield = forms.DateTimeField(input_formats=settings.DATETIME_FORMATS, required=False)
-                    try:
-                        # Validate and clean the data
-                        cleaned_data[field_name] = formfield.clean(data[field_name])
-                    except ValidationError as e:
-                        # Raise the same error the field name as key
-                        if not allow_missing: raise ValidationError({field_name: 'Must be a valid date/time'})
-                        # Skip this field
-                        else: continue
-                # Only literal values have a _property attribute
-                elif hasattr(field, "_property"):
-                    try:
-                        try:
-                            # Get a single field validator
-                            formfield = field._property.formfield()
-                            # Validate and clean data
-                            cleaned_data[field_name] = formfield.clean(data[field_name])
-                        except TypeError:
-                            validators = getattr(field._property, "validators", [])
-                            # This field has several validators
-                            for validator in field._property.validators:
-                                # Process validation with every validator
-                                validator(data[field_name])
-                            # @warning: this will validate the data for
-                            # array of values but not clean them
-                            cleaned_data[field_name] = data[field_name]
-                    except ValidationError as e:
-                        # Raise the same error the field name as key
-                        if not allow_missing: raise ValidationError({field_name: e.messages})
-                # The given value is a relationship
-                elif hasattr(field, "target_model") and type(data[field_name]) is list:
-                    # The validation method will collect targets ID
-                    cleaned_data[field_name] = []
-                    # Relationships can be added using to ways:
-                    # * a list of numeric id
-                    # * a list of objects containing an id key (final formatspec)
-                    for rel in data[field_name]:
-                        # Common error message
-                        error = "Bad relationship value"
-                        # Evaluate the relation as a string:
-                        if type(rel) is str:
-                            # it must be a numeric value
-                            if rel.isnumeric():
-                                # We can add the value to the list.
-                                # We take care of casting it to integer.
-                                cleaned_data[field_name].append( int(rel) )
-                            elif not allow_missing:
-                                raise ValidationError({field_name: error})
-                        # This is an integer, we're just passing
-                        elif type(rel) is int:
-                            # We can add the value to the list
-                            cleaned_data[field_name].append(rel)
-                        # This is an object
-                        elif type(rel) is dict:
-                            # The given object as no ID
-                            if "id" not in rel:
-                                raise ValidationError({field_name: error})
-                            elif not allow_missing:
-                                # Add and cast the value
-                                cleaned_data[field_name].append( int(rel["id"]) )
-                # Treat id
-                elif field.name == "id": cleaned_data[field_name] = int(data[field_name])
-
-        return cleaned_data
+        # Raises a ValidationError with every invalid field
+        return get_model_validator(model).validate(data, allow_missing=allow_missing)
 
 
     def obj_delete(self, bundle, **kwargs):
         super(IndividualResource, self).obj_delete(bundle, **kwargs)
-        # update the cache
-        topic_cache.incr_version(bundle.request.current_topic)
+        # invalidate the values depending on this entity or its relationships
+        tags = topic_cache.entity_tags(self.get_model(), kwargs.get("pk"))
+        topic_cache.invalidate(bundle.request.current_topic, tags)
 
     def get_patch(self, request, **kwargs):
         pk = kwargs["pk"]
@@ -670,8 +762,6 @@ class IndividualResource(ModelResource):
         try: node = connection.nodes.get(pk)
         # Node not found
         except client.NotFoundError: raise Http404("Not found.")
-        # Load every relationship only when we need to update a relationship
-        node_rels = None
         # Parse only body string
         body = json.loads(request.body) if type(request.body) is str else request.body
         # Copy data to allow dictionary resizing
@@ -683,125 +773,263 @@ class IndividualResource(ModelResource):
         # Validate data.
         # If it fails, it will raise a ValidationError
         data = self.validate(data)
-        # Get author list (or a new array if )
-        author_list = node.properties.get("_author", [])
-        # This is the first time the current user edit this node
-        if int(request.user.id) not in author_list:
-            # Add the author to the author list
-            data["_author"] = author_list + [request.user.id]
-        # @TODO check that 'node' is an instance of 'model'
-        # Set new values to the node
-        for field_name in data:
-            field       = self.get_model_field(field_name)
-            field_value = data[field_name]
-            # The value can be a list of ID for relationship
-            if field.get_internal_type() is 'Relationship':
-                # Pluck id from the list
-                field_ids = [ value for value in field_value if value is not int(pk) ]
-                # Prefetch all relationship
-                if node_rels is None: node_rels = node.relationships.all()
-                # Get relationship name
-                rel_type = self.get_model_field(field_name)._type
-                # We don't want to add this relation twice so we extract
-                # every node connected to the current one through this type
-                # of relationship. "existing_rels_id" will contain the ids of
-                # every node related to this one.
-                existing_rels = [ rel for rel in node_rels if rel.type == rel_type ]
-                existing_rels_id = [ graph.opposite(rel, pk) for rel in existing_rels ]
-                # Get every ids from "field_ids" that ain't not in
-                # the list of existing relationship "existing_rel_id".
-                new_rels_id = set(field_ids).difference(existing_rels_id)
-                # Get every ids from "existing_rels_id" that ain't no more
-                # in the new list of relationships "field_ids".
-                old_rels_id = set(existing_rels_id).difference(field_ids)
-                # Start a transaction to batch import values
-                with connection.transaction(commit=False) as tx:
-                    # Convert ids or related node to *node* instances
-                    new_rels_node = [ connection.nodes.get(idx) for idx in new_rels_id ]
-                    # Convert ids or unrelated node to *relationships* instances
-                    old_rels    = []
-                    # Convert ids list into relationship instances
-                    for idx in old_rels_id:
-                        # Find the relationship that match with this id
-                        matches = [ rel for rel in existing_rels if graph.connected(rel, idx) ]
-                        # Merge the list of relationships
-                        old_rels = old_rels + matches
-                # Commit change when every field was treated
-                tx.commit()
-                # Start a transaction to batch insert/delete values
-                with connection.transaction(commit=False) as tx:
-                    # Then create the new relationships (using nodes instances)
-                    # Outcoming relationship
-                    if field.direction == 'out':
-                        [ connection.relationships.create(node, rel_type, n) for n in new_rels_node ]
-                    # Incoming relationship
-                    elif field.direction == 'in':
-                        [ connection.relationships.create(n, rel_type, node) for n in new_rels_node ]
-                    # Then delete the old relationships (using relationships instance)
-                    [ rel.delete() for rel in old_rels ]
-                # Commit change when every field was treated
-                tx.commit()
-            # Or a literal value
-            # (integer, date, url, email, etc)
-            else:
-                # Current model
-                model = self.get_model()
-                # Fields
-                fields = { x['name'] : x for x in iterate_model_fields(model) }
-                # Remove the values
-                if field_value in [None, '']:
-                    if field_name == 'image' and fields[field_name]['type'] == 'URLField':
-                        self.remove_node_file(node, field_name, True)
-                    # The field may not exists (yet)
-                    try:
-                        node.delete(field_name)
-                    # It's OK, it just means we don't have to remove it
-                    except client.NotFoundError: pass
-                # We simply update the node property
-                # (the value is already validated)
-                else:
-                    if field_name in fields:
-                        if 'is_rich' in fields[field_name]['rules'] and fields[field_name]['rules']['is_rich']:
-                            data[field_name] = field_value = bleach.clean(field_value,
-                                                                          tags=("br", "blockquote", "ul", "ol",
-                                                                                "li", "b", "i", "u", "a", "p", "div", "span"),
-                                                                          attributes={
-                                                                              '*': ("class",),
-                                                                              'a': ("href", "target")
-                                                                          })
-                        if field_name == 'image' and fields[field_name]['type'] == 'URLField':
-                            self.remove_node_file(node, field_name, True)
-                            try:
-                                # Download the image
-                                image_file = download_url(data[field_name])
-                                # New Image path
-                                path = os.path.join(settings.UPLOAD_ROOT, image_file.name)
-                                # Removed the media root
-                                path = path.replace(settings.MEDIA_ROOT, "")
-                                # Store the image
-                                path = default_storage.save(path, image_file)
-                                host = settings.MEDIA_URL
-                                # The path must start with host name
-                                if not host.startswith("http"):
-                                    # If not, we append the request URL
-                                    # because if means that we are using a local path
-                                    host = request.build_absolute_uri(settings.MEDIA_URL)
-                                # Join the path to the file and the MEDIA_URL
-                                path = "/".join([ host.strip("/"), path.strip("/") ])
-                                # Save the value
-                                data[field_name] = field_value = path
-                            except UnavailableImage:
-                                data[field_name] = field_value = ""
-                            except NotAnImage:
-                                data[field_name] = field_value = ""
-                            except OversizedFile:
-                                data[field_name] = field_value = ""
-                    node.set(field_name, field_value)
-        # update the cache
-        topic_cache.incr_version(request.current_topic)
+        # Set the new values
+        data = self.update_node(request, node, pk, data)
+        # invalidate the values depending on what changed
+        topic_cache.invalidate(request.current_topic, self.get_cache_tags(pk, data))
         # And returns cleaned data
         return self.create_response(request, data)
 
+    def get_batch(self, request, **kwargs):
+        """
+        Create and update several entities at once. The body must be a list
+        of entities: the ones with an "id" are updated, the others are created.
+        Every entity is validated before any change is made.
+        """
+        self.method_check(request, allowed=['post'])
+        self.throttle_check(request)
+        # User must be authentication
+        self.is_authenticated(request)
+        bundle = self.build_bundle(request=request)
+        # Parse only body string
+        items = json.loads(request.body) if type(request.body) is str else request.body
+        if type(items) is not list or not all(type(item) is dict for item in items):
+            return self.error_response(request, {"errors": "A list of entities is expected."}, response_class=http.HttpBadRequest)
+        # User allowed to create and update this model
+        if any("id" not in item for item in items):
+            self.authorized_create_detail(self.get_object_list(bundle.request), bundle)
+        if any("id" in item for item in items):
+            self.authorized_update_detail(self.get_object_list(bundle.request), bundle)
+        model     = self.get_model()
+        validator = get_model_validator(model)
+        to_apply  = []
+        errors    = {}
+        # Validate everything up front
+        for index, item in enumerate(items):
+            # Copy data to allow dictionary resizing
+            data = item.copy()
+            # field_sources must not be treated here, see patch_source method
+            data.pop("field_sources", None)
+            pk = data.pop("id", None)
+            cleaned_data, item_errors = validator.clean(data)
+            if pk is not None:
+                try: pk = int(pk)
+                except (TypeError, ValueError): item_errors["id"] = ["Not found."]
+            if item_errors:
+                errors[index] = item_errors
+            else:
+                to_apply.append((index, pk, cleaned_data))
+        # Resolve every id (and every related id) at once, among the
+        # instances of the expected model only
+        pks   = set( pk for index, pk, data in to_apply if pk is not None )
+        nodes = self.get_instances(model, pks)
+        related_ids = {}
+        for index, pk, data in to_apply:
+            for field_name, value in data.items():
+                field = self.get_model_field(field_name)
+                if field.get_internal_type() is 'Relationship':
+                    related_ids.setdefault(self.get_target_model(field), set()).update(value)
+        targets = {}
+        for target_model, ids in related_ids.items():
+            targets[target_model] = self.get_instances(target_model, ids)
+        for index, pk, data in to_apply:
+            item_errors = {}
+            if pk is not None and pk not in nodes:
+                item_errors["id"] = ["Not found."]
+            for field_name, value in data.items():
+                field = self.get_model_field(field_name)
+                if field.get_internal_type() is 'Relationship':
+                    unknown = [ idx for idx in value if idx not in targets[self.get_target_model(field)] ]
+                    if unknown:
+                        item_errors[field_name] = ["Unknown entities: %s." % ", ".join(map(str, unknown))]
+            if item_errors: errors[index] = item_errors
+        if errors:
+            errors = [ {"index": index, "errors": errors[index]} for index in sorted(errors) ]
+            return self.error_response(request, {"errors": errors}, response_class=http.HttpBadRequest)
+        # Create the new nodes in one transaction
+        created = set( index for index, pk, data in to_apply if pk is None )
+        # By position in the batch (not to be mixed with the nodes by id)
+        created_nodes = {}
+        if created:
+            model_node = self.get_model_node()
+            with connection.transaction(commit=False) as tx:
+                for index, pk, data in to_apply:
+                    if index not in created: continue
+                    created_nodes[index] = connection.nodes.create(name=data.get("name", None), _author=[request.user.id])
+                    # Instanciate its type
+                    connection.relationships.create(model_node, "<<INSTANCE>>", created_nodes[index])
+            tx.commit()
+        # Then set the values of every node in one transaction
+        entries = []
+        for index, pk, data in to_apply:
+            node = created_nodes[index] if index in created else nodes[pk]
+            entries.append( (node, node.id, data) )
+        targets = dict( (idx, node) for nodes_by_id in targets.values() for idx, node in nodes_by_id.items() )
+        saved   = self.update_nodes(request, entries, targets)
+        results = []
+        tags    = [ topic_cache.model_tag(model) ] if created else []
+        for position, (index, pk, data) in enumerate(to_apply):
+            pk   = entries[position][1]
+            data = saved[position]
+            tags.extend( self.get_cache_tags(pk, data) )
+            data["id"] = int(pk)
+            results.append({
+                "id"     : int(pk),
+                "status" : "created" if index in created else "updated",
+                "data"   : data
+            })
+        # invalidate the cache once for the whole batch
+        topic_cache.invalidate(request.current_topic, tags)
+        return self.create_response(request, {"objects": results})
+
+    def get_instances(self, model, ids):
+        """
+        Returns a dictionary of node id -> node for the given ids which are
+        instances of the given model, fetched in one query. Others are left out.
+        """
+        ids = [ int(idx) for idx in ids ]
+        if not ids: return {}
+        query = """
+            START type=node({type})
+            MATCH (type)-[:`<<INSTANCE>>`]->(node)
+            WHERE ID(node) IN [{ids}]
+            RETURN node
+        """.format(type=graph.get_model_node(model).id, ids=",".join(map(str, ids)))
+        return dict( (row[0].id, row[0]) for row in connection.query(query, returns=client.Node) )
+
+    def get_existing_relationships(self, ids, rel_types):
+        """
+        Returns a dictionary of (node id, relationship type) -> related node
+        id -> relationships, for the given nodes and types, in one query.
+        """
+        ids = [ int(idx) for idx in ids ]
+        if not ids or not rel_types: return {}
+        query = """
+            START node=node({ids})
+            MATCH (node)-[rel]-(other)
+            WHERE type(rel) IN [{types}]
+            RETURN ID(node), type(rel), ID(other), rel
+        """.format(ids=",".join(map(str, ids)), types=", ".join("'%s'" % rel_type for rel_type in rel_types))
+        existing = {}
+        for idx, rel_type, other, rel in connection.query(query, returns=(int, unicode, int, client.Relationship)):
+            existing.setdefault((idx, rel_type), {}).setdefault(other, []).append(rel)
+        return existing
+
+    def update_node(self, request, node, pk, data):
+        """
+        Set the given (validated) data to the given node: literal values
+        are set and relationships are synchronised with the given lists of ids.
+        Returns the data as saved.
+        """
+        return self.update_nodes(request, [(node, pk, data)])[0]
+
+    def update_nodes(self, request, entries, targets=None):
+        """
+        Set the given (validated) data to the given nodes, `entries` being a
+        list of (node, pk, data). Every property and relationship is written
+        in a single transaction. `targets` are the related nodes by id (the
+        missing ones are fetched). Returns the data as saved for each node.
+        """
+        model   = self.get_model()
+        fields  = { x['name'] : x for x in iterate_model_fields(model) }
+        targets = dict(targets or {})
+        # Relationship fields to update, with the ids they need
+        rel_fields = {}
+        for node, pk, data in entries:
+            for field_name in data:
+                field = self.get_model_field(field_name)
+                if field.get_internal_type() is 'Relationship':
+                    rel_fields.setdefault(field, set()).update(data[field_name])
+        # Fetch the related nodes we don't have yet
+        for field, ids in rel_fields.items():
+            ids = set(ids).difference(targets)
+            if ids: targets.update( self.get_instances(self.get_target_model(field), ids) )
+        # Every relationship of these types, for every node
+        existing = self.get_existing_relationships([ pk for node, pk, data in entries ] if rel_fields else [],
+                                                   set(field._type for field in rel_fields))
+        # Images to download once the nodes are updated
+        images_to_ingest = []
+        with connection.transaction(commit=False) as tx:
+            for node, pk, data in entries:
+                pk = int(pk)
+                # Get author list (or a new array if )
+                author_list = node.properties.get("_author", [])
+                # This is the first time the current user edit this node
+                if int(request.user.id) not in author_list:
+                    # Add the author to the author list
+                    data["_author"] = author_list + [request.user.id]
+                # Set new values to the node
+                for field_name in data:
+                    field       = self.get_model_field(field_name)
+                    field_value = data[field_name]
+                    # The value can be a list of ID for relationship
+                    if field.get_internal_type() is 'Relationship':
+                        # Pluck id from the list
+                        field_ids = set( value for value in field_value if value != pk )
+                        # Every node related to this one through this type of
+                        # relationship, so we don't add a relation twice
+                        existing_rels = existing.get((pk, field._type), {})
+                        # Ids that ain't in the existing relationships
+                        new_rels_id = field_ids.difference(existing_rels)
+                        # Ids that ain't no more in the new list of relationships
+                        old_rels_id = set(existing_rels).difference(field_ids)
+                        for idx in new_rels_id:
+                            # Unknown nodes can't be related
+                            if idx not in targets: continue
+                            # Outcoming relationship
+                            if field.direction == 'out':
+                                connection.relationships.create(node, field._type, targets[idx])
+                            # Incoming relationship
+                            elif field.direction == 'in':
+                                connection.relationships.create(targets[idx], field._type, node)
+                        # Then delete the old relationships
+                        for idx in old_rels_id:
+                            [ rel.delete() for rel in existing_rels[idx] ]
+                    # Or a literal value
+                    # (integer, date, url, email, etc)
+                    else:
+                        # Remove the values
+                        if field_value in [None, '']:
+                            if field_name == 'image' and fields[field_name]['type'] == 'URLField':
+                                self.remove_node_file(node, field_name, True)
+                            # The field may not exists (yet), then we don't have to remove it
+                            if field_name in node.properties:
+                                node.delete(field_name)
+                        # We simply update the node property
+                        # (the value is already validated)
+                        else:
+                            if field_name in fields:
+                                if 'is_rich' in fields[field_name]['rules'] and fields[field_name]['rules']['is_rich']:
+                                    import bleach
+                                    data[field_name] = field_value = bleach.clean(field_value,
+                                                                                  tags=("br", "blockquote", "ul", "ol",
+                                                                                        "li", "b", "i", "u", "a", "p", "div", "span"),
+                                                                                  attributes={
+                                                                                      '*': ("class",),
+                                                                                      'a': ("href", "target")
+                                                                                  })
+                                if field_name == 'image' and fields[field_name]['type'] == 'URLField':
+                                    # The image will be downloaded by a job
+                                    # (the raw url is stored meanwhile)
+                                    if node.properties.get(field_name) != field_value:
+                                        self.remove_node_file(node, field_name, True)
+                                        images_to_ingest.append((pk, data, field_name, field_value))
+                            node.set(field_name, field_value)
+        # Commit change when every node was treated
+        tx.commit()
+        if images_to_ingest:
+            from app.detective.topics.common.jobs import enqueue_image_ingestion
+            host = settings.MEDIA_URL
+            # The path must start with host name
+            if not host.startswith("http"):
+                # If not, we append the request URL
+                # because if means that we are using a local path
+                host = request.build_absolute_uri(settings.MEDIA_URL)
+            for pk, data, field_name, url in images_to_ingest:
+                enqueue_image_ingestion(request.current_topic, pk, field_name, url, host)
+                data[field_name + "_status"] = "pending"
+        return [ data for node, pk, data in entries ]
+
     def get_patch_source(self, request, **kwargs):
         import time
         start_time = time.time()
@@ -896,6 +1124,8 @@ class IndividualResource(ModelResource):
         bundle = self.build_bundle(request=request)
         # Resource to returns
         resource = UserNestedResource()
+        # Only the author of the topic sees the authors
+        private_response(request)
         # User must be the author of the topic
         if not request.user.is_staff and request.user.id != self.get_topic(bundle).author.id:
             # Returns an empty set of authors
@@ -986,11 +1216,44 @@ class IndividualResource(ModelResource):
             depth     = depth,
             root_node = kwargs['pk'])
         self.log_throttled_access(request)
-        return self.create_response(request, {'leafs': leafs, 'edges' : edges})
+        return self.create_response(request, {'leafs': to_simple(leafs), 'edges' : edges})
+
+    def get_graph_expand(self, request, **kwargs):
+        """
+        Bounded expansion of the neighborhood of an entity (or of the node of
+        the given cursor) with a cursor for every node left to explore.
+        """
+        self.method_check(request, allowed=['get'])
+        self.throttle_check(request)
+        def parameter(name, default, maximum):
+            return min(max(int(request.GET.get(name, default)), 1), maximum)
+        try:
+            depth     = parameter('depth',  expansion.DEFAULT_DEPTH,  expansion.MAX_DEPTH)
+            fanout    = parameter('fanout', expansion.DEFAULT_FANOUT, expansion.MAX_FANOUT)
+            max_nodes = parameter('limit',  expansion.DEFAULT_NODES,  expansion.MAX_NODES)
+            if 'cursor' in request.GET:
+                root_id, after = expansion.read_cursor(request.GET['cursor'])
+            else:
+                root_id, after = int(kwargs['pk']), -1
+        except ValueError as e:
+            return self.error_response(request, {"errors": str(e)}, response_class=http.HttpBadRequest)
+        topic = request.current_topic
+        root  = expansion.get_leaf(topic, root_id)
+        # The node (or the node of the cursor) must be an instance of this model
+        if root is None or root._type.lower() != self.get_model().__name__.lower():
+            if 'cursor' in request.GET:
+                return self.error_response(request, {"errors": "Invalid cursor"}, response_class=http.HttpBadRequest)
+            raise Http404("Not found.")
+        leafs, edges, cursors = expansion.expand(topic, root, depth, fanout, max_nodes, after)
+        self.log_throttled_access(request)
+        return self.create_response(request, {'leafs': to_simple(leafs), 'edges': edges, 'cursors': cursors})
 
     def remove_node_file(self, node, field_name, thumbnails=False):
         try:
-            file_name = os.path.join(settings.MEDIA_ROOT, node.get(field_name).strip('/'))
+            # Read from the loaded properties (the node may be in a transaction)
+            file_name = os.path.join(settings.MEDIA_ROOT, node.properties.get(field_name).strip('/'))
+            # This file may be used by other entities
+            if media.is_hashed(file_name): return
             default_storage.delete(file_name)
 
             if thumbnails:
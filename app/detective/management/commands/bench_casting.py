@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+from django.core.management.base      import BaseCommand
+from optparse                         import make_option
+from app.detective.converters         import RowConverter
+from app.detective.topics.common.jobs import BULK_BATCH_SIZE
+import time
+
+# A typical entity file: id, string, integer, date, boolean, float and sources
+COLUMNS = [
+    ("name"       , "CharField"),
+    ("weight"     , "IntegerField"),
+    ("date"       , "DateTimeField"),
+    ("break_notch", "BooleanField"),
+    ("diameter"   , "FloatField"),
+    ("name"       , "__sources__"),
+]
+
+class Command(BaseCommand):
+    help = "Measure how many csv rows per second the bulk upload casts."
+    option_list = BaseCommand.option_list + (
+        make_option('--rows',
+            action='store',
+            dest='rows',
+            type='int',
+            default=1000000,
+            help='Number of rows to cast (default: 1000000)'),
+        )
+
+    def handle(self, *args, **options):
+        nb_rows   = options["rows"]
+        converter = RowConverter(COLUMNS)
+        self.stdout.write("Generating %d rows..." % nb_rows)
+        rows = [
+            [str(i), "Entity %d" % i, str(i % 500), "2014-08-%02d 00:00:00" % (i % 28 + 1), ("True", "False")[i % 2], "8.%d" % (i % 10), "a source"]
+            for i in xrange(nb_rows)
+        ]
+        self.stdout.write("Casting...")
+        errors = 0
+        start  = time.time()
+        for i in xrange(0, nb_rows, BULK_BATCH_SIZE):
+            for row, data, sources, error in converter.convert_batch(rows[i:i + BULK_BATCH_SIZE]):
+                if error: errors += 1
+        duration = time.time() - start
+        self.stdout.write("%d rows casted in %.2fs (%d rows/s, %d errors)" % (nb_rows, duration, nb_rows / max(duration, 1e-6), errors))
+
+# EOF
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+from django.core.management.base import BaseCommand, CommandError
+from django.test.client          import Client
+from optparse                    import make_option
+from app.detective.models        import Topic
+import time
+
+class Command(BaseCommand):
+    help = "Measure the latency of the detail view of an entity according to its number of relationships."
+    option_list = BaseCommand.option_list + (
+        make_option('--topic',
+            action='store',
+            dest='topic',
+            default='energy',
+            help='Slug of the topic to use (default: energy)'),
+        make_option('--model',
+            action='store',
+            dest='model',
+            default='Organization',
+            help='Model of the entity (default: Organization)'),
+        make_option('--field',
+            action='store',
+            dest='field',
+            default='partner',
+            help='Relationship field to populate (default: partner)'),
+        make_option('--sizes',
+            action='store',
+            dest='sizes',
+            default='10,100,1000,10000',
+            help='Comma separated numbers of relationships (default: 10,100,1000,10000)'),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            type='int',
+            default=3,
+            help='Number of requests by size (default: 3)'),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            topic = Topic.objects.get(slug=options["topic"])
+        except Topic.DoesNotExist:
+            raise CommandError("Unknown topic %s" % options["topic"])
+        models = dict((m.__name__, m) for m in topic.get_models())
+        if options["model"] not in models:
+            raise CommandError("Unknown model %s" % options["model"])
+        model  = models[options["model"]]
+        fields = dict((f.name, f) for f in model._meta.fields if f.get_internal_type() == 'Relationship')
+        if options["field"] not in fields:
+            raise CommandError("Unknown relationship %s" % options["field"])
+        target = fields[options["field"]].target_model
+        client = Client()
+        for size in map(int, options["sizes"].split(",")):
+            root    = model.objects.create(name="bench_detail root")
+            related = [ target.objects.create(name="bench_detail %d" % i) for i in range(size) ]
+            for entity in related:
+                getattr(root, options["field"]).add(entity)
+            root.save()
+            url = "/api/%s/%s/v1/%s/%d/" % (topic.author.username, topic.slug, model.__name__.lower(), root.id)
+            durations = []
+            for _ in range(options["repeat"]):
+                start = time.time()
+                response = client.get(url)
+                durations.append(time.time() - start)
+                if response.status_code != 200:
+                    raise CommandError("%s returned %d" % (url, response.status_code))
+            best = min(durations)
+            self.stdout.write("%6d relationships: %.3fs (%.3fms by relationship)" % (size, best, best * 1000 / max(size, 1)))
+            # clean up
+            for entity in related: entity.delete()
+            root.delete()
+
+# EOF
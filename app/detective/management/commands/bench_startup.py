@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+from django.core.management.base import BaseCommand, CommandError
+from django.test.client          import Client
+from optparse                    import make_option
+from app.detective.models        import Topic
+from app.detective               import preload, warmup
+import time
+
+class Command(BaseCommand):
+    help = "Measure the time to first byte of the first requests to the topics, with their API built (warm) or not (cold)."
+    option_list = BaseCommand.option_list + (
+        make_option('--topics',
+            action='store',
+            dest='topics',
+            default=None,
+            help='Comma separated slugs of the topics to request (default: the most visited)'),
+        make_option('--limit',
+            action='store',
+            dest='limit',
+            type='int',
+            default=10,
+            help='Number of topics to request (default: 10)'),
+        make_option('--preload',
+            action='store',
+            dest='preload',
+            type='int',
+            default=0,
+            help='Preload the N most visited topics first, as the server does when it starts (default: 0)'),
+        make_option('--path',
+            action='store',
+            dest='path',
+            default='',
+            help='Path to request within the API of each topic (default: the API root)'),
+        )
+
+    def handle(self, *args, **options):
+        if options["preload"]:
+            start  = time.time()
+            loaded = preload.preload_topics(options["preload"])
+            self.stdout.write("preload: %d topics in %.2fs" % (len(loaded), time.time() - start))
+        topics = Topic.objects.select_related('author')
+        if options["topics"]:
+            topics = topics.filter(slug__in=options["topics"].split(","))
+        topics = warmup.most_visited(list(topics))[:options["limit"]]
+        if not topics:
+            raise CommandError("No topic to request")
+        client = Client()
+        timings = dict(cold=[], warm=[])
+        for topic in topics:
+            state = "warm" if preload.is_loaded(topic) else "cold"
+            url   = "/api/%s/%s/v1/%s" % (topic.author.username, topic.slug, options["path"])
+            durations = []
+            for _ in range(2):
+                start    = time.time()
+                response = client.get(url)
+                durations.append(time.time() - start)
+                if response.status_code != 200:
+                    raise CommandError("%s returned %d" % (url, response.status_code))
+            timings[state].append(durations[0])
+            self.stdout.write("%s (%s): first request %.3fs, next %.3fs" % (topic.slug, state, durations[0], durations[1]))
+        for state, durations in timings.items():
+            if durations:
+                self.stdout.write("%s topics: %.3fs by first request on average" % (state, sum(durations) / len(durations)))
+
+# EOF
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+from django.core.management.base import BaseCommand, CommandError
+from optparse                    import make_option
+from app.detective.models        import Topic
+from app.detective               import warmup
+import django_rq
+import time
+
+class Command(BaseCommand):
+    help = "Compute the main cache entries of the topics (ie: after a deploy), the most visited topics first."
+    option_list = BaseCommand.option_list + (
+        make_option('--topics',
+            action='store',
+            dest='topics',
+            default=None,
+            help='Comma separated slugs of the topics to warm up (default: every topic)'),
+        make_option('--limit',
+            action='store',
+            dest='limit',
+            type='int',
+            default=None,
+            help='Only warm up the N most visited topics'),
+        make_option('--entries',
+            action='store',
+            dest='entries',
+            default=None,
+            help='Comma separated entries to compute among %s (default: settings.TOPIC_CACHE_WARMUP)' % ", ".join(warmup.ENTRIES.keys())),
+        make_option('--enqueue',
+            action='store_true',
+            dest='enqueue',
+            default=False,
+            help='Enqueue a job by topic instead of computing the entries now'),
+        )
+
+    def handle(self, *args, **options):
+        topics = Topic.objects.all()
+        if options["topics"]:
+            topics = topics.filter(slug__in=options["topics"].split(","))
+        topics  = warmup.most_visited(list(topics))[:options["limit"]]
+        entries = options["entries"].split(",") if options["entries"] else None
+        for name in entries or []:
+            if name not in warmup.ENTRIES:
+                raise CommandError("Unknown entry %s" % name)
+        for topic in topics:
+            if options["enqueue"]:
+                # Jobs are processed in order: the most visited topics first
+                django_rq.get_queue('low').enqueue(warmup.warm_up_topic, topic.id, entries)
+                self.stdout.write("%s: enqueued" % topic.slug)
+            else:
+                start  = time.time()
+                result = warmup.warm_up_topic(topic.id, entries)
+                self.stdout.write("%s: %s (%.2fs)" % (topic.slug, ", ".join(result["warmed"]), time.time() - start))
+
+# EOF
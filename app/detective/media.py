@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Download remote images by chunks (stopping as soon as they are too big or
+# not an image) and store them under the hash of their content, so an image
+# used by many entities is stored once.
+# -----------------------------------------------------------------------------
+from django.conf                 import settings
+from django.core.cache           import cache
+from django.core.files           import File
+from django.core.files.storage   import default_storage
+from django.core.files.temp      import NamedTemporaryFile
+from app.detective.exceptions    import UnavailableImage, NotAnImage, OversizedFile
+from urlparse                    import urlparse
+import hashlib
+import httplib
+import mimetypes
+import os
+import socket
+
+MAX_SIZE_IN_BYTES = 1 * 1024 ** 2 # 1MB
+CHUNK_SIZE        = 64 * 1024
+DOWNLOAD_TIMEOUT  = 10
+# Directory (within the upload root) of the content-addressed files
+STORE_DIRNAME     = "hashed"
+# How long we remember where the image of an url is stored
+URL_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+EXTENSIONS        = {
+    "image/jpeg" : ".jpg",
+    "image/png"  : ".png",
+    "image/gif"  : ".gif",
+}
+
+def download(url, max_size=MAX_SIZE_IN_BYTES):
+    """
+    Download the image at the given url into a temporary file.
+    Returns a tuple (temporary file, sha1 of the content, mimetype).
+    Raises UnavailableImage, NotAnImage or OversizedFile as soon as possible.
+    """
+    # Only the workers download images
+    import magic
+    import urllib2
+    try:
+        response = urllib2.urlopen(url, timeout=DOWNLOAD_TIMEOUT)
+    except (urllib2.URLError, httplib.HTTPException, socket.error, ValueError):
+        raise UnavailableImage()
+    try:
+        # The server gave us the size of the file
+        length = response.info().getheader("Content-Length")
+        if length and length.isdigit() and int(length) > max_size:
+            raise OversizedFile()
+        tmp_file = NamedTemporaryFile(delete=True)
+        try:
+            sha1     = hashlib.sha1()
+            size     = 0
+            mimetype = None
+            while True:
+                try:
+                    chunk = response.read(CHUNK_SIZE)
+                except (httplib.HTTPException, socket.error):
+                    raise UnavailableImage()
+                if not chunk: break
+                # Sniff the type from the first bytes
+                if mimetype is None:
+                    mimetype = magic.from_buffer(chunk, True)
+                    if not mimetype.startswith('image'):
+                        raise NotAnImage()
+                size += len(chunk)
+                if size > max_size:
+                    raise OversizedFile()
+                sha1.update(chunk)
+                tmp_file.write(chunk)
+            if mimetype is None:
+                raise NotAnImage()
+            tmp_file.flush()
+        except:
+            # The file is returned only if the download succeeded
+            tmp_file.close()
+            raise
+        return tmp_file, sha1.hexdigest(), mimetype
+    finally:
+        response.close()
+
+def hashed_name(digest, mimetype, url):
+    """ Name of a content-addressed file within the default storage """
+    extension = EXTENSIONS.get(mimetype) or mimetypes.guess_extension(mimetype) \
+                or os.path.splitext(urlparse(url).path)[1]
+    upload_dir = settings.UPLOAD_ROOT.replace(settings.MEDIA_ROOT, "").strip("/")
+    return "/".join([upload_dir, STORE_DIRNAME, digest[:2], digest + extension])
+
+def is_hashed(name):
+    """ Content-addressed files may be shared by several entities """
+    return ("/%s/" % STORE_DIRNAME) in (name or "")
+
+def url_key(url):
+    if isinstance(url, unicode): url = url.encode("utf-8")
+    return "media_url_%s" % hashlib.md5(url).hexdigest()
+
+def store_url(url):
+    """
+    Download and store the image at the given url. Returns its name within the
+    default storage. An url already downloaded doesn't hit the network and an
+    identical content is stored only once.
+    """
+    name = cache.get(url_key(url))
+    if name is None:
+        tmp_file, digest, mimetype = download(url)
+        try:
+            name = hashed_name(digest, mimetype, url)
+            if not default_storage.exists(name):
+                name = default_storage.save(name, File(tmp_file, os.path.basename(name)))
+        finally:
+            tmp_file.close()
+        cache.set(url_key(url), name, URL_CACHE_TIMEOUT)
+    return name
+
+# EOF
@@ -1,6 +1,5 @@
 from app.detective              import utils
 from app.detective.permissions  import create_permissions, remove_permissions
-from app.detective.parser       import schema, json
 
 from django                     import forms
 from django.conf                import settings
@@ -12,8 +11,6 @@ from django.utils.text          import slugify
 from django.utils.html          import strip_tags
 
 from jsonfield                  import JSONField
-from jsonschema                 import validate
-from jsonschema.exceptions      import ValidationError
 from neo4django.db              import connection
 from tinymce.models             import HTMLField
 
@@ -23,7 +20,6 @@ import inspect
 import os
 import random
 import string
-import django_rq
 import base64
 
 # -----------------------------------------------------------------------------
@@ -72,6 +68,9 @@ class QuoteRequest(models.Model):
         return "%s - %s" % (self.name, self.email,)
 
 def validate_ontology_as_json(value):
+    from app.detective.parser  import schema
+    from jsonschema            import validate
+    from jsonschema.exceptions import ValidationError
     try:
         # For retro-compatibility, we do not validate object-like ontologies
         if type(value) is list:
@@ -135,6 +134,20 @@ class TopicDataSet(models.Model):
                 selected_plans.append(plan[0])
         return selected_plans
 
+def count_entities(topic):
+    """ Number of entities in the given topic (see Topic.entities_count) """
+    query = """
+        START a = node(0)
+        MATCH a-[:`<<TYPE>>`]->(b)-[:`<<INSTANCE>>`]->(c)
+        WHERE b.app_label = "{app_label}"
+        AND not(has(c._relationship))
+        RETURN count(c) as count;
+    """.format(app_label=topic.app_label())
+    return connection.cypher(query).to_dicts()[0].get("count")
+
+def build_syntax(topic):
+    return topic.build_syntax()
+
 class Topic(models.Model):
     background_upload_to='topics'
     class Meta:
@@ -319,21 +332,17 @@ class Topic(models.Model):
 
         """
         if not self.id: return 0
-        cache_key = "entities_count"
-        response = utils.topic_cache.get(self, cache_key)
-        if response is None:
-            query = """
-                START a = node(0)
-                MATCH a-[:`<<TYPE>>`]->(b)-[:`<<INSTANCE>>`]->(c)
-                WHERE b.app_label = "{app_label}"
-                AND not(has(c._relationship))
-                RETURN count(c) as count;
-            """.format(app_label=self.app_label())
-            response = connection.cypher(query).to_dicts()[0].get("count")
-            utils.topic_cache.set(self, cache_key, response, 60*60*12) # cached 12 hours
-        return response
+        # cached 12 hours or until an entity is created or deleted
+        tags = lambda: [ utils.topic_cache.model_tag(model) for model in self.get_models() ]
+        return utils.topic_cache.get_or_compute(self, "entities_count", count_entities,
+                                                args=(self,), timeout=60*60*12, tags=tags)
 
     def get_syntax(self):
+        """ Search syntax of the topic (cached until its ontology or a search term changes) """
+        return utils.topic_cache.get_or_compute(self, "syntax", build_syntax, args=(self,),
+                                                tags=[ utils.topic_cache.SYNTAX_TAG ])
+
+    def build_syntax(self):
         def syntax_output(m) : return {'name': m.__name__, 'label': m._meta.verbose_name.title()}
         def output(m)        : return {'name': m.name, 'label': m.label, 'subject': m.subject}
         def iterate_fields(model, is_relationship):
@@ -469,6 +478,7 @@ class Topic(models.Model):
 
     @staticmethod
     def field_type_sanitized(field):
+        from app.detective.parser import json
         matches     = json.VirtualApp.TYPEMATCHES
         field_type  = field.get("type", None)
         field_match = matches.get(field_type, None)
@@ -716,10 +726,35 @@ def update_topic_cache(*args, **kwargs):
             utils.topic_cache.init_version(topic)
             for Model in topic.get_models():
                 signals.post_save.connect(update_topic_cache, sender=Model, weak=False)
-        else:
+        elif isinstance(instance, Topic):
             # we increment the cache version of this topic, this will "invalidate" every
             # previously stored information related to this topic
             utils.topic_cache.incr_version(topic)
+        else:
+            # only "invalidate" the information depending on this entity
+            # (or on its model and relationships)
+            tags = utils.topic_cache.entity_tags(instance.__class__, instance.id)
+            utils.topic_cache.invalidate(topic, tags)
+
+def update_topic_routes(*args, **kwargs):
+    """
+
+    forget the topics resolved by every process (see utils.TopicRoutes)
+
+    """
+    utils.topic_routes.incr_version()
+
+def update_syntax_cache(*args, **kwargs):
+    """
+
+    invalidate the search syntax of a topic when one of its search terms changes
+
+    """
+    instance = kwargs.get('instance')
+    try:
+        utils.topic_cache.invalidate(instance.topic, [ utils.topic_cache.SYNTAX_TAG ])
+    except Topic.DoesNotExist:
+        pass
 
 def delete_entity(*args, **kwargs):
     fields = utils.iterate_model_fields(kwargs.get('instance').__class__)
@@ -738,18 +773,32 @@ def apply_dataset(*args, **kwargs):
         if dataset != None:
             if dataset.zip_file != None and dataset.zip_file != "":
                 from app.detective.topics.common.jobs import unzip_and_process_bulk_parsing_and_save_as_model
+                import django_rq
                 dataset.zip_file.open('r')
                 # enqueue the parsing job
                 queue = django_rq.get_queue('default', default_timeout=7200)
                 queue.enqueue(unzip_and_process_bulk_parsing_and_save_as_model, instance, base64.b64encode(dataset.zip_file.read()))
                 dataset.zip_file.close()
 
+def schedule_background_thumbnails(*args, **kwargs):
+    """
+    Generate the thumbnails of the topic's background ahead of time
+    """
+    from app.detective.thumbnails import schedule_thumbnails
+    instance = kwargs.get('instance')
+    if instance.background:
+        schedule_thumbnails(instance.background.name)
 
 signals.post_save.connect(user_created         , sender=User)
 signals.post_save.connect(update_topic_cache   , sender=Topic)
 signals.post_save.connect(update_permissions   , sender=Topic)
 signals.post_save.connect(apply_dataset        , sender=Topic)
+signals.post_save.connect(schedule_background_thumbnails, sender=Topic)
 signals.post_delete.connect(update_topic_cache , sender=Topic)
+signals.post_save.connect(update_topic_routes  , sender=Topic)
+signals.post_delete.connect(update_topic_routes, sender=Topic)
+signals.post_save.connect(update_syntax_cache  , sender=SearchTerm)
+signals.post_delete.connect(update_syntax_cache, sender=SearchTerm)
 signals.post_delete.connect(remove_permissions , sender=Topic)
 
 if getattr(settings, 'ENABLE_PROFILING', False):
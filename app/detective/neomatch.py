@@ -1,4 +1,35 @@
 from neo4django.db    import connection
+from django.conf      import settings
+from multiprocessing.pool import ThreadPool
+import re
+
+# Maximum number of Neomatch queries ran at the same time
+POOL_SIZE = getattr(settings, "NEOMATCH_POOL_SIZE", 4)
+# Created on the first use (ie: after the workers are forked)
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPool(POOL_SIZE)
+    return _pool
+
+def query_all(neomatches, root):
+    """
+    Run the queries of the given Neomatch instances (by key) concurrently
+    and returns their results by key.
+    """
+    keys = list(neomatches.keys())
+    # Not worth a thread
+    if len(keys) < 2:
+        return dict( (key, neomatches[key].query(root)) for key in keys )
+    results = get_pool().map(lambda key: neomatches[key].query(root), keys)
+    return dict(zip(keys, results))
+
+# Relationships of a MATCH clause
+RELATIONSHIP = re.compile(r'\[([^\]]*)\]')
+# Relationships without type (ie: "a-->b")
+UNTYPED_RELATIONSHIP = re.compile(r'<?--')
 
 class Neomatch(object):
 
@@ -15,6 +46,18 @@ class Neomatch(object):
             MATCH {match}
             RETURN DISTINCT({select}) as end_obj, ID({select}) as id
         """
+    # Types of the relationships that the rule follows
+    # (or None if the rule follows relationships of any type)
+    def relationship_types(self):
+        types = set()
+        for rel in RELATIONSHIP.findall(self.match):
+            if ":" not in rel: return None
+            for rel_type in rel.split(":", 1)[1].split("|"):
+                # Remove quotes and variable length
+                types.add( rel_type.split("*")[0].strip().strip("`") )
+        if UNTYPED_RELATIONSHIP.search( RELATIONSHIP.sub("[]", self.match) ):
+            return None
+        return types
     # Process the query to the database
     def query(self, root="*"):
         # Replace the query's tags 
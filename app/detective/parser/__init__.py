@@ -1,4 +1,2 @@
-from ..parser import json
-from ..parser import owl
-
-__all__ = ("json", "owl")
\ No newline at end of file
+# The parsers are imported when they are used (ie: owl needs lxml)
+__all__ = ("json", "owl", "schema")
\ No newline at end of file
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Build the models, resources and urls of the most visited topics when the
+# server starts (see app.wsgi) instead of on their first request. Loaded by
+# the gunicorn master (see app/gunicorn_conf.py), they are shared with every
+# worker it forks.
+# -----------------------------------------------------------------------------
+from django.conf          import settings
+from django.core.cache    import cache
+from django.db            import connections
+import gc
+import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+def is_loaded(topic):
+    """ True if the API of the given topic is already built in this process """
+    return ("app.detective.topics.%s.urls" % topic.ontology_as_mod) in sys.modules
+
+def load_topic(topic):
+    from app.detective import topics
+    # This will create the API of the topic (see app.detective.topics.Wrapper)
+    getattr(topics, topic.ontology_as_mod)
+
+def preload_topics(limit=None):
+    """
+    Build the API of the `limit` most visited topics (settings.TOPIC_PRELOAD
+    by default). Returns the slugs of the topics loaded.
+    """
+    from app.detective.models import Topic
+    from app.detective.utils  import topic_routes
+    from app.detective.warmup import most_visited
+    # Load the main urlconf before the topics extend it
+    import app.urls
+    limit  = getattr(settings, "TOPIC_PRELOAD", 0) if limit is None else limit
+    loaded = []
+    if limit > 0:
+        try:
+            topics = most_visited(list(Topic.objects.select_related('author')))[:limit]
+        # The database or the cache may be down: the topics are then loaded
+        # on their first request
+        except Exception as e:
+            logger.warning("Preload: unable to list the topics: %s" % e)
+            return []
+        for topic in topics:
+            start = time.time()
+            try:
+                load_topic(topic)
+                # Resolved without query on their first request
+                topic_routes.get(topic.author.username, topic.slug)
+                loaded.append(topic.slug)
+            except Exception as e:
+                logger.warning("Preload: unable to load %s: %s" % (topic.slug, e))
+            else:
+                logger.info("Preload: %s loaded in %.2fs" % (topic.slug, time.time() - start))
+    # Collect the garbage of the preload now, so it's not done after a fork
+    # (touching every shared object) by each worker
+    gc.collect()
+    return loaded
+
+def close_connections():
+    """ Connections opened before a fork musn't be shared by the workers """
+    for connection in connections.all():
+        connection.close()
+    cache.close()
+
+# EOF
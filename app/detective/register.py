@@ -1,4 +1,4 @@
-from app.detective                       import parser, utils
+from app.detective                       import utils
 from app.detective.modelrules            import ModelRules
 from app.detective.models                import Topic
 from django.conf.urls                    import url, include, patterns
@@ -224,10 +224,12 @@ def topic_models(path, force=False):
         # Also overides the default app label to allow data persistance
         if topic.ontology_as_json is not None:
             # JSON ontology
-            models = parser.json.parse(topic.ontology_as_json, path, app_label=app_label)
+            from app.detective.parser import json
+            models = json.parse(topic.ontology_as_json, path, app_label=app_label)
         elif topic.ontology_as_owl is not None:
             # OWL ontology
-            models = parser.owl.parse(topic.ontology_as_owl, path, app_label=app_label)
+            from app.detective.parser import owl
+            models = owl.parse(topic.ontology_as_owl, path, app_label=app_label)
         else:
             models = []
     # except TypeError as e:
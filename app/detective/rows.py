@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Lightweight and read-only representation of the nodes for the endpoints
+# reading only a few properties of many nodes (exports, graph, lists).
+# -----------------------------------------------------------------------------
+from neo4django.db import connection
+
+class Row(object):
+    """
+    A read-only projection of a node. Subclasses are created by row_class()
+    with one slot by projected property.
+    """
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name, None))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is read-only" % self.__class__.__name__)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def _row_values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def as_dict(self):
+        return dict(zip(self.__slots__, self._row_values()))
+
+    def __eq__(self, other):
+        return isinstance(other, Row) and self.__slots__ == other.__slots__ and self._row_values() == other._row_values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        # Rows classes are created on the fly: they are pickled (ie: to be
+        # cached) with their fields instead of their class
+        return (make_row, (self.__slots__, self._row_values()))
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.as_dict())
+
+# Every row class created so far (by fields)
+ROW_CLASSES = {}
+
+def row_class(fields):
+    """ Returns the (cached) row class with the given fields """
+    fields = tuple(fields)
+    if fields not in ROW_CLASSES:
+        ROW_CLASSES[fields] = type("Row", (Row,), {"__slots__": fields})
+    return ROW_CLASSES[fields]
+
+def make_row(fields, values):
+    return row_class(fields)(**dict(zip(fields, values)))
+
+def from_dicts(fields, dicts):
+    """ Project every dictionary of `dicts` into a row with the given fields """
+    klass = row_class(fields)
+    return [klass(**d) for d in dicts]
+
+def to_simple(value):
+    """ Replace the rows within the given value by dictionaries (ie: to serialize them) """
+    if isinstance(value, Row):
+        return value.as_dict()
+    elif isinstance(value, dict):
+        return dict((k, to_simple(v)) for k, v in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return [to_simple(v) for v in value]
+    return value
+
+def model_rows(model, fields, app_label):
+    """
+    Returns the instances of the given model as rows with their id and the
+    given fields only (only those properties are fetched from the graph).
+    The values are converted as the model does (ie: dates).
+    """
+    fields = ["id"] + [f for f in fields if f != "id"]
+    # Literal properties of the model, by name
+    properties = {}
+    for f in fields[1:]:
+        prop = getattr(getattr(model, f, None), "_property", None)
+        if prop is not None: properties[f] = prop
+    query  = """
+        START root=node(0)
+        MATCH (node)<-[:`<<INSTANCE>>`]-(type)<-[:`<<TYPE>>`]-(root)
+        WHERE type.app_label = '{app_label}'
+        AND type.model_name = '{model_name}'
+        RETURN ID(node) as id{properties}
+        ORDER BY id
+    """.format(
+        app_label  = app_label,
+        model_name = model.__name__,
+        properties = "".join(", node.`{0}`? as `{0}`".format(f) for f in fields[1:])
+    )
+    rows = connection.cypher(query).to_dicts()
+    for row in rows:
+        for f, prop in properties.items():
+            if row[f] is not None: row[f] = prop.to_python(row[f])
+    return from_dicts(fields, rows)
+
+# EOF
@@ -192,25 +192,11 @@ class Search(object):
     def get_most_related(self, rel):
         # Cache key to save the result of this function for each topic and rel
         cache_key = "most_related_%s" % rel
-        # Get cache value
-        most_related = topic_cache.get(self.topic, cache_key)
-        # Return cache value
-        if most_related is not None: return most_related
-        # Build query
-        query = """
-            START root=node(0)
-            MATCH target-[r:`%s`]->(edge)<-[`<<INSTANCE>>`]-(type)<-[`<<TYPE>>`]-(root)
-            WHERE type.app_label = "%s"
-            AND HAS(edge.name)
-            RETURN COUNT(target) as cnt, ID(edge) as id, edge.name as name, type.model_name as model
-            ORDER BY cnt DESC
-            LIMIT 5
-        """ % ( rel, self.topic.app_label() )
-        # Get data from neo4j
-        most_related = connection.cypher(query).to_dicts()
-        # Cache and return result
-        topic_cache.set(self.topic, cache_key, most_related)
-        return most_related
+        tags = lambda: [ topic_cache.relationship_tag(rel) ] + \
+                       [ topic_cache.model_tag(model) for model in self.topic.get_models() ]
+        # Get cache value (computed by a single worker)
+        return topic_cache.get_or_compute(self.topic, cache_key, query_most_related,
+                                          args=(self.topic, rel), tags=tags)
 
     @staticmethod
     def ngrams(input):
@@ -273,3 +259,18 @@ class Search(object):
                     item["relevance"] = relevance
                     matches.append(item)
         return matches
+
+def query_most_related(topic, rel):
+    """ The 5 entities of the given topic which are the most often target of `rel` """
+    # Build query
+    query = """
+        START root=node(0)
+        MATCH target-[r:`%s`]->(edge)<-[`<<INSTANCE>>`]-(type)<-[`<<TYPE>>`]-(root)
+        WHERE type.app_label = "%s"
+        AND HAS(edge.name)
+        RETURN COUNT(target) as cnt, ID(edge) as id, edge.name as name, type.model_name as model
+        ORDER BY cnt DESC
+        LIMIT 5
+    """ % ( rel, topic.app_label() )
+    # Get data from neo4j
+    return connection.cypher(query).to_dicts()
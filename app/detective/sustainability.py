@@ -15,6 +15,14 @@ def dummy_model_to_ressource(model, get=False):
     except ImportError:
         return None
 
+def get_model_resource(model):
+    """ Returns an instance of the model's resource (created once) """
+    # Don't use the resource of a parent class
+    if "_resource" not in model.__dict__:
+        klass = dummy_model_to_ressource(model, True)
+        model._resource = klass() if klass is not None else None
+    return model._resource
+
 # This class of extend the model default model class to allow fluid definition
 # of every model. This way data can be converted dynamicly.
 class FluidNodeModel(models.NodeModel):
@@ -23,12 +31,17 @@ class FluidNodeModel(models.NodeModel):
 
     @classmethod
     def _neo4j_instance(self, node):
-        try:
-            resource = dummy_model_to_ressource(self, True)()
-            resource.validate(node.properties, model=self)
-        # The given node properties don't validate with the resource model
-        except ValidationError:
-            node.properties = resource.convert(node.properties, model=self)
-        # No resource given to make the convertion
-        except NameError: pass
-        return super(FluidNodeModel, self)._neo4j_instance(node)
\ No newline at end of file
+        from app.detective.validators import get_model_validator
+        validator = get_model_validator(self)
+        # Nodes with the same shape than a valid one are not validated again
+        if not validator.is_known_valid(node.properties):
+            try:
+                validator.validate(node.properties)
+                validator.remember_valid(node.properties)
+            # The given node properties don't validate with the resource model
+            except ValidationError:
+                resource = get_model_resource(self)
+                # No resource given to make the convertion
+                if resource is not None:
+                    node.properties = resource.convert(node.properties, model=self)
+        return super(FluidNodeModel, self)._neo4j_instance(node)
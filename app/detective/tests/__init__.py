@@ -2,4 +2,6 @@ from .api       import *
 from .commands  import *
 from .utils     import *
 from .common    import *
-from .jobs      import *
\ No newline at end of file
+from .jobs      import *
+from .media     import *
+from .middleware import *
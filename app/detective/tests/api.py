@@ -4,7 +4,7 @@ from app.detective.models                import Topic, TopicSkeleton, PLANS_CHOI
 from app.detective.topics.common.message import SaltMixin
 from app.detective.topics.common.models  import FieldSource
 from app.detective.topics.energy.models  import Organization, EnergyProject, Person, Country
-from app.detective                       import utils
+from app.detective                       import expansion, utils
 from datetime                            import datetime
 from django.conf                         import settings
 from django.contrib.auth.models          import User, Group
@@ -605,6 +605,126 @@ class TopicApiTestCase(ApiTestCase):
         # At least 2 results
         self.assertGreater( len(data.items()), 1 )
 
+    def test_get_detail_paged_relationships(self):
+        # Limits below 1 are clamped
+        resp = self.api_client.get('/api/detective/energy/v1/person/%d/?rel_limit=-1' % self.pr.id, format='json', authentication=self.get_super_credentials())
+        self.assertValidJSONResponse(resp)
+        data = json.loads(resp.content)
+        self.assertEqual([ country["id"] for country in data["based_in"] ], [self.fra.id])
+        self.assertEqual(data["_relationships"]["based_in"], {"count": 1, "next": None})
+        self.assertNotIn("field_sources", data)
+
+    def test_get_detail_paged_relationships_invalid(self):
+        resp = self.api_client.get('/api/detective/energy/v1/person/%d/?rel_limit=all' % self.pr.id, format='json', authentication=self.get_super_credentials())
+        self.assertHttpBadRequest(resp)
+
+    def test_get_related(self):
+        resp = self.api_client.get('/api/detective/energy/v1/person/%d/related/based_in/?limit=1' % self.pr.id, format='json', authentication=self.get_super_credentials())
+        self.assertValidJSONResponse(resp)
+        data = json.loads(resp.content)
+        self.assertEqual(data["meta"]["count"], 1)
+        self.assertIsNone(data["meta"]["next"])
+        self.assertEqual(data["objects"][0]["name"], u"France")
+        self.assertEqual(data["objects"][0]["id"], self.fra.id)
+
+    def test_get_related_other_model(self):
+        # France isn't a person
+        resp = self.api_client.get('/api/detective/energy/v1/person/%d/related/based_in/' % self.fra.id, format='json', authentication=self.get_super_credentials())
+        self.assertHttpNotFound(resp)
+
+    def test_get_related_unauthorized(self):
+        topic = Topic.objects.get(slug="energy")
+        topic.public = False
+        topic.save()
+        try:
+            resp = self.api_client.get('/api/detective/energy/v1/person/%d/related/based_in/' % self.pr.id, format='json')
+            self.assertHttpUnauthorized(resp)
+        finally:
+            topic.public = True
+            topic.save()
+
+    def test_get_related_unknown_field(self):
+        resp = self.api_client.get('/api/detective/energy/v1/person/%d/related/unknown/' % self.pr.id, format='json', authentication=self.get_super_credentials())
+        self.assertHttpNotFound(resp)
+
+    def test_graph_expand(self):
+        url  = '/api/detective/energy/v1/organization/%d/graph/expand/' % self.jpp.id
+        resp = self.api_client.get(url, data={'depth': 1, 'fanout': 1}, format='json', authentication=self.get_super_credentials())
+        self.assertValidJSONResponse(resp)
+        data = json.loads(resp.content)
+        # Journalism++ and one of its two members
+        self.assertEqual(len(data["leafs"]), 2)
+        self.assertEqual(len(data["edges"]), 1)
+        first = [ int(id) for id in data["leafs"] if int(id) != self.jpp.id ][0]
+        # The other member is left for the next call
+        self.assertIn(str(self.jpp.id), data["cursors"])
+        resp = self.api_client.get(url, data={'depth': 1, 'fanout': 1, 'cursor': data["cursors"][str(self.jpp.id)]}, format='json', authentication=self.get_super_credentials())
+        self.assertValidJSONResponse(resp)
+        data = json.loads(resp.content)
+        members = [ int(id) for id in data["leafs"] if int(id) != self.jpp.id ]
+        self.assertEqual(len(members), 1)
+        self.assertIn(members[0], [self.pr.id, self.pb.id])
+        self.assertNotEqual(members[0], first)
+        self.assertNotIn(str(self.jpp.id), data["cursors"])
+
+    def test_graph_expand_invalid_cursor(self):
+        url  = '/api/detective/energy/v1/organization/%d/graph/expand/' % self.jpp.id
+        resp = self.api_client.get(url, data={'cursor': 'wrong'}, format='json', authentication=self.get_super_credentials())
+        self.assertHttpBadRequest(resp)
+        # The cursor of a person can't be used with the organizations
+        cursor = expansion.make_cursor(self.pr.id)
+        resp = self.api_client.get(url, data={'cursor': cursor}, format='json', authentication=self.get_super_credentials())
+        self.assertHttpBadRequest(resp)
+
+    def test_batch_individuals(self):
+        data = [
+            { 'id': self.jpp.id, 'founded': datetime(2011, 4, 1).strftime('%Y-%m-%dT%H:%M:%S.%f') },
+            { 'name': 'New Organization' }
+        ]
+        resp = self.api_client.post('/api/detective/energy/v1/organization/batch/', format='json', data=data, authentication=self.get_super_credentials())
+        self.assertValidJSONResponse(resp)
+        objects = json.loads(resp.content)["objects"]
+        self.assertEqual([o["status"] for o in objects], ["updated", "created"])
+        self.assertEqual(objects[0]["id"], self.jpp.id)
+        self.assertEqual(Organization.objects.get(id=objects[1]["id"]).name, 'New Organization')
+
+    def test_batch_individuals_invalid(self):
+        data = [
+            { 'name': 'Never Created Organization' },
+            { 'id': self.jpp.id, 'founded': 'not a date' }
+        ]
+        resp = self.api_client.post('/api/detective/energy/v1/organization/batch/', format='json', data=data, authentication=self.get_super_credentials())
+        self.assertHttpBadRequest(resp)
+        errors = json.loads(resp.content)["errors"]
+        self.assertEqual([e["index"] for e in errors], [1])
+        self.assertEqual(len(Organization.objects.filter(name='Never Created Organization')), 0)
+
+    def test_batch_individuals_index_equals_pk(self):
+        if self.jg.id > 500: self.skipTest("Batch too big")
+        # The created entity at the position `jg.id` must not be taken for jg
+        data = [ { 'id': self.jg.id, 'website_url': 'http://jg.example.org' } ]
+        data+= [ { 'name': 'Batch Organization %d' % i } for i in range(1, self.jg.id + 1) ]
+        resp = self.api_client.post('/api/detective/energy/v1/organization/batch/', format='json', data=data, authentication=self.get_super_credentials())
+        self.assertValidJSONResponse(resp)
+        objects = json.loads(resp.content)["objects"]
+        try:
+            self.assertEqual(objects[0]["id"], self.jg.id)
+            self.assertEqual(objects[0]["status"], "updated")
+            self.assertEqual(Organization.objects.get(id=self.jg.id).website_url, 'http://jg.example.org')
+            self.assertNotIn(self.jg.id, [ o["id"] for o in objects[1:] ])
+            self.assertEqual(Organization.objects.get(id=objects[-1]["id"]).name, 'Batch Organization %d' % self.jg.id)
+        finally:
+            for o in objects[1:]: Organization.objects.get(id=o["id"]).delete()
+
+    def test_batch_individuals_other_model(self):
+        # A person can't be updated through the organizations
+        data = [ { 'id': self.pr.id, 'name': 'Not an organization' } ]
+        resp = self.api_client.post('/api/detective/energy/v1/organization/batch/', format='json', data=data, authentication=self.get_super_credentials())
+        self.assertHttpBadRequest(resp)
+        errors = json.loads(resp.content)["errors"]
+        self.assertEqual(errors[0]["errors"]["id"], ["Not found."])
+        self.assertEqual(Person.objects.get(id=self.pr.id).name, self.pr.name)
+
     def test_cypher_detail(self):
         resp = self.api_client.get('/api/detective/common/v1/cypher/111/', format='json', authentication=self.get_super_credentials())
         self.assertTrue(resp.status_code in [302, 404])
@@ -666,6 +786,105 @@ class TopicApiTestCase(ApiTestCase):
         # As many descriptors as models
         self.assertEqual( 11, len(data.items()) )
 
+    def test_forms_summary_etag(self):
+        self.get_super_credentials()
+        url  = '/api/detective/energy/v1/summary/forms/'
+        resp = self.api_client.get(url, format='json')
+        self.assertValidJSONResponse(resp)
+        etag = resp['ETag']
+        # Nothing changed
+        resp = self.api_client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        # Something changed in the topic
+        utils.topic_cache.invalidate(Topic.objects.get(slug="energy"), [ utils.topic_cache.model_tag(Organization) ])
+        resp = self.api_client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertValidJSONResponse(resp)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_forms_summary_response_cache(self):
+        from app.middleware.cache     import TopicResponseCache
+        from django.test.client       import RequestFactory
+        url   = '/api/detective/energy/v1/summary/forms/'
+        topic = Topic.objects.get(slug="energy")
+        # Another contributor of the topic
+        other = self.create_user(username='other_contrib')
+        other.groups.add(Group.objects.get(name='energy_contributor'))
+        def cache_key(user):
+            request = RequestFactory().get(url, HTTP_ACCEPT='application/json')
+            request.user, request.current_topic = user, topic
+            return TopicResponseCache().get_cache_key(request)
+        # Both contributors share the same response...
+        self.assertEqual(cache_key(self.contrib_user), cache_key(other))
+        # ...but not with the readers of the topic
+        self.assertNotEqual(cache_key(self.contrib_user), cache_key(self.lambda_user))
+        self.get_contrib_credentials()
+        resp = self.api_client.get(url, format='json')
+        self.assertValidJSONResponse(resp)
+        self.assertIsNotNone(utils.topic_cache.get(topic, cache_key(other)))
+        self.login('other_contrib', 'other_contrib')
+        cached = self.api_client.get(url, format='json')
+        self.assertValidJSONResponse(cached)
+        self.assertEqual(json.loads(cached.content), json.loads(resp.content))
+        # Something changed in the topic
+        key = cache_key(other)
+        utils.topic_cache.invalidate(topic, [ utils.topic_cache.model_tag(Organization) ])
+        self.assertNotEqual(cache_key(other), key)
+
+    def test_graph_summary_sample(self):
+        topic = Topic.objects.get(slug="energy")
+        resp = self.api_client.get('/api/detective/energy/v1/summary/graph/?max_nodes=2', format='json', authentication=self.get_super_credentials())
+        self.assertValidJSONResponse(resp)
+        data = json.loads(resp.content)
+        self.assertEqual(len(data["leafs"]), 2)
+        # Only the edges among the sampled entities
+        for head, relation, tail in data["edges"]:
+            self.assertIn(str(head), data["leafs"])
+            self.assertIn(str(tail), data["leafs"])
+        # The most connected entities (2 relationships each, the oldest first)
+        self.assertEqual(sorted(data["leafs"].keys()), sorted([str(self.jpp.id), str(self.fra.id)]))
+        self.assertEqual(sum(data["omitted"].values()) + 2, topic.entities_count())
+
+    def test_graph_summary_sample_outside_api(self):
+        # Relationships saved without the API (ie: from the admin)
+        people = []
+        for name in (u"Anna", u"Bob", u"Carl"):
+            person = Person(name=name)
+            person.activity_in_organization.add(self.jg)
+            person.save()
+            people.append(person)
+        try:
+            resp = self.api_client.get('/api/detective/energy/v1/summary/graph/?max_nodes=1', format='json', authentication=self.get_super_credentials())
+            self.assertValidJSONResponse(resp)
+            data = json.loads(resp.content)
+            # Journalism Grant is now the most connected entity
+            self.assertEqual(data["leafs"].keys(), [str(self.jg.id)])
+        finally:
+            for person in people: self.cleanModel(person)
+
+    def test_graph_summary_sample_invalid(self):
+        resp = self.api_client.get('/api/detective/energy/v1/summary/graph/?max_nodes=many', format='json', authentication=self.get_super_credentials())
+        self.assertHttpBadRequest(resp)
+
+    def test_mine_not_shared(self):
+        url = '/api/detective/energy/v1/organization/mine/'
+        mine = Organization(name=u"Contributor's organization")
+        mine._author = [self.contrib_user.pk]
+        mine.save()
+        # Another contributor of the topic (same permissions)
+        other = self.create_user(username='other_contrib')
+        other.groups.add(Group.objects.get(name='energy_contributor'))
+        try:
+            self.get_contrib_credentials()
+            resp = self.api_client.get(url, format='json')
+            self.assertValidJSONResponse(resp)
+            self.assertIn(mine.id, [ o["id"] for o in json.loads(resp.content)["objects"] ])
+            self.login('other_contrib', 'other_contrib')
+            resp = self.api_client.get(url, format='json')
+            self.assertValidJSONResponse(resp)
+            self.assertNotIn(mine.id, [ o["id"] for o in json.loads(resp.content)["objects"] ])
+        finally:
+            mine.delete()
+
     def test_types_summary(self):
         resp = self.api_client.get('/api/detective/energy/v1/summary/types/', format='json', authentication=self.get_super_credentials())
         self.assertValidJSONResponse(resp)
@@ -763,6 +982,21 @@ class TopicApiTestCase(ApiTestCase):
         updated_jpp = Organization.objects.get(name=self.jpp.name)
         self.assertEqual(updated_jpp.website_url, jpp_url)
 
+    def test_patch_individual_image_is_ingested_later(self):
+        image_url = 'http://www.mindzone.info/uploads/bild1-hrkEbw.jpg'
+        args = {
+            'scope'      : 'detective/energy',
+            'model_id'   : self.jpp.id,
+            'model_name' : 'organization',
+            'patch_data' : { 'image': image_url }
+        }
+        resp = self.patch_individual(**args)
+        self.assertHttpOK(resp)
+        self.assertEqual(json.loads(resp.content)['image_status'], 'pending')
+        # the raw url is stored until the job downloads the image
+        updated_jpp = Organization.objects.get(name=self.jpp.name)
+        self.assertEqual(updated_jpp.image, image_url)
+
     def test_patch_individual_website_staff_with_null(self):
         jpp_url  = 'http://jplusplus.org/'
         data = {
@@ -12,7 +12,11 @@
 # -----------------------------------------------------------------------------
 from app.detective.models             import Topic
 from app.detective.topics.common.jobs import process_bulk_parsing_and_save_as_model
+from app.detective.converters         import RowConverter
+from django.test                      import TestCase
+from django.utils.timezone            import utc
 from tastypie.test                    import ResourceTestCase
+import datetime
 import json
 
 class JobsTestCase(ResourceTestCase):
@@ -117,4 +121,65 @@ class JobsTestCase(ResourceTestCase):
         Pill.objects.all().delete()
         Molecule.objects.all().delete()
 
+    def test_bulk_upload_merge(self):
+        topic = Topic.objects.get(slug="test-pillen")
+        files = (
+            ("molecules.csv", ("Molecule_id,name,toxicity_threshold", "1,Coffein,", "2,Piperonal,")),
+            ("pillen.csv", ("Pill_id,name,color", "3,Peer,yellow")),
+            ("composition.csv", ("Pill_id,molecules_contained,Molecule_id", "3,,1")),
+        )
+        response = process_bulk_parsing_and_save_as_model(topic, files, merge_on="name")
+        self.assertEquals(len(response.get("errors")), 0, response)
+        self.assertEquals(response.get("inserted").get("objects"), 3)
+        # upload an updated version of the same files
+        files = (
+            ("molecules.csv", ("Molecule_id,name,toxicity_threshold", "1,Coffein,120", "2,Piperonal,", "4,Mdma,")),
+            ("pillen.csv", ("Pill_id,name,color", "3,Peer,yellow")),
+            ("composition.csv", ("Pill_id,molecules_contained,Molecule_id", "3,,2", "3,,4")),
+        )
+        response = process_bulk_parsing_and_save_as_model(topic, files, merge_on="name")
+        models   = topic.get_models_module()
+        Pill     = models.Pill
+        Molecule = models.Molecule
+        self.assertEquals(len(response.get("errors")), 0, response)
+        # one molecule created, one updated
+        self.assertEquals(response.get("inserted").get("objects"), 2)
+        self.assertEquals(response.get("merged").get("updated"), 1)
+        self.assertEquals(response.get("merged").get("unchanged"), 2)
+        self.assertEquals(response.get("merged").get("links_removed"), 1)
+        self.assertEquals(Molecule.objects.all().count(), 3)
+        self.assertEquals(Pill.objects.all().count(), 1)
+        self.assertEquals(Molecule.objects.get(name="Coffein").toxicity_threshold, "120")
+        molecules = [m.name for m in Pill.objects.get(name="Peer").molecules_contained.all()]
+        self.assertEquals(sorted(molecules), ["Mdma", "Piperonal"])
+        Pill.objects.all().delete()
+        Molecule.objects.all().delete()
+
+class RowConverterTestCase(TestCase):
+
+    def test_convert(self):
+        converter = RowConverter([("name", "CharField"), ("weight", "IntegerField"), ("date", "DateTimeField"), ("break_notch", "BooleanField"), ("name", "__sources__")])
+        data, sources = converter.convert(["1", "P\xc3\xa9r", "12", "2014-08-15 00:00:00", "False", "a source"])
+        self.assertEqual(data, dict(name=u"P\xe9r", weight=12, date=datetime.datetime(2014, 8, 15, tzinfo=utc), break_notch=False))
+        self.assertEqual(sources, dict(name=u"a source"))
+
+    def test_convert_batch(self):
+        converter = RowConverter([("name", "CharField"), ("weight", "IntegerField")])
+        results   = converter.convert_batch([["1", "a", "12"], ["2", "b", "twelve"], ["3", "", ""]])
+        self.assertIsNone(results[0][3])
+        self.assertEqual(results[1][3].column, "weight")
+        self.assertEqual(results[1][3].value, "twelve")
+        self.assertEqual(results[2][1], {})
+
+    def test_convert_batch_as_convert(self):
+        converter = RowConverter([("name", "CharField"), ("weight", "IntegerField"), ("name", "__sources__"), ("break_notch", "BooleanField")])
+        rows      = [["1", "a", "12", "a source", "yes"], ["2", "b", "twelve", "a source", "no"], ["3", "c", "3", "", "maybe"]]
+        results   = converter.convert_batch(rows)
+        self.assertEqual(results[0][1:], (dict(name=u"a", weight=12, break_notch=True), dict(name=u"a source"), None))
+        # The columns after the error aren't casted
+        self.assertEqual(results[1][1], dict(name=u"b"))
+        self.assertIsNone(results[1][2])
+        self.assertEqual(results[2][1], dict(name=u"c", weight=3))
+        self.assertEqual(results[2][3].column, "break_notch")
+
 # EOF
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+from django.test               import TestCase
+from app.detective.thumbnails  import generate_thumbnails, get_thumbnails, get_thumbnails_urls
+from app.detective             import media
+
+class ThumbnailsTestCase(TestCase):
+
+    def test_invalid_image_is_cached(self):
+        self.assertEqual(generate_thumbnails("upload/does-not-exist.jpg"), {})
+        # no thumbnails (and no new generation) for this image
+        self.assertEqual(get_thumbnails("upload/does-not-exist.jpg"), {})
+        self.assertIsNone(get_thumbnails_urls("upload/does-not-exist.jpg"))
+
+    def test_no_image(self):
+        self.assertEqual(get_thumbnails(None), {})
+        self.assertEqual(get_thumbnails(""), {})
+
+class MediaTestCase(TestCase):
+
+    def test_hashed_name(self):
+        digest = "a94a8fe5ccb19ba61c4c0873d391e987982fbbd3"
+        name   = media.hashed_name(digest, "image/jpeg", "http://example.org/test.jpeg")
+        self.assertEqual(name, "upload/hashed/a9/%s.jpg" % digest)
+        # the same content from another url is stored under the same name
+        self.assertEqual(name, media.hashed_name(digest, "image/jpeg", "http://example.com/other.jpg"))
+        self.assertTrue(media.is_hashed(name))
+        self.assertFalse(media.is_hashed("upload/test.jpg"))
+
+# EOF
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+from django.test               import TestCase
+from app.detective.models      import Topic
+from app.detective.utils       import topic_routes
+from app.detective             import preload, warmup
+
+class TopicRoutesTestCase(TestCase):
+
+    fixtures = ['app/detective/fixtures/default_topics.json',]
+
+    def setUp(self):
+        # Topics resolved by the previous tests
+        topic_routes.incr_version()
+
+    def test_get(self):
+        topic = Topic.objects.get(slug='energy')
+        self.assertEqual(topic_routes.get(topic.author.username, 'energy'), topic)
+        self.assertIsNone(topic_routes.get(topic.author.username, 'unknown'))
+        # Resolved within the process
+        with self.assertNumQueries(0):
+            self.assertEqual(topic_routes.get(topic.author.username, 'energy'), topic)
+
+    def test_get_after_change(self):
+        topic = Topic.objects.get(slug='energy')
+        topic_routes.get(topic.author.username, 'energy')
+        topic.title = "Energy changed"
+        topic.save()
+        self.assertEqual(topic_routes.get(topic.author.username, 'energy').title, "Energy changed")
+
+class PreloadTestCase(TestCase):
+
+    fixtures = ['app/detective/fixtures/default_topics.json',]
+
+    def test_preload_topics(self):
+        topic = Topic.objects.get(slug='energy')
+        # The most visited topic
+        for i in range(100): warmup.record_visit(topic)
+        warmup.flush_visits()
+        self.assertEqual(preload.preload_topics(1), ['energy'])
+        self.assertTrue(preload.is_loaded(topic))
+
+    def test_preload_disabled(self):
+        self.assertEqual(preload.preload_topics(), [])
+
+# EOF
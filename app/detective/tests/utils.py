@@ -27,10 +27,19 @@
 #
 #   You should have received a copy of the GNU General Public License
 #   along with this program. If not, see <http://www.gnu.org/licenses/>.
-from django.test          import TestCase
-from app.detective.models import Topic
-from app.detective.utils  import topic_cache, get_leafs_and_edges
+from django.core.cache         import cache
+from django.test               import TestCase
+from app.detective.models      import Topic
+from app.detective.utils       import topic_cache, get_leafs_and_edges
+from app.detective             import warmup
+from app.detective.validators  import get_model_validator
+from app.detective.rows        import row_class, from_dicts, to_simple, model_rows
+from app.detective.topics.energy.models import Organization
+from app.detective.neomatch    import query_all
+from django.core.exceptions    import ValidationError
+import datetime
 import json
+import os
 
 class TopicCachierTestCase(TestCase):
 
@@ -98,22 +107,126 @@ class TopicCachierTestCase(TestCase):
 
     def test_topic_model_create(self):
         topic = self.create_topic()
-        rev_origin = topic_cache.version(topic)
         Person = topic.get_models_module().Person
+        topic_cache.set(topic, 'persons', 'value', tags=[topic_cache.model_tag(Person)])
+        rev_origin = topic_cache.version(topic)
         p = Person.objects.create(first_name='Pierre', name='Bellon')
-        rev_target = topic_cache.version(topic)
-        self.assertEqual(rev_target, rev_origin + 1)
+        # Creating an entity only invalidates the values depending on its model
+        self.assertEqual(topic_cache.version(topic), rev_origin)
+        self.assertIsNone(topic_cache.get(topic, 'persons'))
 
-    def test_topic_model_create(self):
+    def test_topic_model_update(self):
         topic = self.create_topic()
         Person = topic.get_models_module().Person
+        Company = topic.get_models_module().Company
         p = Person.objects.create(first_name='Pierre', name='Bellon')
+        topic_cache.set(topic, 'person', 'value', tags=[topic_cache.entity_tag(p.id)])
+        topic_cache.set(topic, 'companies', 'value', tags=[topic_cache.model_tag(Company)])
         rev_origin = topic_cache.version(topic)
         p = Person.objects.get(first_name='Pierre', name='Bellon')
         p.first_name = 'Matthieu'
         p.save()
-        rev_target = topic_cache.version(topic)
-        self.assertEqual(rev_target, rev_origin + 1)
+        self.assertEqual(topic_cache.version(topic), rev_origin)
+        self.assertIsNone(topic_cache.get(topic, 'person'))
+        self.assertEqual(topic_cache.get(topic, 'companies'), 'value')
+
+    def test_cache_get_many(self):
+        topic = self.create_topic()
+        topic_cache.set_many(topic, {'many_a': [1], 'many_b': 2}, tags=['model:Person'])
+        values = topic_cache.get_many(topic, ['many_a', 'many_b', 'many_c'])
+        self.assertEqual(values, {'many_a': [1], 'many_b': 2})
+        # Values from the local cache are copies
+        values['many_a'].append(2)
+        self.assertEqual(topic_cache.get(topic, 'many_a'), [1])
+
+    def test_cache_version_once_per_request(self):
+        topic = self.create_topic()
+        topic_cache.begin_request()
+        try:
+            rev = topic_cache.version(topic)
+            topic.title = "New title"
+            topic.save()
+            # Versions changed by this process are read again
+            self.assertEqual(topic_cache.version(topic), rev + 1)
+        finally:
+            topic_cache.end_request()
+
+    def test_cache_get_or_compute(self):
+        topic = self.create_topic()
+        computed = []
+        compute  = lambda value: computed.append(value) or value
+        self.assertEqual(topic_cache.get_or_compute(topic, 'computed', compute, args=('first',)), 'first')
+        self.assertEqual(topic_cache.get_or_compute(topic, 'computed', compute, args=('second',)), 'first')
+        self.assertEqual(computed, ['first'])
+
+    def test_cache_get_or_compute_stale(self):
+        topic = self.create_topic()
+        compute = lambda value: value
+        topic_cache.get_or_compute(topic, 'stale', compute, args=('first',), tags=['model:Person'])
+        topic_cache.invalidate(topic, ['model:Person'])
+        # Another worker is computing the value: the previous one is served
+        cache.add('topic_%s_stale_lock' % topic.module, True)
+        try:
+            self.assertEqual(topic_cache.get_or_compute(topic, 'stale', compute, args=('second',)), 'first')
+        finally:
+            cache.delete('topic_%s_stale_lock' % topic.module)
+        self.assertEqual(topic_cache.get_or_compute(topic, 'stale', compute, args=('second',)), 'second')
+
+    def test_cache_local_hit(self):
+        topic = self.create_topic()
+        topic_cache.set(topic, 'local', 'value', tags=['model:Person'])
+        get_many = cache.get_many
+        calls    = []
+        cache.get_many = lambda *args, **kwargs: calls.append(args) or get_many(*args, **kwargs)
+        try:
+            self.assertEqual(topic_cache.get(topic, 'local'), 'value')
+        finally:
+            cache.get_many = get_many
+        # The versions of the topic and of the tags are read at once
+        self.assertEqual(len(calls), 1)
+        # Invalidations are still seen by the values read recently
+        topic_cache.invalidate(topic, ['model:Person'])
+        self.assertIsNone(topic_cache.get(topic, 'local'))
+
+    def test_cache_big_value(self):
+        topic = self.create_topic()
+        # Incompressible value bigger than a memcached item
+        big_data = os.urandom(3 * 1024 ** 2)
+        topic_cache.set(topic, 'big_value', big_data)
+        topic_cache.local_cache.clear()
+        self.assertEqual(topic_cache.get(topic, 'big_value'), big_data)
+        topic_cache.flush_metrics()
+        self.assertGreaterEqual(topic_cache.get_sizes()['<=8388608'], 1)
+
+    def test_cache_tags(self):
+        topic = self.create_topic()
+        topic_cache.set(topic, 'tagged', 'value', tags=['rel:employed_by', 'model:Person'])
+        topic_cache.set(topic, 'untagged', 'value')
+        self.assertEqual(topic_cache.get(topic, 'tagged'), 'value')
+        topic_cache.invalidate(topic, ['model:Company'])
+        self.assertEqual(topic_cache.get(topic, 'tagged'), 'value')
+        topic_cache.invalidate(topic, ['rel:employed_by'])
+        self.assertIsNone(topic_cache.get(topic, 'tagged'))
+        self.assertEqual(topic_cache.get(topic, 'untagged'), 'value')
+
+    def test_cache_deferred_invalidation(self):
+        topic = self.create_topic()
+        topic_cache.set(topic, 'tagged', 'value', tags=['model:Person'])
+        with topic_cache.deferred_invalidation(topic):
+            topic_cache.invalidate(topic, ['model:Person'])
+            self.assertEqual(topic_cache.get(topic, 'tagged'), 'value')
+        self.assertIsNone(topic_cache.get(topic, 'tagged'))
+
+    def test_cache_tags_metrics(self):
+        topic = self.create_topic()
+        topic_cache.set(topic, 'tagged', 'value', tags=['model:Person', 'entity:1'])
+        topic_cache.get(topic, 'tagged')
+        topic_cache.invalidate(topic, ['entity:1'])
+        topic_cache.get(topic, 'tagged')
+        topic_cache.flush_metrics()
+        metrics = topic_cache.get_metrics()
+        self.assertGreaterEqual(metrics['model:Person']['hits'], 1)
+        self.assertGreaterEqual(metrics['entity:*']['misses'], 1)
 
     def test_cache_get(self):
         topic = self.create_topic()
@@ -161,4 +274,121 @@ class TopicCachierTestCase(TestCase):
         self.assertEqual(new_leafs, cached_leafs)
         self.assertGreater(len(new_leafs[1]), len(leafs[1]))
 
+class WarmupTestCase(TestCase):
+
+    fixtures = ['app/detective/fixtures/default_topics.json',]
+
+    def test_warm_up_topic(self):
+        topic  = Topic.objects.get(slug='energy')
+        result = warmup.warm_up_topic(topic.id, ["syntax", "entities_count"])
+        self.assertEqual(result["warmed"], ["syntax", "entities_count"])
+        self.assertIsNotNone(topic_cache.get(topic, "syntax"))
+        self.assertIsNotNone(topic_cache.get(topic, "entities_count"))
+
+    def test_warm_up_skips_locked_entries(self):
+        topic = Topic.objects.get(slug='energy')
+        topic_cache.delete(topic, "syntax")
+        # Another worker is computing the syntax
+        cache.add('topic_%s_syntax_lock' % topic.module, True)
+        try:
+            result = warmup.warm_up_topic(topic.id, ["syntax"])
+        finally:
+            cache.delete('topic_%s_syntax_lock' % topic.module)
+        self.assertEqual(result["skipped"], ["syntax"])
+        self.assertIsNone(topic_cache.get(topic, "syntax"))
+
+    def test_warm_up_pending_until_done(self):
+        topic = Topic.objects.get(slug='energy')
+        # Scheduled
+        cache.add(warmup.pending_key(topic.id), True)
+        warmup.warm_up_topic(topic.id, ["syntax"])
+        # Another warm-up can be scheduled once it's done
+        self.assertIsNone(cache.get(warmup.pending_key(topic.id)))
+
+    def test_warm_up_unknown_topic(self):
+        self.assertEqual(warmup.warm_up_topic(-1)["warmed"], [])
+
+    def test_most_visited(self):
+        topics = list(Topic.objects.all()[:2])
+        for i in range(3): warmup.record_visit(topics[1])
+        warmup.flush_visits()
+        self.assertEqual(warmup.most_visited(topics)[0], topics[1])
+
+class ModelValidatorTestCase(TestCase):
+
+    def test_validator_is_built_once(self):
+        from app.detective.topics.energy.models import Organization
+        self.assertIs(get_model_validator(Organization), get_model_validator(Organization))
+
+    def test_every_error_at_once(self):
+        from app.detective.topics.energy.models import Organization
+        validator = get_model_validator(Organization)
+        data      = dict(name="Journalism++", founded="not a date", website_url="not an url", partner=["12", 13])
+        cleaned_data, errors = validator.clean(data)
+        self.assertEqual(sorted(errors.keys()), ["founded", "website_url"])
+        self.assertEqual(cleaned_data, dict(name="Journalism++", partner=[12, 13]))
+        self.assertRaises(ValidationError, validator.validate, data)
+        # invalid values are left out when missing values are allowed
+        self.assertEqual(validator.validate(data, allow_missing=True), cleaned_data)
+
+    def test_valid_signatures(self):
+        from app.detective.topics.energy.models import Organization
+        validator = get_model_validator(Organization)
+        validator.remember_valid(dict(name=u"Journalism++", twitter_handle=u"jplusplus_"))
+        self.assertTrue(validator.is_known_valid(dict(name=u"Detective.io", twitter_handle=u"detective_io")))
+        self.assertFalse(validator.is_known_valid(dict(name=u"Detective.io")))
+        self.assertFalse(validator.is_known_valid(dict(name=u"Detective.io", twitter_handle=12)))
+        # The shape doesn't tell if a date or an url is valid
+        validator.remember_valid(dict(name=u"Journalism++", founded=u"2011-04-03", website_url=u"http://jplusplus.org"))
+        self.assertTrue(validator.is_known_valid(dict(name=u"Detective.io", founded=u"2014-01-01", website_url=u"http://detective.io")))
+        self.assertFalse(validator.is_known_valid(dict(name=u"Detective.io", founded=u"not a date", website_url=u"http://detective.io")))
+        self.assertFalse(validator.is_known_valid(dict(name=u"Detective.io", founded=u"2014-01-01", website_url=u"not an url")))
+
+class RowTestCase(TestCase):
+
+    def test_projection(self):
+        rows = from_dicts(("id", "name"), [dict(id=1, name="Pablo", age=42), dict(id=2)])
+        self.assertEqual(rows[0].name, "Pablo")
+        self.assertIsNone(rows[1].name)
+        self.assertEqual(rows[1].get("name", ""), "")
+        self.assertFalse(hasattr(rows[0], "age"))
+        self.assertFalse(hasattr(rows[0], "__dict__"))
+        self.assertRaises(AttributeError, setattr, rows[0], "name", "Picasso")
+        self.assertIs(row_class(("id", "name")), rows[0].__class__)
+
+    def test_pickle_and_serialize(self):
+        import pickle
+        Leaf  = row_class(("_id", "_type", "name"))
+        leafs = {1: Leaf(_id=1, _type="Person", name="Pablo")}
+        self.assertEqual(pickle.loads(pickle.dumps(leafs, pickle.HIGHEST_PROTOCOL)), leafs)
+        self.assertEqual(to_simple(leafs), {1: dict(_id=1, _type="Person", name="Pablo")})
+
+    def test_model_rows(self):
+        jpp = Organization.objects.create(name=u"Journalism++", founded=datetime.datetime(2011, 4, 3))
+        try:
+            rows = model_rows(Organization, ["name", "founded"], Organization._meta.app_label)
+            row  = [ r for r in rows if r.id == jpp.id ][0]
+            self.assertEqual(row.name, u"Journalism++")
+            # Converted as the model does
+            self.assertEqual(row.founded.date(), datetime.date(2011, 4, 3))
+        finally:
+            jpp.delete()
+
+class NeomatchTestCase(TestCase):
+
+    def test_query_all_concurrently(self):
+        import time
+        class SlowRule(object):
+            def __init__(self, value): self.value = value
+            def query(self, root):
+                time.sleep(0.2)
+                return [dict(id=root, value=self.value)]
+        rules   = dict(("rule_%d" % i, SlowRule(i)) for i in range(4))
+        start   = time.time()
+        results = query_all(rules, 12)
+        # as long as the slowest query, not as the sum of them
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual(results["rule_3"], [dict(id=12, value=3)])
+        self.assertEqual(len(results), 4)
+
 # EOF
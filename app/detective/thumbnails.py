@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Thumbnails are generated by a worker when an image is set. The resources
+# only read the names of the generated thumbnails from the cache (no file
+# system or network access while serving a request).
+# -----------------------------------------------------------------------------
+from django.conf                 import settings
+from django.core.cache           import cache
+from django.core.files.storage   import default_storage
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails never change for a given image name
+THUMBNAILS_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+# A generation can't be scheduled twice within this delay
+THUMBNAILS_PENDING_TIMEOUT = 60 * 5
+
+def thumbnails_key(name):
+    return "thumbnails_%s" % hashlib.md5(name.encode("utf-8")).hexdigest()
+
+def generate_thumbnails(name):
+    """
+    Generate the thumbnails (see settings.THUMBNAIL_SIZES) of the image stored
+    under `name` in the default storage and cache their names. An empty dict
+    is cached for invalid images.
+    """
+    # Only the workers generate thumbnails
+    from easy_thumbnails.exceptions import InvalidImageFormatError
+    from easy_thumbnails.files      import get_thumbnailer
+    try:
+        thumbnailer = get_thumbnailer(name)
+        thumbnails  = dict(
+            (key, thumbnailer.get_thumbnail({'size': size, 'crop': True}).name)
+            for key, size in settings.THUMBNAIL_SIZES.items()
+        )
+    except (InvalidImageFormatError, IOError):
+        logger.warning("Thumbnails: unable to build the thumbnails of %s" % name)
+        thumbnails = {}
+    cache.set(thumbnails_key(name), thumbnails, THUMBNAILS_CACHE_TIMEOUT)
+    cache.delete(thumbnails_key(name) + "_pending")
+    return thumbnails
+
+def schedule_thumbnails(name):
+    """ Enqueue the generation of the thumbnails (once) """
+    import django_rq
+    if name and cache.add(thumbnails_key(name) + "_pending", True, THUMBNAILS_PENDING_TIMEOUT):
+        django_rq.get_queue('low').enqueue(generate_thumbnails, name)
+
+def get_thumbnails(name):
+    """
+    Returns a dict of size key -> thumbnail name for the given image, an
+    empty dict if the image isn't valid, or None if the thumbnails aren't
+    generated yet (their generation is then scheduled).
+    """
+    if not name: return {}
+    thumbnails = cache.get(thumbnails_key(name))
+    if thumbnails is None:
+        schedule_thumbnails(name)
+    return thumbnails
+
+def get_thumbnails_urls(name, build_url=default_storage.url):
+    """
+    Same as get_thumbnails but returns the urls of the thumbnails
+    (or None while they aren't available).
+    """
+    thumbnails = get_thumbnails(name)
+    if not thumbnails: return None
+    return dict((key, build_url(thumbnail)) for key, thumbnail in thumbnails.items())
+
+# EOF
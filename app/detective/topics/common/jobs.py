@@ -17,7 +17,6 @@ from rq.job                             import Job
 from django.contrib.auth.models         import User
 from rq                                 import get_current_job
 from rq.exceptions                      import NoSuchJobError
-from django.utils.timezone              import utc
 from neo4django.db                      import connection
 from django.conf                        import settings
 from django.core.paginator              import InvalidPage
@@ -26,13 +25,14 @@ from django.core.files.base             import ContentFile
 from django.core.cache                  import cache
 from cStringIO                          import StringIO
 from app.detective.topics.common.models import FieldSource
+from app.detective.converters           import RowConverter
+from app.detective                      import media
+from app.detective.rows                 import model_rows
 import app.detective.utils              as utils
 import django_rq
 import json
 import time
-import datetime
 import logging
-import re
 import zipfile
 import csv
 import tempfile
@@ -98,9 +98,10 @@ def render_csv_zip_file(topic, model_type=None, query=None, cache_key=None):
                 continue
             (columns, edges) = get_columns(model)
 
-            objects = model.objects.all()
-            if objects.count() > 0:
-                all_ids = write_all_in_zip(objects, columns, zip_file)
+            # fetch only the exported properties
+            objects = model_rows(model, columns, topic.app_label())
+            if len(objects) > 0:
+                all_ids = write_all_in_zip(objects, columns, zip_file, model.__name__)
                 if export_edges:
                     for key in edges.keys():
                         rows = connection.cypher("""
@@ -146,7 +147,7 @@ def render_csv_zip_file(topic, model_type=None, query=None, cache_key=None):
     file_name = "%s%s" % (settings.MEDIA_URL, file_name)
     # save in cache if cache_key is defined
     if cache_key:
-        utils.topic_cache.set(topic, cache_key, file_name, 60*60*24)
+        utils.topic_cache.set(topic, cache_key, file_name, 60*60*24, tags=utils.topic_cache.topic_tags(topic))
     return dict(file_name=file_name)
 
 # -----------------------------------------------------------------------------
@@ -154,7 +155,7 @@ def render_csv_zip_file(topic, model_type=None, query=None, cache_key=None):
 #    JOB - BULK UPLOAD
 #
 # -----------------------------------------------------------------------------
-def unzip_and_process_bulk_parsing_and_save_as_model(topic, zip_content):
+def unzip_and_process_bulk_parsing_and_save_as_model(topic, zip_content, merge_on=None):
     start_time = time.time()
 
     try:
@@ -182,12 +183,17 @@ def unzip_and_process_bulk_parsing_and_save_as_model(topic, zip_content):
         os.remove(zip_file)
 
         cache.set("{0}_is_uploading".format(topic.ontology_as_mod), True)
-        # Process!
-        process_bulk_parsing_and_save_as_model(topic, files, start_time)
-        cache.delete("{0}_is_uploading".format(topic.ontology_as_mod))
+        try:
+            # Process!
+            return process_bulk_parsing_and_save_as_model(topic, files, start_time, merge_on=merge_on)
+        finally:
+            cache.delete("{0}_is_uploading".format(topic.ontology_as_mod))
     except Exception as e:
         import traceback
         logger.error(traceback.format_exc())
+        # The job failed after a checkpoint: let it fail to be requeued and
+        # resumed (see _process_bulk_parsing_and_save_as_model)
+        if BulkUploadCheckpoint(get_current_job()).state: raise
         if e.__dict__:
             message = str(e.__dict__)
         else:
@@ -196,19 +202,147 @@ def unzip_and_process_bulk_parsing_and_save_as_model(topic, zip_content):
             "errors" : [{e.__class__.__name__ : message}]
         }
 
-def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
+# Number of rows processed (and checkpointed) at once
+BULK_BATCH_SIZE = 200
+
+class BulkUploadCheckpoint(object):
+    """
+    Record the progression of a bulk upload job at each batch boundary.
+    The state (files done, current file and line, counters) is stored in the
+    job's meta while the mapping between the csv ids and the created nodes
+    is stored in a redis hash. When a failed job is requeued, it resumes from
+    the last committed batch. The created nodes are mapped as soon as they
+    are created, so the rows of this batch aren't created twice.
+    """
+    def __init__(self, job):
+        self.job = job
+        if job:
+            self.mapping_key = "bulk_upload_%s_mapping" % job.id
+            self.merged_key  = "bulk_upload_%s_merged" % job.id
+
+    @property
+    def state(self):
+        if not self.job: return None
+        return self.job.meta.get("checkpoint", None)
+
+    def load_mapping(self):
+        """ Returns a dict of (model_name, csv_id) -> node id """
+        if not self.job: return {}
+        mapping = self.job.connection.hgetall(self.mapping_key)
+        return dict((tuple(k.split(":", 1)), int(v)) for k, v in mapping.items())
+
+    def load_merged(self):
+        if not self.job: return set()
+        return set(int(v) for v in self.job.connection.smembers(self.merged_key))
+
+    def record(self, model_name, csv_id, node_id):
+        """ Map a node right after its creation """
+        if not self.job: return
+        self.job.connection.hset(self.mapping_key, "%s:%s" % (model_name, csv_id), node_id)
+
+    def save(self, mapping, merged, **state):
+        if not self.job: return
+        if mapping:
+            self.job.connection.hmset(self.mapping_key, dict(("%s:%s" % k, v) for k, v in mapping.items()))
+        if merged:
+            self.job.connection.sadd(self.merged_key, *merged)
+        self.job.refresh()
+        self.job.meta["checkpoint"] = state
+        self.job.save()
+
+    def clear(self):
+        if not self.job: return
+        self.job.connection.delete(self.mapping_key, self.merged_key)
+        self.job.refresh()
+        self.job.meta.pop("checkpoint", None)
+        self.job.save()
+
+def values_differ(current, new):
+    """ Compare a stored value with an imported one """
+    try:
+        return current != new
+    except TypeError:
+        # Can't compare offset-naive and offset-aware datetimes
+        return current.replace(tzinfo=None) != new.replace(tzinfo=None)
+
+def find_entities_to_merge(model, key, values):
+    """
+    Returns a dict of `model` instances matching the given `values` for the
+    field `key`. Lookups go through the field's index by batch.
+    """
+    found  = {}
+    values = list(set(values))
+    for i in range(0, len(values), BULK_BATCH_SIZE):
+        batch = values[i:i + BULK_BATCH_SIZE]
+        for item in model.objects.filter(**{"%s__in" % key: batch}):
+            value = getattr(item, key, None)
+            # Several entities can share the same value: keep the oldest one
+            if value not in found or item.id < found[value].id:
+                found[value] = item
+    return found
+
+def find_relationships_to_merge(ids, rel_type):
+    """
+    Returns the existing relationships of type `rel_type` from the given
+    node ids as a dict of (id_from, id_to) -> relationship id.
+    """
+    existing = {}
+    ids      = list(ids)
+    for i in range(0, len(ids), BULK_BATCH_SIZE):
+        batch = ids[i:i + BULK_BATCH_SIZE]
+        rows  = connection.cypher("""
+            START root=node({nodes})
+            MATCH (root)-[r:`{rel}`]->(leaf)
+            RETURN ID(root) as id_from, ID(leaf) as id_to, ID(r) as id_rel
+        """.format(nodes=','.join([str(id) for id in batch]), rel=rel_type)).to_dicts()
+        for row in rows:
+            existing[(row['id_from'], row['id_to'])] = row['id_rel']
+    return existing
+
+def process_bulk_parsing_and_save_as_model(topic, files, start_time=None, merge_on=None):
+    """
+    Job which parses uploaded content, validates and saves them as model.
+    The cache is invalidated once, at the end of the job, for every
+    model and relationship that the job touched.
     """
-    Job which parses uploaded content, validates and saves them as model
+    with utils.topic_cache.deferred_invalidation(topic):
+        return _process_bulk_parsing_and_save_as_model(topic, files, start_time, merge_on)
+
+def _process_bulk_parsing_and_save_as_model(topic, files, start_time=None, merge_on=None):
+    """
+    Parse uploaded content, validate and save them as model.
+
+    If `merge_on` is given (ie: "name"), every row is matched with an existing
+    entity having the same value for this field. Matching entities are updated
+    only if their values changed and the relationships of those entities are
+    synchronised with the uploaded relations files.
+
+    The job is checkpointed at every batch (see BulkUploadCheckpoint): if it
+    fails and is requeued, it resumes from the last committed batch.
     """
 
     start_time               = start_time != None and start_time or time.time()
     entities                 = {}
     relations                = []
     errors                   = []
+    previous_errors          = []
     id_mapping               = {}
+    # entities which need to be saved at the next batch boundary (by id)
+    to_save                  = {}
+    # entities created after the last checkpoint of a failed job
+    recovered                = {}
+    # ids of the entities that existed before the upload
+    merged_ids               = set()
+    counters                 = dict(created=0, updated=0, unchanged=0, removed_links=0, links=0)
     nb_lines                 = 0
     file_reading_progression = 0
     job                      = get_current_job()
+    checkpoint               = BulkUploadCheckpoint(job)
+    # what's new since the last checkpoint
+    new_mapping              = {}
+    new_merged               = set()
+    # files completely processed
+    files_done               = []
 
     # Define Exceptions
     class Error (Exception):
@@ -234,6 +368,89 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
     class ModelDoesntExist            (Error): pass
     class RelationDoesntExist         (Error): pass
 
+    def save_entities(entity, file_name, rows, merge_key=None):
+        """ Create or merge a batch of parsed rows """
+        model    = all_models[entity]
+        existing = {}
+        if merge_key:
+            keys     = [data[merge_key] for (_, data, _, _) in rows if data.get(merge_key)]
+            existing = find_entities_to_merge(model, merge_key, keys)
+        for entity_id, data, sources, line in rows:
+            try:
+                item = existing.get(data.get(merge_key)) if merge_key else None
+                # created by this job before it failed
+                resumed = item is None and (entity, entity_id) in recovered
+                if item is None:
+                    if resumed:
+                        item = recovered.pop((entity, entity_id))
+                    else:
+                        item = model.objects.create(**data)
+                        checkpoint.record(entity, entity_id, item.id)
+                    counters["created"] += 1
+                    # the same key can be used several times in a file
+                    if merge_key and data.get(merge_key):
+                        existing[data[merge_key]] = item
+                else:
+                    merged_ids.add(item.id)
+                    changed = [k for k, v in data.items() if values_differ(getattr(item, k, None), v)]
+                    for key in changed:
+                        setattr(item, key, data[key])
+                    if changed:
+                        to_save[item.id] = item
+                        counters["updated"] += 1
+                    else:
+                        counters["unchanged"] += 1
+                # map the object with the ID defined in the .csv
+                id_mapping[(entity, entity_id)] = item
+                new_mapping[(entity, entity_id)] = item.id
+                if item.id in merged_ids: new_merged.add(item.id)
+                # create sources
+                if sources and (item.id in merged_ids or resumed):
+                    known = set((s.field, s.reference) for s in FieldSource.objects.filter(individual=item.id))
+                else:
+                    known = set()
+                for sourced_field, reference in sources.items():
+                    for ref in reference.split("||"):
+                        if (sourced_field, ref) not in known:
+                            FieldSource.objects.create(individual=item.id, field=sourced_field, reference=ref)
+            except Exception as e:
+                errors.append(
+                    WarningValidationError(
+                        data  = data,
+                        model = entity,
+                        file  = file_name,
+                        line  = line,
+                        error = str(e)
+                    )
+                )
+
+    def format_errors(errors):
+        return [dict([(e.__class__.__name__, str(e.__dict__))]) for e in errors]
+
+    def commit(file_name, line, step):
+        """ Save the pending entities then checkpoint the job """
+        for item in to_save.values():
+            item.save()
+        to_save.clear()
+        checkpoint.save(new_mapping, new_merged,
+            step        = step,
+            file        = file_name,
+            line        = line,
+            files_done  = list(files_done),
+            counters    = counters.copy(),
+            progression = file_reading_progression,
+            errors      = previous_errors + format_errors(errors))
+        new_mapping.clear()
+        new_merged.clear()
+        if job:
+            # FIXME: job can be accessed somewhere else (i.e detective/topics/common/jobs.py:JobResource)
+            # Concurrent access are not secure here.
+            # For now we refresh the job just before saving it.
+            job.refresh()
+            job.meta["file_reading_progression"] = (float(file_reading_progression) / float(nb_lines)) * 100
+            job.meta["file_reading"] = file_name
+            job.save()
+
     try:
         assert type(files) in (tuple, list), type(files)
         assert len(files) > 0, "You need to upload at least one file."
@@ -265,9 +482,38 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
                     raise ModelDoesntExist(model=model_name, file=file_name, models_availables=all_models.keys())
             nb_lines += len(file) - 1 # -1 removes headers
 
+        # resume the job from its last checkpoint
+        resume = checkpoint.state or {}
+        if resume:
+            logger.debug("BulkUpload: resuming from %s:%s" % (resume["file"], resume["line"]))
+            files_done               = resume["files_done"]
+            counters                 = resume["counters"]
+            file_reading_progression = resume["progression"]
+            previous_errors          = resume["errors"]
+            merged_ids               = checkpoint.load_merged()
+            # retrieve the entities created (or merged) before the failure
+            node_ids = checkpoint.load_mapping()
+            for model_name in set(m for (m, _) in node_ids.keys()):
+                ids   = [v for (m, _), v in node_ids.items() if m == model_name]
+                nodes = {}
+                for i in range(0, len(ids), BULK_BATCH_SIZE):
+                    for item in all_models[model_name].objects.filter(id__in=ids[i:i + BULK_BATCH_SIZE]):
+                        nodes[item.id] = item
+                for (m, csv_id), node_id in node_ids.items():
+                    if m == model_name and node_id in nodes:
+                        id_mapping[(m, csv_id)] = recovered[(m, csv_id)] = nodes[node_id]
+            if job:
+                job.refresh()
+                job.meta["resumed_from"] = dict(file=resume["file"], line=resume["line"])
+                job.save()
+
         # first iterate over entities
         logger.debug("BulkUpload: creating entities")
-        for entity, (file_name, file) in entities.items():
+        for entity, (file_name, file) in sorted(entities.items()):
+            # this file was completely processed before the failure
+            if file_name in files_done: continue
+            # skip the lines saved before the failure
+            resume_line = resume["line"] if resume.get("file") == file_name else 0
             csv_reader = utils.open_csv(file)
             header     = csv_reader.next()
             # must check that all columns map to an existing model field
@@ -277,6 +523,7 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
                 fields_types[field['name']] = field['type']
             field_names = [field['name'] for field in fields]
             columns        = []
+            raw_rows       = []
             for column in header[1:]:
                 column = utils.to_underscores(column)
                 if not column in field_names and not column.endswith("__sources__"):
@@ -292,72 +539,52 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
                     column_type = fields_types.get(column, None)
                 columns.append((column, column_type))
             else:
+                # entities are merged only if the key is part of this file
+                merge_key = merge_on if (merge_on, fields_types.get(merge_on)) in columns else None
                 # here, we know that all columns are valid
-                for row in csv_reader:
-                    data      = {}
-                    sources   = {}
-                    entity_id = row[0]
-                    for i, (column, column_type) in enumerate(columns):
-                        value = str(row[i+1]).decode('utf-8')
-                        # cast value if needed
-                        if value:
-                            try:
-                                if "Integer" in column_type:
-                                    value = int(value)
-                                # TODO: cast float
-                                if "Date" in column_type:
-                                    value = datetime.datetime(*map(int, re.split('[^\d]', value)[:3])).replace(tzinfo=utc)
-
-                            except Exception as e:
-                                e = WarningCastingValueFail(
-                                    column_name = column,
-                                    value       = value,
-                                    type        = column_type,
+                converter = RowConverter(columns)
+                def cast_rows(raw_rows):
+                    rows = []
+                    for (row, line), (_, data, sources, error) in zip(raw_rows, converter.convert_batch([r for r, _ in raw_rows])):
+                        if error:
+                            errors.append(
+                                WarningCastingValueFail(
+                                    column_name = error.column,
+                                    value       = error.value,
+                                    type        = error.type,
                                     data        = data, model=entity,
                                     file        = file_name,
-                                    line        = csv_reader.line_num,
-                                    error       = str(e)
-                                )
-                                errors.append(e)
-                                break
-                            if column_type == "__sources__":
-                                sources[column] = value
-                            else:
-                                data[column] = value
-                    else:
-                        # instanciate a model
-                        try:
-                            item = all_models[entity].objects.create(**data)
-                            # map the object with the ID defined in the .csv
-                            id_mapping[(entity, entity_id)] = item
-                            # create sources
-                            for sourced_field, reference in sources.items():
-                                for ref in reference.split("||"):
-                                    FieldSource.objects.create(individual=item.id, field=sourced_field, reference=ref)
-                            # FIXME: job can be accessed somewhere else (i.e detective/topics/common/jobs.py:JobResource)
-                            # Concurrent access are not secure here.
-                            # For now we refresh the job just before saving it.
-                            file_reading_progression += 1
-                            if job:
-                                job.refresh()
-                                job.meta["file_reading_progression"] = (float(file_reading_progression) / float(nb_lines)) * 100
-                                job.meta["file_reading"] = file_name
-                                job.save()
-                        except Exception as e:
-                            errors.append(
-                                WarningValidationError(
-                                    data  = data,
-                                    model = entity,
-                                    file  = file_name,
-                                    line  = csv_reader.line_num,
-                                    error = str(e)
+                                    line        = line,
+                                    error       = error.error
                                 )
                             )
+                        else:
+                            rows.append((row[0], data, sources, line))
+                    return rows
+                for row in csv_reader:
+                    if csv_reader.line_num <= resume_line: continue
+                    raw_rows.append((row, csv_reader.line_num))
+                    # cast and instanciate the models by batch
+                    if len(raw_rows) >= BULK_BATCH_SIZE:
+                        save_entities(entity, file_name, cast_rows(raw_rows), merge_key)
+                        file_reading_progression += len(raw_rows)
+                        raw_rows = []
+                        commit(file_name, csv_reader.line_num, "entities")
+                # save the remaining rows
+                if raw_rows:
+                    save_entities(entity, file_name, cast_rows(raw_rows), merge_key)
+                    file_reading_progression += len(raw_rows)
+                files_done.append(file_name)
+                commit(file_name, csv_reader.line_num, "entities")
 
-        inserted_relations = 0
         # then iterate over relations
         logger.debug("BulkUpload: creating relations")
         for file_name, file in relations:
+            # this file was completely processed before the failure
+            if file_name in files_done: continue
+            # skip the lines saved before the failure
+            resume_line = resume["line"] if resume.get("file") == file_name else 0
+            batch_size  = 0
             # create a csv reader
             csv_reader      = utils.open_csv(file)
             csv_header      = csv_reader.next()
@@ -378,15 +605,43 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
                     relation_name    = relation_name,
                     fields_available = [field['name'] for field in utils.iterate_model_fields(all_models[model_from])],
                     error            = str(e))
+            # relationships already in the graph, between entities we merged
+            existing_rels = {}
+            merged_from   = set()
+            if merge_on:
+                rel_type = next((f['rel_type'] for f in utils.iterate_model_fields(all_models[model_from]) if f['name'] == relation_name), None)
+                ids_from = set(i.id for (m, _), i in id_mapping.items() if m == model_from and i.id in merged_ids)
+                if rel_type and ids_from:
+                    existing_rels = find_relationships_to_merge(ids_from, rel_type)
             for row in csv_reader:
                 id_from    = row[0]
                 id_to      = row[2]
                 properties = [p.decode('utf-8') for p in row[3:]]
+                # this line was saved before the failure
+                if csv_reader.line_num <= resume_line:
+                    instance_from = id_mapping.get((model_from, id_from))
+                    instance_to   = id_mapping.get((model_to, id_to))
+                    if instance_from and instance_to and instance_from.id in merged_ids:
+                        merged_from.add(instance_from.id)
+                        existing_rels.pop((instance_from.id, instance_to.id), None)
+                    continue
+                # commit the relationships by batch
+                if batch_size >= BULK_BATCH_SIZE:
+                    commit(file_name, csv_reader.line_num - 1, "relations")
+                    batch_size = 0
+                batch_size += 1
                 if id_to and id_from:
                     try:
                         instance_from = id_mapping[(model_from, id_from)]
                         instance_to   = id_mapping[(model_to, id_to)]
+                        if instance_from.id in merged_ids:
+                            merged_from.add(instance_from.id)
+                            # this relationship already exists
+                            if existing_rels.pop((instance_from.id, instance_to.id), None) is not None:
+                                continue
                         getattr(instance_from, relation_name).add(instance_to)
+                        to_save[instance_from.id] = instance_from
+                        to_save[instance_to.id]   = instance_to
                         # add properties if needed
                         if ModelProperties and properties_name and properties:
                             # save the relationship to create an id
@@ -416,13 +671,8 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
                                     )
                         )
                         # update the job
-                        inserted_relations += 1
+                        counters["links"] += 1
                         file_reading_progression += 1
-                        if job:
-                            job.refresh()
-                            job.meta["file_reading_progression"] = (float(file_reading_progression) / float(nb_lines)) * 100
-                            job.meta["file_reading"] = file_name
-                            job.save()
                     except KeyError as e:
                         errors.append(
                             WarningKeyUnknown(
@@ -455,21 +705,20 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
                             file=file_name, row=row, line=csv_reader.line_num, id_to=id_to, id_from=id_from
                         )
                     )
+            # the relationships of the merged entities which are not in the
+            # uploaded file anymore are removed
+            outdated_rels = [id_rel for (id_from, _), id_rel in existing_rels.items() if id_from in merged_from]
+            if outdated_rels:
+                with connection.transaction(commit=False) as tx:
+                    for id_rel in outdated_rels:
+                        connection.relationships.get(id_rel).delete()
+                tx.commit()
+                counters["removed_links"] += len(outdated_rels)
+            files_done.append(file_name)
+            commit(file_name, csv_reader.line_num, "relations")
 
-        # Save everything
-        saved = 0
-        logger.debug("BulkUpload: saving %d objects" % (len(id_mapping)))
-        if job:
-            job.refresh()
-            job.meta["objects_to_save"] = len(id_mapping)
-            job.save()
-        for item in id_mapping.values():
-            item.save()
-            saved += 1
-            if job:
-                job.refresh()
-                job.meta["saving_progression"] = saved
-                job.save()
+        # everything is saved, we won't need to resume this job
+        checkpoint.clear()
         if job: job.refresh()
         if job and "track" in job.meta:
             from django.core.mail import send_mail
@@ -478,15 +727,24 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
         return {
             'duration' : (time.time() - start_time),
             'inserted' : {
-                'objects' : saved,
-                'links'   : inserted_relations
+                'objects' : counters["created"] + counters["updated"],
+                'links'   : counters["links"]
             },
-            "errors" : sorted([dict([(e.__class__.__name__, str(e.__dict__))]) for e in errors])
+            'merged'   : {
+                'updated'   : counters["updated"],
+                'unchanged' : counters["unchanged"],
+                'links_removed' : counters["removed_links"]
+            },
+            "errors" : sorted(previous_errors + format_errors(errors))
         }
 
     except Exception as e:
         import traceback
         logger.error(traceback.format_exc())
+        # Let the job fail (in order to be requeued and resumed) if something
+        # unexpected happened (ie: timeout) after a checkpoint
+        if checkpoint.state and not isinstance(e, (Error, AssertionError)):
+            raise
         if e.__dict__:
             message = str(e.__dict__)
         else:
@@ -495,6 +753,80 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
             "errors" : [{e.__class__.__name__ : message}]
         }
 
+# -----------------------------------------------------------------------------
+#
+#    JOB - IMAGE INGESTION
+#
+# -----------------------------------------------------------------------------
+# How long the status of an image ingestion is kept
+IMAGE_INGESTION_TIMEOUT = 60 * 60 * 24
+
+def get_image_ingestion_status(node_id):
+    """ Returns the status of the last image ingestion of the given node """
+    return cache.get("image_ingestion_%s" % node_id)
+
+def set_image_ingestion_status(node_id, field_name, url, status, error=None):
+    cache.set("image_ingestion_%s" % node_id, dict(
+        field  = field_name,
+        url    = url,
+        status = status,
+        error  = error
+    ), IMAGE_INGESTION_TIMEOUT)
+
+def enqueue_image_ingestion(topic, node_id, field_name, url, media_host):
+    """
+    Store the ingestion as pending and enqueue the job which will download the
+    given image. The node keeps the raw url until the job is done.
+    """
+    set_image_ingestion_status(node_id, field_name, url, "pending")
+    queue = django_rq.get_queue('high')
+    return queue.enqueue(ingest_image, topic, node_id, field_name, url, media_host)
+
+def ingest_image(topic, node_id, field_name, url, media_host):
+    """
+    Download, validate and store the image at `url`, then replace the raw url
+    saved in the node by the url of the stored file (using `media_host`) and
+    generate its thumbnails.
+    """
+    from app.detective.exceptions import UnavailableImage, NotAnImage, OversizedFile
+    from app.detective.thumbnails import generate_thumbnails
+    set_image_ingestion_status(node_id, field_name, url, "downloading")
+    try:
+        try:
+            # Store the image (once for a given content)
+            path = media.store_url(url)
+        except (UnavailableImage, NotAnImage, OversizedFile) as e:
+            value  = ""
+            status = "failed"
+            error  = e.__class__.__name__
+        else:
+            # Join the path to the file and the MEDIA_URL
+            value  = "/".join([ media_host.strip("/"), path.strip("/") ])
+            status = "done"
+            error  = None
+            # Generate the thumbnails now to avoid building them on the next read
+            generate_thumbnails(path)
+        node = connection.nodes.get(node_id)
+        # The field may have been updated while we were downloading the image
+        if node.properties.get(field_name) == url:
+            if value:
+                node.set(field_name, value)
+            else:
+                node.delete(field_name)
+            # Only the models with this field can have this node as instance
+            tags = [ utils.topic_cache.entity_tag(node_id) ] + [
+                utils.topic_cache.model_tag(model) for model in topic.get_models()
+                if any(f.name == field_name for f in model._meta.fields)
+            ]
+            utils.topic_cache.invalidate(topic, tags)
+        set_image_ingestion_status(node_id, field_name, url, status, error)
+    except Exception as e:
+        # Unexpected error: the status must not stay "downloading", and the
+        # job must still fail for RQ
+        set_image_ingestion_status(node_id, field_name, url, "failed", e.__class__.__name__)
+        raise
+    return dict(status=status, value=value, error=error)
+
 # -----------------------------------------------------------------------------
 #
 #    API RESOURCE
@@ -503,9 +835,15 @@ def process_bulk_parsing_and_save_as_model(topic, files, start_time=None):
 class Document(object):
     def __init__(self, *args, **kwargs):
         self._id = None
+        self.checkpoint = None
         for key, value in kwargs.iteritems():
             setattr(self, key, value)
         if hasattr(self,'meta') and self.meta:
+            # Where the job will resume (if it fails)
+            checkpoint = self.meta.get("checkpoint", None)
+            if checkpoint:
+                self.checkpoint = json.dumps(dict(file=checkpoint["file"], line=checkpoint["line"], step=checkpoint["step"]))
+                self.meta = dict(self.meta, checkpoint=json.loads(self.checkpoint))
             self.meta = json.dumps(self.meta)
         if hasattr(self,'_result') and self._result:
             self._result = json.dumps(self._result)
@@ -518,6 +856,7 @@ class JobResource(Resource):
     created_at = fields.CharField(attribute="created_at" , null=True)
     timeout    = fields.CharField(attribute="timeout"    , null=True)
     exc_info   = fields.CharField(attribute="exc_info"   , null=True)
+    checkpoint = fields.CharField(attribute="checkpoint" , null=True)
 
     def obj_get(self, bundle, **kwargs):
         """
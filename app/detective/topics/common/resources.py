@@ -9,6 +9,7 @@ from app.detective.utils              import get_registered_models, \
                                              is_valid_email, download_url, \
                                              is_local
 from app.detective.topics.common.user import UserResource, UserNestedResource
+from app.detective.thumbnails         import get_thumbnails_urls
 from django.conf                      import settings
 from django.conf.urls                 import url
 from django.core.mail                 import EmailMultiAlternatives
@@ -19,8 +20,6 @@ from django.db.models                 import Q
 from django.http                      import Http404, HttpResponse, HttpResponseForbidden
 from django.template                  import Context
 from django.template.loader           import get_template
-from easy_thumbnails.exceptions       import InvalidImageFormatError
-from easy_thumbnails.files            import get_thumbnailer
 from tastypie                         import fields, http
 from tastypie.authentication          import SessionAuthentication, BasicAuthentication, MultiAuthentication, Authentication
 from tastypie.authorization           import ReadOnlyAuthorization, Authorization
@@ -102,18 +101,8 @@ class TopicSkeletonResource(ModelResource):
             bundle.data["ontology"] = bundle.obj.ontology
         else:
             bundle.data["ontology"] = []
-        try:
-            thumbnailer     = get_thumbnailer(bundle.obj.picture)
-            bundle.data['thumbnail'] = {
-                key : thumbnailer.get_thumbnail({
-                    'size' : size,
-                    'crop' : True
-                }).url
-                for key, size in settings.THUMBNAIL_SIZES.items()
-            }
-        # No image available
-        except InvalidImageFormatError:
-            bundle.data['thumbnail'] = None
+        # Thumbnails are generated by a worker (None until they are available)
+        bundle.data['thumbnail'] = get_thumbnails_urls(bundle.obj.picture.name)
 
         return bundle
 
@@ -152,18 +141,8 @@ class TopicDataSetResource(ModelResource):
         }
 
     def dehydrate(self, bundle):
-        try:
-            thumbnailer     = get_thumbnailer(bundle.obj.picture)
-            bundle.data['thumbnail'] = {
-                key : thumbnailer.get_thumbnail({
-                    'size' : size,
-                    'crop' : True
-                }).url
-                for key, size in settings.THUMBNAIL_SIZES.items()
-            }
-        # No image available
-        except InvalidImageFormatError:
-            bundle.data['thumbnail'] = None
+        # Thumbnails are generated by a worker (None until they are available)
+        bundle.data['thumbnail'] = get_thumbnails_urls(bundle.obj.picture.name)
 
         return bundle
 
@@ -473,22 +452,9 @@ class TopicNestedResource(ModelResource):
             return Http404()
 
     def dehydrate(self, bundle):
-        if bundle.obj.background:
-            # Create a thumbnail for this topic
-            try:
-                thumbnailer = get_thumbnailer(bundle.obj.background)
-                bundle.data['thumbnail'] = {
-                    key : thumbnailer.get_thumbnail({
-                        'size' : size,
-                        'crop' : True
-                    }).url
-                    for key, size in settings.THUMBNAIL_SIZES.items()
-                }
-            # No image available
-            except InvalidImageFormatError:
-                bundle.data['thumbnail'] = None
-        else:
-            bundle.data['thumbnail'] = None
+        # Thumbnails of the background are generated by a worker
+        # (None until they are available)
+        bundle.data['thumbnail'] = get_thumbnails_urls(bundle.obj.background.name)
 
         if 'models' not in self._meta.excludes:
             # Get the model's rules manager
@@ -3,9 +3,10 @@ from .errors                  import ForbiddenError, UnauthorizedError
 from app.detective.models     import Topic
 from app.detective.search     import Search
 from app.detective.neomatch   import Neomatch
-from app.detective.parser     import schema
 from app.detective.individual import IndividualAuthorization
-from app.detective            import utils
+from app.detective            import degrees, utils
+from app.detective.rows       import to_simple, from_dicts
+from app.middleware.cache     import private_response
 from django.core.paginator    import Paginator, InvalidPage
 from django.http              import Http404, HttpResponse
 from neo4django.db            import connection
@@ -98,6 +99,7 @@ class SummaryResource(Resource):
             raise Http404()
 
     def summary_jsonschema(self, bundle, request):
+        from app.detective.parser import schema
         return schema.ontology
 
     def summary_countries(self, bundle, request):
@@ -124,75 +126,15 @@ class SummaryResource(Resource):
         return obj
 
     def summary_types(self, bundle, request):
-        app_label = self.topic.app_label()
-        # Query to aggreagte relationships count by country
-        query = """
-            START n=node(*)
-            MATCH (c)<-[r:`<<INSTANCE>>`]-(n)
-            WHERE HAS(n.model_name)
-            AND n.app_label = '%s'
-            RETURN ID(n) as id, n.model_name as name, count(c) as count
-        """ % app_label
-        # Get the data and convert it to dictionnary
-        types = connection.cypher(query).to_dicts()
-        obj   = {}
-        for t in types:
-            # Use name as identifier
-            obj[ t["name"].lower() ] = t
-            # name is now useless
-            del t["name"]
-        return obj
-
-
-    def sanitize_field(self, field):
-        if "through" in field["rules"]:
-            field["rules"]["through"] = getattr(field["rules"]["through"], "__name__")
-        return field
+        return get_types(self.topic)
 
     def summary_forms(self, bundle, request):
-        available_resources = {}
-        # Get the model's rules manager
-        rulesManager = self.topic.get_rules()
-        # Fetch every registered model
-        # to print out its rules
-        for model in self.topic.get_models():
-            name                = model.__name__.lower()
-            rules               = rulesManager.model(model).all()
-            verbose_name        = getattr(model._meta, "verbose_name", name)
-            verbose_name_plural = getattr(model._meta, "verbose_name_plural", verbose_name + "s")
-            for key in rules:
-                # Filter rules to keep only Neomatch
-                if isinstance(rules[key], Neomatch):
-                    fields.append({
-                        "name"         : key,
-                        "type"         : "ExtendedRelationship",
-                        "verbose_name" : rules[key].title,
-                        "rules"        : {},
-                        "related_model": rules[key].target_model.__name__
-                    })
-
-            fields = [ field.copy() for field in utils.iterate_model_fields(model) ]
-            fields = [ self.sanitize_field(field) for field in fields ]
-
-            available_resources[name] = {
-                'help_text'           : getattr(model, "_description", None),
-                'topic'               : getattr(model, "_topic", self.topic.slug) or self.topic.slug,
-                'model'               : getattr(model, "__name__", ""),
-                'verbose_name'        : verbose_name,
-                'verbose_name_plural' : verbose_name_plural,
-                'name'                : name,
-                'fields'              : fields,
-                'rules'               : rules,
-                'index'               : getattr(model, "__idx__", 0)
-            }
-
-
-        return available_resources
-
+        return get_forms(self.topic)
 
     def summary_mine(self, bundle, request):
         app_label = self.topic.app_label()
         self.method_check(request, allowed=['get'])
+        private_response(request)
 
         limit = int(request.GET.get('limit', 20))
         offset = int(request.GET.get('offset', 0))
@@ -218,7 +160,7 @@ class SummaryResource(Resource):
                 RETURN DISTINCT ID(root) as id, node.name as name, type.model_name as model
             """ % ( int(request.user.id), app_label )
 
-            matches      = connection.cypher(query).to_dicts()
+            matches      = from_dicts(("id", "name", "model"), connection.cypher(query).to_dicts())
             paginator    = Paginator(matches, limit)
 
             try:
@@ -345,13 +287,22 @@ class SummaryResource(Resource):
     def summary_graph(self, bundle, request, **kwargs):
         self.method_check(request, allowed=['get'])
         self.throttle_check(request)
+        # Only the most connected entities (for large topics)
+        if 'max_nodes' in request.GET:
+            try:
+                max_nodes = int(request.GET['max_nodes'])
+            except ValueError:
+                return http.HttpBadRequest("max_nodes must be an integer")
+            leafs, edges, omitted = degrees.get_sample(self.topic, max_nodes)
+            self.log_throttled_access(request)
+            return {'leafs': to_simple(leafs), 'edges': edges, 'omitted': omitted}
         depth     = int(request.GET['depth']) if 'depth' in request.GET.keys() else 1
         leafs, edges  = utils.get_leafs_and_edges(
             topic     = self.topic,
             depth     = depth,
             root_node = "0")
         self.log_throttled_access(request)
-        return self.create_response(request, {'leafs': leafs, 'edges' : edges})
+        return self.create_response(request, {'leafs': to_simple(leafs), 'edges' : edges})
 
     def summary_bulk_upload(self, bundle, request):
         # only allow POST requests
@@ -363,9 +314,11 @@ class SummaryResource(Resource):
         files = [file for sublist in request.FILES.lists() for file in sublist[1]]
         # reads the files
         files = [(f.name, f.readlines()) for f in files]
+        # optional field used to merge rows with existing entities
+        merge_on = request.POST.get("merge_on", None) or None
         # enqueue the parsing job
         queue = django_rq.get_queue('default', default_timeout=7200)
-        job   = queue.enqueue(process_bulk_parsing_and_save_as_model, self.topic, files)
+        job   = queue.enqueue(process_bulk_parsing_and_save_as_model, self.topic, files, merge_on=merge_on)
         # return a quick response
         self.log_throttled_access(request)
         return {
@@ -409,4 +362,77 @@ class SummaryResource(Resource):
 
     def summary_syntax(self, bundle, request): return self.search.get_syntax()
 
+def compute_types(topic):
+    app_label = topic.app_label()
+    # Query to aggreagte relationships count by country
+    query = """
+        START n=node(*)
+        MATCH (c)<-[r:`<<INSTANCE>>`]-(n)
+        WHERE HAS(n.model_name)
+        AND n.app_label = '%s'
+        RETURN ID(n) as id, n.model_name as name, count(c) as count
+    """ % app_label
+    # Get the data and convert it to dictionnary
+    types = connection.cypher(query).to_dicts()
+    obj   = {}
+    for t in types:
+        # Use name as identifier
+        obj[ t["name"].lower() ] = t
+        # name is now useless
+        del t["name"]
+    return obj
+
+def get_types(topic):
+    """ Number of entities of every model (cached until an entity is created or deleted) """
+    tags = lambda: [ utils.topic_cache.model_tag(model) for model in topic.get_models() ]
+    return utils.topic_cache.get_or_compute(topic, "summary_types", compute_types, args=(topic,), tags=tags)
+
+def sanitize_field(field):
+    if "through" in field["rules"]:
+        field["rules"]["through"] = getattr(field["rules"]["through"], "__name__")
+    return field
+
+def compute_forms(topic):
+    available_resources = {}
+    # Get the model's rules manager
+    rulesManager = topic.get_rules()
+    # Fetch every registered model
+    # to print out its rules
+    for model in topic.get_models():
+        name                = model.__name__.lower()
+        rules               = rulesManager.model(model).all()
+        verbose_name        = getattr(model._meta, "verbose_name", name)
+        verbose_name_plural = getattr(model._meta, "verbose_name_plural", verbose_name + "s")
+        for key in rules:
+            # Filter rules to keep only Neomatch
+            if isinstance(rules[key], Neomatch):
+                fields.append({
+                    "name"         : key,
+                    "type"         : "ExtendedRelationship",
+                    "verbose_name" : rules[key].title,
+                    "rules"        : {},
+                    "related_model": rules[key].target_model.__name__
+                })
+
+        fields = [ field.copy() for field in utils.iterate_model_fields(model) ]
+        fields = [ sanitize_field(field) for field in fields ]
+
+        available_resources[name] = {
+            'help_text'           : getattr(model, "_description", None),
+            'topic'               : getattr(model, "_topic", topic.slug) or topic.slug,
+            'model'               : getattr(model, "__name__", ""),
+            'verbose_name'        : verbose_name,
+            'verbose_name_plural' : verbose_name_plural,
+            'name'                : name,
+            'fields'              : fields,
+            'rules'               : rules,
+            'index'               : getattr(model, "__idx__", 0)
+        }
+    # The rules may contain objects that can't be cached (ie: Neomatch)
+    return Serializer().to_simple(available_resources, None)
+
+def get_forms(topic):
+    """ Models and fields of the topic (cached until its ontology changes) """
+    return utils.topic_cache.get_or_compute(topic, "summary_forms", compute_forms, args=(topic,))
+
 # EOF
@@ -1,17 +1,23 @@
+from django.conf               import settings
 from django.core.cache         import cache
 from django.core.exceptions    import ValidationError, SuspiciousOperation
 from django.core.files         import File
 from django.core.files.storage import default_storage
-from django.core.files.temp    import NamedTemporaryFile
 from django.core.validators    import validate_email
 from django.db.models          import signals
 from django.forms.forms        import pretty_name
 from os                        import listdir
 from os.path                   import isdir, join
 from random                    import randint
-from app.detective.exceptions  import UnavailableImage, NotAnImage, OversizedFile
+from app.detective.exceptions  import ComputingElsewhere
 from app.detective.sustainability import FluidNodeModel
+from app.detective.rows        import row_class
 from urlparse                  import urlparse
+import collections
+import cPickle as pickle
+import contextlib
+import copy
+import hashlib
 import importlib
 import inspect
 import itertools
@@ -19,8 +25,9 @@ import logging
 import os
 import re
 import tempfile
-import urllib2
-import magic
+import threading
+import time
+import zlib
 logger = logging.getLogger(__name__)
 
 # for relative paths
@@ -200,11 +207,14 @@ def get_topic_from_model(model):
 
 # storage middleware utilities
 def get_topics_from_request(request):
-    # see app.middleware.storage.StoreTopicList
-    return getattr(request, 'topic_list', None)
+    from app.detective.models import Topic
+    # Only loaded when it is used (see app.middleware.storage.TopicRouting)
+    if getattr(request, 'topic_list', None) is None:
+        request.topic_list = Topic.objects.all()
+    return request.topic_list
 
 def get_topic_from_request(request):
-    # see app.middleware.storage.StoreTopic
+    # see app.middleware.storage.TopicRouting
     return getattr(request, 'current_topic', None)
 
 def get_model_fields(model, order_by='name'):
@@ -278,89 +288,87 @@ def get_model_nodes():
     get_model_nodes.buffer = connection.cypher(query).to_dicts()
     return get_model_nodes.buffer
 
-def get_leafs_and_edges(topic, depth, root_node="0"):
-    def _get_leafs_and_edges(topic, depth, root_node):
-        from neo4django.db import connection
-        leafs = {}
-        edges = []
-        leafs_related = []
-        ###
-        # First we retrieve every leaf in the graph
-        if root_node == "0":
-            query = """
-                START root = node({root})
-                MATCH root-[`<<TYPE>>`]->(type)--> leaf
-                WHERE type.app_label = '{app_label}'
-                AND not(has(leaf._relationship))
-                RETURN leaf, ID(leaf) as id_leaf, type
-            """.format(root=root_node, depth=depth, app_label=topic.app_label())
-        else:
-            query = """
-                START root=node({root})
-                MATCH p = (root)-[*1..{depth}]-(leaf)<-[:`<<INSTANCE>>`]-(type)
-                WHERE HAS(leaf.name)
-                AND type.app_label = '{app_label}'
-                AND length(filter(r in relationships(p) : type(r) = "<<INSTANCE>>")) = 1
-                RETURN leaf, ID(leaf) as id_leaf, type
-            """.format(root=root_node, depth=depth, app_label=topic.app_label())
-        rows = connection.cypher(query).to_dicts()
-
-        if root_node != "0":
-            # We need to retrieve the root in another request
-            # TODO : enhance that
-            query = """
-                START root=node({root})
-                MATCH (root)<-[:`<<INSTANCE>>`]-(type)
-                RETURN root as leaf, ID(root) as id_leaf, type
-            """.format(root=root_node)
-            for row in connection.cypher(query).to_dicts():
-                rows.append(row)
-        # filter rows using the models in ontology
-        # FIXME: should be in the cypher query
-        models_in_ontology = map(lambda m: m.__name__.lower(), topic.get_models())
-        rows = filter(lambda r: r['type']['data']['model_name'].lower() in models_in_ontology, rows)
-
-        for row in rows:
-            row['leaf']['data']['_id'] = row['id_leaf']
-            row['leaf']['data']['_type'] = row['type']['data']['model_name']
-            leafs[row['id_leaf']] = row['leaf']['data']
-        if len(leafs) == 0:
-            return ([], [])
-
-        # Then we retrieve all edges
+def compute_leafs_and_edges(topic, depth, root_node):
+    from neo4django.db import connection
+    leafs = {}
+    edges = []
+    leafs_related = []
+    ###
+    # First we retrieve every leaf in the graph
+    if root_node == "0":
         query = """
-            START A=node({leafs})
-            MATCH (A)-[rel]->(B)
-            WHERE type(rel) <> "<<INSTANCE>>"
-            RETURN ID(A) as head, type(rel) as relation, id(B) as tail
-        """.format(leafs=','.join([str(id) for id in leafs.keys()]))
-        rows = connection.cypher(query).to_dicts()
-        for row in rows:
-            try:
-                if (leafs[row['head']] and leafs[row['tail']]):
-                    leafs_related.extend([row['head'], row['tail']])
-                    edges.append([row['head'], row['relation'], row['tail']])
-            except KeyError:
-                pass
-        # filter edges with relations in ontology
-        models_fields         = itertools.chain(*map(iterate_model_fields, topic.get_models()))
-        relations_in_ontology = set(map(lambda _: _.get("rel_type"), models_fields))
-        edges                 = [e for e in edges if e[1] in relations_in_ontology]
-        # filter leafts without relations
-        # FIXME: should be in the cypher query
-        leafs_related = set(leafs_related)
-        leafs = dict((k, v) for k, v in leafs.iteritems() if k in leafs_related)
-        return (leafs, edges)
+            START root = node({root})
+            MATCH root-[`<<TYPE>>`]->(type)--> leaf
+            WHERE type.app_label = '{app_label}'
+            AND not(has(leaf._relationship))
+            RETURN ID(leaf) as id_leaf, leaf.name? as name, type.model_name as model_name
+        """.format(root=root_node, depth=depth, app_label=topic.app_label())
+    else:
+        query = """
+            START root=node({root})
+            MATCH p = (root)-[*1..{depth}]-(leaf)<-[:`<<INSTANCE>>`]-(type)
+            WHERE HAS(leaf.name)
+            AND type.app_label = '{app_label}'
+            AND length(filter(r in relationships(p) : type(r) = "<<INSTANCE>>")) = 1
+            RETURN ID(leaf) as id_leaf, leaf.name as name, type.model_name as model_name
+        """.format(root=root_node, depth=depth, app_label=topic.app_label())
+    rows = connection.cypher(query).to_dicts()
+
+    if root_node != "0":
+        # We need to retrieve the root in another request
+        # TODO : enhance that
+        query = """
+            START root=node({root})
+            MATCH (root)<-[:`<<INSTANCE>>`]-(type)
+            RETURN ID(root) as id_leaf, root.name? as name, type.model_name as model_name
+        """.format(root=root_node)
+        for row in connection.cypher(query).to_dicts():
+            rows.append(row)
+    # filter rows using the models in ontology
+    # FIXME: should be in the cypher query
+    models_in_ontology = map(lambda m: m.__name__.lower(), topic.get_models())
+    rows = filter(lambda r: r['model_name'].lower() in models_in_ontology, rows)
+    # The graph only needs the name, the id and the type of the leafs
+    Leaf = row_class(("_id", "_type", "name"))
+    for row in rows:
+        leafs[row['id_leaf']] = Leaf(_id=row['id_leaf'], _type=row['model_name'], name=row['name'])
+    if len(leafs) == 0:
+        return ([], [])
+
+    # Then we retrieve all edges
+    query = """
+        START A=node({leafs})
+        MATCH (A)-[rel]->(B)
+        WHERE type(rel) <> "<<INSTANCE>>"
+        RETURN ID(A) as head, type(rel) as relation, id(B) as tail
+    """.format(leafs=','.join([str(id) for id in leafs.keys()]))
+    rows = connection.cypher(query).to_dicts()
+    for row in rows:
+        try:
+            if (leafs[row['head']] and leafs[row['tail']]):
+                leafs_related.extend([row['head'], row['tail']])
+                edges.append([row['head'], row['relation'], row['tail']])
+        except KeyError:
+            pass
+    # filter edges with relations in ontology
+    relations_in_ontology = get_relationship_types(topic)
+    edges                 = [e for e in edges if e[1] in relations_in_ontology]
+    # filter leafts without relations
+    # FIXME: should be in the cypher query
+    leafs_related = set(leafs_related)
+    leafs = dict((k, v) for k, v in leafs.iteritems() if k in leafs_related)
+    return (leafs, edges)
+
+def get_relationship_types(topic):
+    """ Types of the relationships defined by the ontology of the given topic """
+    models_fields = itertools.chain(*map(iterate_model_fields, topic.get_models()))
+    return set(field["rel_type"] for field in models_fields if field.get("rel_type"))
 
+def get_leafs_and_edges(topic, depth, root_node="0"):
     cache_key = "leafs_and_nodes_%s_%s" % (depth, root_node)
-    topic_cache = TopicCachier()
-    leafs_and_edges = topic_cache.get(topic, cache_key)
-    if leafs_and_edges != None:
-        return leafs_and_edges
-    else:
-        leafs_and_edges = _get_leafs_and_edges(topic=topic, depth=depth, root_node=root_node)
-        topic_cache.set(topic, cache_key, leafs_and_edges)
-        return leafs_and_edges
+    return topic_cache.get_or_compute(topic, cache_key, compute_leafs_and_edges,
+                                      args=(topic, depth, root_node),
+                                      tags=lambda: topic_cache.topic_tags(topic))
 
 def get_model_node_id(model):
     # All node from neo4j that are have ascending <<TYPE>> relationship
@@ -458,6 +466,54 @@ def is_member_of(user, group):
     membership = user.groups.filter(name=group.name).count() > 0
     return membership
 
+# A cached value with the versions of the tags it depends on
+TaggedValue = collections.namedtuple("TaggedValue", ["tags", "value"])
+# A cached value stored as a compressed pickle
+CompressedValue = collections.namedtuple("CompressedValue", ["data"])
+# A cached value stored as chunks of a compressed pickle
+ChunkedValue = collections.namedtuple("ChunkedValue", ["digest", "count"])
+
+def tagged_with(values):
+    """ Tags of the given cached values """
+    tags = set()
+    for value in values:
+        if isinstance(value, TaggedValue): tags.update(value.tags.keys())
+    return tags
+
+class LocalCache(object):
+    """
+    A bounded LRU cache within the current process. Its values expire after
+    `ttl` seconds.
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl      = ttl
+        self.values   = collections.OrderedDict()
+        self.lock     = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.values.pop(key, None)
+            if item is None or item[0] < time.time(): return None
+            # Most recently used value
+            self.values[key] = item
+            return item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.values.pop(key, None)
+            self.values[key] = (time.time() + self.ttl, value)
+            while len(self.values) > self.max_size:
+                self.values.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.values.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
 class TopicCachier(object):
     __instance = None
     # dict of cache key definitions / formats
@@ -468,15 +524,63 @@ class TopicCachier(object):
         'version_number' : '{topic_prefix}_version',
         # topic's related cache key prefix
         'cache_prefix'   : '{topic_prefix}_{suffix}',
+        # version of a dependency tag within a topic
+        'tag_version'    : '{topic_prefix}_tag_{tag}',
+        # hits and misses of a tag (for every topic)
+        'tag_metrics'    : 'topic_cache_metrics_{name}_{kind}',
+        # names of the tags with metrics
+        'tag_metrics_names' : 'topic_cache_metrics_names',
+        # number of values cached by size (for every topic)
+        'size_metrics'   : 'topic_cache_sizes_{bucket}',
+        # chunk of a big value
+        'chunk'          : '{cache_key}_{digest}_{index}',
     }
 
     __TIMEOUTS = {
-        'default': 60 * 60 # 3600 secondes = 1h
+        'default': 60 * 60, # 3600 secondes = 1h
+        # tags versions must outlive the values which depend on them
+        'tag'    : 60 * 60 * 24 * 30,
+        'metrics': 60 * 60 * 24 * 7,
+        # stale values are served while their new value is computed
+        'stale'  : 60 * 60 * 24,
+        # maximum duration of a computation (see get_or_compute)
+        'lock'   : 60 * 2,
+        # how long a reader waits for a value computed by another worker
+        'lock_wait' : 10,
     }
 
+    # Dependency tags
+    MODEL_TAG        = 'model:{0}'
+    RELATIONSHIP_TAG = 'rel:{0}'
+    ENTITY_TAG       = 'entity:{0}'
+    # Search terms of the topic
+    SYNTAX_TAG       = 'syntax'
+    # Invalidated along with any other tag (see etag)
+    ANY_TAG          = '*'
+    # Number of lookups between two flushes of the metrics into the cache
+    METRICS_FLUSH_EVERY = 100
+    # Pickled values bigger than this are compressed
+    COMPRESS_MIN_SIZE = 16 * 1024
+    # Compressed values bigger than this are split (memcached items are limited to 1MB)
+    CHUNK_SIZE = 900 * 1024
+    # Upper bounds of the sizes histogram
+    SIZE_BUCKETS = (1024, 16 * 1024, 128 * 1024, 1024 ** 2, 8 * 1024 ** 2)
+
     def __new__(self, *args, **kwargs):
         if not self.__instance:
             self.__instance = super(TopicCachier, self).__new__(self, *args, **kwargs)
+            self.__instance.metrics = collections.defaultdict(lambda: {'hits': 0, 'misses': 0})
+            self.__instance.lookups = 0
+            self.__instance.sizes   = collections.defaultdict(int)
+            # Tags collected by deferred_invalidation (by topic)
+            self.__instance.deferred = {}
+            # Values read from the cache during the last seconds (L1)
+            self.__instance.local_cache = LocalCache(
+                getattr(settings, "TOPIC_CACHE_L1_SIZE", 1000),
+                getattr(settings, "TOPIC_CACHE_L1_TTL", 5)
+            )
+            # Versions read during the current request (see begin_request)
+            self.__instance.request = threading.local()
         return self.__instance
 
     def __keys(self):
@@ -489,6 +593,12 @@ class TopicCachier(object):
         return self.__keys()['version_number'].format(
             topic_prefix=self.__topic_prefix(topic))
 
+    def __tag_key(self, topic, tag):
+        return self.__keys()['tag_version'].format(
+            topic_prefix=self.__topic_prefix(topic),
+            tag=tag
+        )
+
     def is_topic(self, topic):
         from app.detective.models import Topic
         return isinstance(topic, Topic)
@@ -515,18 +625,51 @@ class TopicCachier(object):
             suffix=suffix
         )
 
+    def begin_request(self):
+        """
+        Until end_request is called, the versions of the topics and the tags
+        are read once from the cache (see app.middleware.cache.TopicCacheRequest).
+        """
+        self.request.versions = {}
+
+    def end_request(self):
+        self.request.versions = None
+
+    def __versions(self):
+        # Versions read during the current request (None out of a request)
+        return getattr(self.request, "versions", None)
+
+    def __forget(self, *keys):
+        versions = self.__versions()
+        if versions is not None:
+            for key in keys: versions.pop(key, None)
+
     def init_version(self, topic):
+        cache_key = self.__version_key(topic)
         cache.set(
-            self.__version_key(topic), 1, self.__timeout()
+            cache_key, 1, self.__timeout()
         )
+        self.__forget(cache_key)
 
     def version(self, topic):
-        cache_key = self.__version_key(topic)
-        version = cache.get(cache_key)
-        if version is None:
-            return 0
-        else:
-            return int(version)
+        return self.__read_versions(topic, ())[0]
+
+    def __read_versions(self, topic, tags):
+        """
+        Returns the version of the topic and the versions of the given tags
+        (see tags_versions), read at once.
+        """
+        version_key = self.__version_key(topic)
+        keys = dict( (self.__tag_key(topic, tag), tag) for tag in tags )
+        memo = self.__versions()
+        if memo is None: memo = {}
+        missing = [ key for key in [version_key] + keys.keys() if key not in memo ]
+        found   = cache.get_many(missing) if missing else {}
+        if version_key in missing:
+            memo[version_key] = int(found.get(version_key) or 0)
+        for key in keys:
+            if key in found: memo[key] = found[key]
+        return memo[version_key], dict( (keys[key], memo[key]) for key in keys if key in memo )
 
     def incr_version(self, topic):
         cache_key = self.__version_key(topic)
@@ -534,26 +677,370 @@ class TopicCachier(object):
             self.init_version(topic)
         else:
             cache.incr(cache_key)
+            self.__forget(cache_key)
+        self.__warm_up(topic)
+
+    def __warm_up(self, topic):
+        # Recompute the main entries of the topic in background (see app.detective.warmup)
+        if getattr(settings, "TOPIC_CACHE_WARMUP_ON_WRITE", True) and self.is_topic(topic):
+            from app.detective.warmup import schedule_warm_up
+            schedule_warm_up(topic)
+
+    def model_tag(self, model):
+        # model can be a model class or its name
+        return self.MODEL_TAG.format(getattr(model, "__name__", model))
+
+    def relationship_tag(self, rel_type):
+        return self.RELATIONSHIP_TAG.format(rel_type)
+
+    def entity_tag(self, pk):
+        return self.ENTITY_TAG.format(pk)
+
+    def model_tags(self, model):
+        """ Tags of the given model and of the relationships from or to it """
+        tags = [ self.model_tag(model) ]
+        for field in model._meta.fields:
+            rel_type = getattr(field, "rel_type", None)
+            if rel_type: tags.append( self.relationship_tag(rel_type) )
+        return tags
+
+    def entity_tags(self, model, pk):
+        """ Tags to invalidate when the given entity is created, saved or deleted """
+        return [ self.entity_tag(pk) ] + self.model_tags(model)
+
+    def topic_tags(self, topic):
+        """ Tags of every model and relationship of the given topic """
+        tags = set()
+        for model in topic.get_models():
+            tags.update( self.model_tags(model) )
+        return sorted(tags)
+
+    def tags_versions(self, topic, tags, create=False):
+        """
+        Returns the current versions of the given tags. Unknown tags (never
+        invalidated, or evicted) are missing from the result unless
+        `create` is true: they are then initialized with a new version.
+        """
+        keys     = dict( (self.__tag_key(topic, tag), tag) for tag in tags )
+        memo     = self.__versions()
+        if memo is None: memo = {}
+        versions = dict( (keys[key], memo[key]) for key in keys if key in memo )
+        missing  = [ key for key in keys if key not in memo ]
+        if missing:
+            for key, version in cache.get_many(missing).items():
+                versions[keys[key]] = memo[key] = version
+        if create:
+            for key, tag in keys.items():
+                if tag not in versions:
+                    # Start from the current time so a tag evicted from the
+                    # cache never gets back to a version already used
+                    cache.add(key, int(time.time() * 1000), self.__timeout('tag'))
+                    versions[tag] = memo[key] = cache.get(key)
+        return versions
+
+    def invalidate(self, topic, tags):
+        """
+        Invalidate the values depending on the given tags without
+        invalidating the rest of the topic's cache.
+        """
+        prefix = self.__topic_prefix(topic)
+        if prefix in self.deferred:
+            self.deferred[prefix].update(tags)
+            return
+        for tag in set(tags) | set([self.ANY_TAG]):
+            self.__forget(self.__tag_key(topic, tag))
+            try:
+                cache.incr(self.__tag_key(topic, tag))
+            # An unknown tag has no value depending on it
+            except ValueError:
+                pass
+        self.__warm_up(topic)
+
+    def etag(self, topic):
+        """ A string which changes every time something is invalidated for the given topic """
+        versions = self.tags_versions(topic, [self.ANY_TAG], create=True)
+        return "%s-%s" % (self.version(topic), versions[self.ANY_TAG])
+
+    @contextlib.contextmanager
+    def without_waiting(self):
+        """
+        Within this block, get_or_compute raises ComputingElsewhere instead of
+        waiting for a value that another worker is computing (ie: warm-ups).
+        """
+        self.request.no_wait = True
+        try:
+            yield
+        finally:
+            self.request.no_wait = False
+
+    @contextlib.contextmanager
+    def deferred_invalidation(self, topic):
+        """
+        Collect the tags invalidated within this block and invalidate them
+        once at the end (ie: for a job saving many entities).
+        """
+        prefix = self.__topic_prefix(topic)
+        nested = prefix in self.deferred
+        if not nested: self.deferred[prefix] = set()
+        try:
+            yield
+        finally:
+            if not nested: self.invalidate(topic, self.deferred.pop(prefix))
+
+    def __metric_name(self, tag):
+        # Entities would give an unbounded number of metrics
+        if tag.startswith(self.ENTITY_TAG.format("")):
+            return self.ENTITY_TAG.format("*")
+        return tag
+
+    def __record(self, tags, hit):
+        kind = 'hits' if hit else 'misses'
+        for tag in tags:
+            self.metrics[self.__metric_name(tag)][kind] += 1
+        self.lookups += 1
+        if self.lookups >= self.METRICS_FLUSH_EVERY:
+            self.flush_metrics()
+
+    def __size_bucket(self, size):
+        for bucket in self.SIZE_BUCKETS:
+            if size <= bucket: return "<=%d" % bucket
+        return ">%d" % self.SIZE_BUCKETS[-1]
+
+    def __record_size(self, size):
+        self.sizes[self.__size_bucket(size)] += 1
+        self.lookups += 1
+        if self.lookups >= self.METRICS_FLUSH_EVERY:
+            self.flush_metrics()
+
+    def __add_metric(self, key, count):
+        if not cache.add(key, count, self.__timeout('metrics')):
+            try: cache.incr(key, count)
+            except ValueError: cache.set(key, count, self.__timeout('metrics'))
+
+    def flush_metrics(self):
+        """ Add the metrics of this process to the metrics shared in the cache """
+        metrics, self.metrics, self.lookups = self.metrics, collections.defaultdict(lambda: {'hits': 0, 'misses': 0}), 0
+        sizes, self.sizes = self.sizes, collections.defaultdict(int)
+        names_key = self.__keys()['tag_metrics_names']
+        names     = cache.get(names_key) or set()
+        for name, counts in metrics.items():
+            for kind, count in counts.items():
+                if not count: continue
+                self.__add_metric(self.__keys()['tag_metrics'].format(name=name, kind=kind), count)
+        if not names.issuperset(metrics.keys()):
+            cache.set(names_key, names.union(metrics.keys()), self.__timeout('metrics'))
+        for bucket, count in sizes.items():
+            self.__add_metric(self.__keys()['size_metrics'].format(bucket=bucket), count)
+
+    def get_sizes(self):
+        """ Returns the number of values cached (shared in the cache) by size """
+        buckets = [ self.__size_bucket(size) for size in self.SIZE_BUCKETS ]
+        buckets.append( self.__size_bucket(self.SIZE_BUCKETS[-1] + 1) )
+        keys    = dict( (self.__keys()['size_metrics'].format(bucket=b), b) for b in buckets )
+        sizes   = dict( (bucket, 0) for bucket in buckets )
+        for key, value in cache.get_many(keys.keys()).items():
+            sizes[keys[key]] = value
+        return sizes
+
+    def __chunk_key(self, cache_key, digest, index):
+        return self.__keys()['chunk'].format(cache_key=cache_key, digest=digest[:8], index=index)
+
+    def __encode(self, cache_key, value):
+        """
+        Returns a tuple (items to cache, pickled value). Big values are
+        compressed and the biggest ones are split in chunks referenced by a
+        manifest saved under `cache_key`.
+        """
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.__record_size(len(pickled))
+        if len(pickled) < self.COMPRESS_MIN_SIZE:
+            return { cache_key: value }, pickled
+        data = zlib.compress(pickled)
+        if len(data) <= self.CHUNK_SIZE:
+            return { cache_key: CompressedValue(data) }, pickled
+        digest = hashlib.md5(data).hexdigest()
+        items  = {}
+        for index, start in enumerate(range(0, len(data), self.CHUNK_SIZE)):
+            items[self.__chunk_key(cache_key, digest, index)] = data[start:start + self.CHUNK_SIZE]
+        items[cache_key] = ChunkedValue(digest, len(items))
+        return items, pickled
+
+    def __write(self, values, timeout, version=None):
+        """ Cache the given values (by cache key) and returns their pickles """
+        data    = {}
+        pickles = {}
+        for cache_key, value in values.items():
+            items, pickles[cache_key] = self.__encode(cache_key, value)
+            data.update(items)
+        cache.set_many(data, timeout, version=version)
+        return pickles
+
+    def __read(self, cache_keys, version=None):
+        """
+        Returns the pickles of the values cached under the given keys. A value
+        with a missing chunk is missing.
+        """
+        stored = cache.get_many(cache_keys, version=version)
+        chunk_keys = []
+        for cache_key, value in stored.items():
+            if isinstance(value, ChunkedValue):
+                chunk_keys.extend( self.__chunk_key(cache_key, value.digest, i) for i in range(value.count) )
+        chunks  = cache.get_many(chunk_keys, version=version) if chunk_keys else {}
+        pickles = {}
+        for cache_key, value in stored.items():
+            if isinstance(value, ChunkedValue):
+                keys = [ self.__chunk_key(cache_key, value.digest, i) for i in range(value.count) ]
+                if any(key not in chunks for key in keys): continue
+                data = "".join(chunks[key] for key in keys)
+                if hashlib.md5(data).hexdigest() != value.digest: continue
+                pickles[cache_key] = zlib.decompress(data)
+            elif isinstance(value, CompressedValue):
+                pickles[cache_key] = zlib.decompress(value.data)
+            else:
+                pickles[cache_key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return pickles
+
+    def get_metrics(self):
+        """ Returns the hits and misses (shared in the cache) by tag """
+        names   = cache.get(self.__keys()['tag_metrics_names']) or set()
+        keys    = dict(
+            (self.__keys()['tag_metrics'].format(name=name, kind=kind), (name, kind))
+            for name in names for kind in ('hits', 'misses')
+        )
+        metrics = dict( (name, {'hits': 0, 'misses': 0}) for name in names )
+        for key, value in cache.get_many(keys.keys()).items():
+            name, kind = keys[key]
+            metrics[name][kind] = value
+        return metrics
 
     def get(self, topic, suffix_key):
-        rev       = self.version(topic)
-        cache_key = self.__get_key(topic, suffix_key)
-        return cache.get(cache_key, version=rev)
+        return self.get_many(topic, [suffix_key]).get(suffix_key, None)
+
+    def get_many(self, topic, suffix_keys):
+        """
+        Returns a dictionary of the values found for the given keys. The values
+        read recently by this process are only checked against the versions
+        of the topic and of their tags, read at once; the others are read at
+        once too.
+        """
+        keys  = dict( (self.__get_key(topic, suffix_key), suffix_key) for suffix_key in suffix_keys )
+        # Values read recently by this process (with the version of the topic)
+        local = {}
+        for cache_key in keys:
+            item = self.local_cache.get(cache_key)
+            if item is not None: local[cache_key] = (item[0], pickle.loads(item[1]))
+        rev, versions = self.__read_versions(topic, tagged_with(value for r, value in local.values()))
+        values  = dict( (cache_key, value) for cache_key, (r, value) in local.items() if r == rev )
+        missing = [ cache_key for cache_key in keys if cache_key not in values ]
+        if missing:
+            read = {}
+            for cache_key, pickled in self.__read(missing, version=rev).items():
+                self.local_cache.set(cache_key, (rev, pickled))
+                values[cache_key] = read[cache_key] = pickle.loads(pickled)
+            # Tags of every tagged value are checked at once
+            tags = tagged_with(read.values()).difference(versions)
+            if tags: versions.update( self.tags_versions(topic, tags) )
+        results  = {}
+        for cache_key, value in values.items():
+            if isinstance(value, TaggedValue):
+                stale = [ tag for tag, v in value.tags.items() if versions.get(tag) != v ]
+                if stale:
+                    self.__record(stale, hit=False)
+                    continue
+                self.__record(value.tags.keys(), hit=True)
+                value = value.value
+            results[keys[cache_key]] = value
+        return results
 
-    def set(self, topic, suffix_key, value, timeout=None):
+    def set(self, topic, suffix_key, value, timeout=None, tags=None):
+        """
+        Cache a value for the given topic. With `tags`, the value is also
+        invalidated by any call to `invalidate` with one of those tags.
+        """
+        self.set_many(topic, { suffix_key: value }, timeout, tags)
+
+    def set_many(self, topic, values, timeout=None, tags=None):
+        """ Cache several values (by key) at once (see set) """
         rev = self.version(topic)
-        if rev is None:
-            self.incr_version(topic)
         if timeout == None:
             timeout = self.__timeout()
-        cache_key = self.__get_key(topic, suffix_key)
-        cache.set(cache_key, value, timeout, version=rev)
+        if tags:
+            versions = self.tags_versions(topic, tags, create=True)
+        data = {}
+        for suffix_key, value in values.items():
+            if tags: value = TaggedValue(versions, value)
+            data[self.__get_key(topic, suffix_key)] = value
+        for cache_key, pickled in self.__write(data, timeout, version=rev).items():
+            self.local_cache.set(cache_key, (rev, pickled))
 
     def delete(self, topic, suffix_key):
         cache_key = self.__get_key(topic, suffix_key)
         rev = self.version(topic)
+        self.local_cache.delete(cache_key)
         cache.delete(cache_key, version=rev)
 
+    def get_or_compute(self, topic, suffix_key, compute, args=(), timeout=None, tags=None):
+        """
+        Returns the cached value of the given key or the result of
+        `compute(*args)`. Only one worker computes a missing value at a time:
+        the others get the previous value of the key (stale) meanwhile, or wait
+        for the new one if there is no previous value.
+
+        Keys starting with a prefix from settings.TOPIC_CACHE_BACKGROUND_REFRESH
+        are recomputed by a job while the stale value is served, so `compute`
+        must then be a module-level function with picklable `args`.
+        `tags` can be given as a function (called only to cache a value).
+        """
+        value = self.get(topic, suffix_key)
+        if value is not None: return value
+        cache_key = self.__get_key(topic, suffix_key)
+        stale_key = cache_key + '_stale'
+        # Lock this key
+        if cache.add(cache_key + '_lock', True, self.__timeout('lock')):
+            prefixes = getattr(settings, "TOPIC_CACHE_BACKGROUND_REFRESH", ())
+            if any(suffix_key.startswith(prefix) for prefix in prefixes):
+                stale = self.__read_stale(stale_key)
+                if stale is not None:
+                    import django_rq
+                    if callable(tags): tags = tags()
+                    queue = django_rq.get_queue('high')
+                    queue.enqueue(refresh_topic_cache, topic, suffix_key, compute, args, timeout, tags)
+                    return stale
+            return self.refresh(topic, suffix_key, compute, args, timeout, tags)
+        # Another worker is computing the value
+        stale = self.__read_stale(stale_key)
+        if stale is not None: return stale
+        # Not worth computing it twice (see without_waiting)
+        if getattr(self.request, "no_wait", False): raise ComputingElsewhere(suffix_key)
+        deadline = time.time() + self.__timeout('lock_wait')
+        while time.time() < deadline:
+            time.sleep(0.1)
+            value = self.get(topic, suffix_key)
+            if value is not None: return value
+        # Don't wait anymore
+        return compute(*args)
+
+    def __read_stale(self, stale_key):
+        pickled = self.__read([stale_key]).get(stale_key, None)
+        return None if pickled is None else pickle.loads(pickled)
+
+    def refresh(self, topic, suffix_key, compute, args=(), timeout=None, tags=None):
+        """ Compute, cache and return a value then release its lock (see get_or_compute) """
+        cache_key = self.__get_key(topic, suffix_key)
+        try:
+            value = compute(*args)
+            if callable(tags): tags = tags()
+            self.set(topic, suffix_key, value, timeout, tags)
+            # Not invalidated by new versions
+            self.__write({ cache_key + '_stale': value }, self.__timeout('stale'))
+            return value
+        finally:
+            cache.delete(cache_key + '_lock')
+
+def refresh_topic_cache(topic, suffix_key, compute, args=(), timeout=None, tags=None):
+    """ Job computing a value of the topic cache (see TopicCachier.get_or_compute) """
+    return topic_cache.refresh(topic, suffix_key, compute, args, timeout, tags)
+
 class DumbProfiler(object):
     __instance = None
 
@@ -571,39 +1058,60 @@ class DumbProfiler(object):
                 delattr(self, attr)
 
 
+class TopicRoutes(object):
+    """
+    Topics resolved by the username of their author and their slug, kept
+    within the current process. Any change of a topic increments a version
+    shared by every process, which drops the topics they resolved.
+    """
+    VERSION_KEY     = "topic_routes_version"
+    VERSION_TIMEOUT = 60 * 60 * 24 * 30
+    # Renamed authors aren't tracked: their topics expire after this delay
+    TTL             = 60 * 5
+    MAX_SIZE        = 1000
+
+    def __init__(self):
+        self.topics = LocalCache(self.MAX_SIZE, self.TTL)
+
+    def version(self):
+        return cache.get(self.VERSION_KEY) or 0
+
+    def incr_version(self):
+        try:
+            cache.incr(self.VERSION_KEY)
+        except ValueError:
+            # The version can't go back to a previous value
+            cache.set(self.VERSION_KEY, int(time.time() * 1000), self.VERSION_TIMEOUT)
+        self.topics.clear()
+
+    def get(self, username, slug):
+        """ Returns the topic (or None), a copy of it the request can change """
+        from app.detective.models import Topic
+        cache_key = (self.version(), username, slug)
+        topic     = self.topics.get(cache_key)
+        if topic is None:
+            try:
+                topic = Topic.objects.select_related('author').get(slug=slug, author__username=username)
+            except Topic.DoesNotExist:
+                return None
+            self.topics.set(cache_key, topic)
+        return copy.copy(topic)
+
 topic_cache   = TopicCachier()
+topic_routes  = TopicRoutes()
 dumb_profiler = DumbProfiler()
 
 def download_url(url):
-    tmp_file = None
-    def is_image(tmp):
-        mimetype = magic.from_file(tmp.name, True)
-        return mimetype.startswith('image')
-
-    def is_oversized(tmp, url):
-        max_size_in_bytes = 1 * 1024 ** 2 # 1MB
-        file_size = os.stat(tmp.name).st_size
-        oversized = file_size > max_size_in_bytes
-        return oversized
-
+    """
+    Download the image at the given url (up to 1MB) into a temporary file.
+    The download stops as soon as the file is too big or isn't an image.
+    """
+    from app.detective import media
     if url == None:
         return None
-    try:
-        name = urlparse(url).path.split('/')[-1]
-        tmp_file = NamedTemporaryFile(delete=True)
-        tmp_file.write(urllib2.urlopen(url, timeout=10).read())
-        tmp_file.flush()
-        if not is_image(tmp_file):
-            raise NotAnImage()
-        if is_oversized(tmp_file, url):
-            raise OversizedFile()
-        return File(tmp_file, name)
-    except urllib2.HTTPError:
-        raise UnavailableImage()
-    except urllib2.URLError:
-        raise UnavailableImage()
-
-
+    name = urlparse(url).path.split('/')[-1]
+    tmp_file, digest, mimetype = media.download(url)
+    return File(tmp_file, name)
 
 def get_image(url_or_path, download_external=False):
     from django.conf import settings
@@ -613,13 +1121,11 @@ def get_image(url_or_path, download_external=False):
     # It's an url
     elif url_or_path.startswith("http"):
         if url_or_path.startswith(settings.MEDIA_URL) or download_external:
-            # From file storage?
-            image = download_url(url_or_path)
-            path = join(settings.UPLOAD_ROOT, image.name)
-            # Save the new image
-            default_storage.save(path, image)
+            from app.detective import media
+            # Save the new image (once for a given content)
+            name = media.store_url(url_or_path)
             # And load it from the path
-            return get_image(path, download_external)
+            return get_image(join(settings.MEDIA_ROOT, name), download_external)
         else:
             return None
     # It's a path
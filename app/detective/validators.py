@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Validate and clean the properties of a node. The cleaners of every field of
+# a model are built once (when the model is first validated) and kept on the
+# model class, so they are rebuilt along with the models when the ontology of
+# a topic changes.
+# -----------------------------------------------------------------------------
+from django                 import forms
+from django.conf            import settings
+from django.core.exceptions import ValidationError
+
+# Returned by a cleaner when the value must be left out of the cleaned data
+SKIP = object()
+
+# Maximum number of property shapes remembered as valid for a model
+MAX_VALID_SIGNATURES = 1024
+# Fields whose string values are checked even for a known shape
+CHECKED_TYPES = ('DateField', 'DateTimeField', 'URLField', 'EmailField')
+
+class ModelValidator(object):
+
+    def __init__(self, model):
+        self.model      = model
+        # Shapes of properties already seen as valid (see signature)
+        self.valid_signatures = set()
+        self.fields     = dict((field.name, field) for field in model._meta.fields)
+        # The format of their values isn't part of the signature
+        self.checked_fields = set(name for name, field in self.fields.items()
+                                  if field.get_internal_type() in CHECKED_TYPES)
+        self.cleaners   = {}
+        self.formfields = {}
+        for name, field in self.fields.items():
+            cleaner = self.compile_field(field)
+            if cleaner is not None:
+                self.cleaners[name] = cleaner
+
+    def compile_field(self, field):
+        """ Returns a function to clean a value of the given field """
+        if field.get_internal_type() == 'BooleanField':
+            return clean_boolean
+        # DateTime field must be validate manually
+        elif field.get_internal_type() == 'DateTimeField':
+            formfield = forms.DateTimeField(input_formats=settings.DATETIME_FORMATS, required=False)
+            def clean_datetime(value, allow_missing):
+                try:
+                    return formfield.clean(value)
+                except ValidationError:
+                    if allow_missing: return SKIP
+                    raise ValidationError('Must be a valid date/time')
+            return clean_datetime
+        # Only literal values have a _property attribute
+        elif hasattr(field, "_property"):
+            return compile_property(field._property)
+        # The given value is a relationship
+        elif hasattr(field, "target_model"):
+            return clean_relationship
+        # Treat id
+        elif field.name == "id":
+            return lambda value, allow_missing: int(value)
+        return None
+
+    def formfield(self, name):
+        """ Returns the (cached) form field of the given literal field """
+        if name not in self.formfields:
+            self.formfields[name] = self.fields[name]._property.formfield()
+        return self.formfields[name]
+
+    def clean(self, data, allow_missing=False):
+        """
+        Validate the whole `data` dictionary in one pass.
+        Returns a tuple (cleaned data, errors by field name).
+        """
+        cleaned_data = {}
+        errors       = {}
+        cleaners     = self.cleaners
+        for field_name, value in data.items():
+            cleaner = cleaners.get(field_name, None)
+            if cleaner is None: continue
+            try:
+                value = cleaner(value, allow_missing)
+            except ValidationError as e:
+                errors[field_name] = e.messages
+            else:
+                if value is not SKIP:
+                    cleaned_data[field_name] = value
+        return cleaned_data, errors
+
+    def signature(self, data):
+        """ The shape of a properties dictionary: its keys and their types """
+        return tuple(sorted((key, type(value)) for key, value in data.items()))
+
+    def is_known_valid(self, data):
+        if self.signature(data) not in self.valid_signatures: return False
+        # Only the values of these fields are cleaned
+        for key in self.checked_fields.intersection(data):
+            if isinstance(data[key], basestring):
+                try:
+                    self.cleaners[key](data[key], False)
+                except ValidationError:
+                    return False
+        return True
+
+    def remember_valid(self, data):
+        if len(self.valid_signatures) < MAX_VALID_SIGNATURES:
+            self.valid_signatures.add(self.signature(data))
+
+    def validate(self, data, allow_missing=False):
+        """ Returns the cleaned data or raises every error at once """
+        cleaned_data, errors = self.clean(data, allow_missing)
+        if errors: raise ValidationError(errors)
+        return cleaned_data
+
+def clean_boolean(value, allow_missing):
+    # Boolean field must be validate manually
+    if type(value) is not bool:
+        if allow_missing: return SKIP
+        raise ValidationError('Must be a boolean value')
+    return value
+
+def compile_property(prop):
+    try:
+        # Get a single field validator
+        formfield = prop.formfield()
+    except TypeError:
+        formfield = None
+    validators = getattr(prop, "validators", [])
+
+    def clean_with_validators(value):
+        # This field has several validators
+        for validator in validators:
+            # Process validation with every validator
+            validator(value)
+        # @warning: this will validate the data for
+        # array of values but not clean them
+        return value
+
+    def clean_property(value, allow_missing):
+        try:
+            if formfield is None:
+                return clean_with_validators(value)
+            try:
+                # Validate and clean data
+                return formfield.clean(value)
+            except TypeError:
+                return clean_with_validators(value)
+        except ValidationError:
+            if allow_missing: return SKIP
+            raise
+    return clean_property
+
+def clean_relationship(value, allow_missing):
+    if type(value) is not list: return SKIP
+    # Common error message
+    error   = "Bad relationship value"
+    # The validation method will collect targets ID
+    cleaned = []
+    # Relationships can be added using to ways:
+    # * a list of numeric id
+    # * a list of objects containing an id key (final formatspec)
+    for rel in value:
+        # Evaluate the relation as a string:
+        if type(rel) is str:
+            # it must be a numeric value
+            if rel.isdigit():
+                # We take care of casting it to integer.
+                cleaned.append( int(rel) )
+            elif not allow_missing:
+                raise ValidationError(error)
+        # This is an integer, we're just passing
+        elif type(rel) is int:
+            cleaned.append(rel)
+        # This is an object
+        elif type(rel) is dict:
+            # The given object as no ID
+            if "id" not in rel:
+                raise ValidationError(error)
+            elif not allow_missing:
+                # Add and cast the value
+                cleaned.append( int(rel["id"]) )
+    return cleaned
+
+def get_model_validator(model):
+    """ Returns the validator of the given model (built once) """
+    # Don't use the validator of a parent class
+    validator = model.__dict__.get("_validator", None)
+    if validator is None:
+        validator = ModelValidator(model)
+        model._validator = validator
+    return validator
+
+# EOF
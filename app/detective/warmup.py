@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Recompute the expensive cache entries of a topic (graph, types, forms,
+# syntax...) right after they are invalidated or after a deploy, so the first
+# visitors of a topic don't pay for them. The most visited topics go first.
+# -----------------------------------------------------------------------------
+from django.conf       import settings
+from django.core.cache import cache
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A warm-up can't be scheduled twice for a topic within this delay
+# (or until the scheduled one is done)
+WARMUP_PENDING_TIMEOUT = 60
+# Visits counted by this process before being added to the shared counters
+VISITS_FLUSH_EVERY = 50
+VISITS_TIMEOUT     = 60 * 60 * 24 * 7
+# Visits counted by this process (by topic id)
+visits = collections.defaultdict(int)
+
+def warm_graph(topic):
+    from app.detective.utils import get_leafs_and_edges
+    # Default depth of summary/graph
+    get_leafs_and_edges(topic, depth=1, root_node="0")
+
+def warm_types(topic):
+    from app.detective.topics.common.summary import get_types
+    get_types(topic)
+
+def warm_forms(topic):
+    from app.detective.topics.common.summary import get_forms
+    get_forms(topic)
+
+def warm_syntax(topic):
+    topic.get_syntax()
+
+def warm_entities_count(topic):
+    topic.entities_count()
+
+# Every cache entry that can be warmed up (by name)
+ENTRIES = collections.OrderedDict([
+    ("graph"         , warm_graph),
+    ("types"         , warm_types),
+    ("forms"         , warm_forms),
+    ("syntax"        , warm_syntax),
+    ("entities_count", warm_entities_count),
+])
+
+def get_entries():
+    """ Names of the entries to warm up (see settings.TOPIC_CACHE_WARMUP) """
+    return getattr(settings, "TOPIC_CACHE_WARMUP", ENTRIES.keys())
+
+def pending_key(topic_id):
+    return "warmup_%s_pending" % topic_id
+
+def visits_key(topic_id):
+    return "warmup_%s_visits" % topic_id
+
+def warm_up_topic(topic_id, entries=None):
+    """
+    Job computing the given cache entries of a topic (if they're missing).
+    The entries another worker is computing are skipped.
+    """
+    from app.detective.exceptions import ComputingElsewhere
+    from app.detective.models     import Topic
+    from app.detective.utils      import topic_cache
+    try:
+        # No other warm-up is scheduled until this one is done
+        cache.set(pending_key(topic_id), True, WARMUP_PENDING_TIMEOUT)
+        try:
+            topic = Topic.objects.get(id=topic_id)
+        except Topic.DoesNotExist:
+            return dict(warmed=[], skipped=[])
+        warmed  = []
+        skipped = []
+        with topic_cache.without_waiting():
+            for name in entries or get_entries():
+                try:
+                    ENTRIES[name](topic)
+                    warmed.append(name)
+                except ComputingElsewhere:
+                    skipped.append(name)
+                except Exception as e:
+                    logger.warning("Warm-up: unable to warm %s up for %s: %s" % (name, topic.slug, e))
+        return dict(warmed=warmed, skipped=skipped)
+    finally:
+        cache.delete(pending_key(topic_id))
+
+def schedule_warm_up(topic, entries=None):
+    """ Enqueue the warm-up of the given topic (once until it's done) """
+    if cache.add(pending_key(topic.id), True, WARMUP_PENDING_TIMEOUT):
+        # Imported here to keep the queue client out of the request path
+        import django_rq
+        django_rq.get_queue('low').enqueue(warm_up_topic, topic.id, entries)
+        return True
+    return False
+
+def record_visit(topic):
+    """ Count a visit of the given topic """
+    visits[topic.id] += 1
+    if sum(visits.values()) >= VISITS_FLUSH_EVERY:
+        flush_visits()
+
+def flush_visits():
+    """ Add the visits counted by this process to the shared counters """
+    for topic_id, count in visits.items():
+        if not cache.add(visits_key(topic_id), count, VISITS_TIMEOUT):
+            try: cache.incr(visits_key(topic_id), count)
+            except ValueError: cache.set(visits_key(topic_id), count, VISITS_TIMEOUT)
+    visits.clear()
+
+def most_visited(topics):
+    """ Sort the given topics from the most to the least visited """
+    counts = cache.get_many([ visits_key(topic.id) for topic in topics ])
+    return sorted(topics, key=lambda topic: counts.get(visits_key(topic.id), 0), reverse=True)
+
+# EOF
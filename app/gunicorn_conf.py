@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Gunicorn settings (see the Procfile)
+# -----------------------------------------------------------------------------
+import os
+
+workers     = int(os.getenv("WEB_CONCURRENCY", 3))
+# The application (and the topics it preloads, see app.detective.preload) is
+# loaded once by the master then shared with its workers
+preload_app = True
+
+def post_fork(server, worker):
+    from app.detective.preload import close_connections
+    close_connections()
+
+# EOF
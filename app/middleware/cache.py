@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.core.cache import get_cache
+from django.http import HttpResponse, HttpResponseNotModified
 from django.utils.cache import get_cache_key
+import hashlib
 import re
 
 class FetchFromCacheMiddleware(object):
@@ -56,4 +58,121 @@ class FetchFromCacheMiddleware(object):
 
         # hit, return cached response
         request._cache_update_cache = False
-        return response
\ No newline at end of file
+        return response
+
+class TopicCacheRequest(object):
+    """
+    Read the versions of the topics cache once per request
+    (see app.detective.utils.TopicCachier.begin_request).
+    """
+    def process_request(self, request):
+        from app.detective.utils import topic_cache
+        topic_cache.begin_request()
+        return None
+
+    def process_response(self, request, response):
+        from app.detective.utils import topic_cache
+        topic_cache.end_request()
+        return response
+
+def volatile_response(request):
+    """
+    The response to this request may change while the topic doesn't: it gets
+    no ETag and isn't cached (see TopicETag and TopicResponseCache).
+    """
+    request._topic_volatile = True
+
+def private_response(request):
+    """
+    The response to this request depends on its user (not only on its
+    permissions): it isn't shared with other users (see TopicResponseCache).
+    """
+    request._topic_private = True
+
+def get_cacheable_topic(request, bypass_urls):
+    """ Returns the topic of a request whose response can be cached """
+    topic = getattr(request, 'current_topic', None)
+    if topic is None or not request.method in ('GET', 'HEAD'): return None
+    # The user of a request authenticated by its headers isn't known yet
+    if 'HTTP_AUTHORIZATION' in request.META: return None
+    for regex in bypass_urls:
+        if re.match(regex, request.path): return None
+    return topic
+
+def permissions_fingerprint(request, topic):
+    """ The permissions of the user on the given topic (ie: "staff", "anonymous") """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated(): return "anonymous"
+    if user.is_staff: return "staff"
+    prefix      = "%s." % topic.app_label()
+    permissions = sorted(p for p in user.get_all_permissions() if p.startswith(prefix))
+    return ",".join(permissions) or "reader"
+
+def response_digest(request, topic, fingerprint):
+    from app.detective.utils import topic_cache
+    parts = [topic_cache.etag(topic), fingerprint, request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+    return hashlib.md5("|".join(parts).encode("utf-8")).hexdigest()
+
+class TopicETag(object):
+    """
+    Give an ETag to the responses of a topic's API (derived from the topic
+    cache version and the user's permissions on the topic) and answer the
+    conditional GET requests with 304 while nothing changed, before the
+    resource does any work. Must be used after app.middleware.storage.TopicRouting.
+    """
+    def get_etag(self, request):
+        topic = get_cacheable_topic(request, getattr(settings, 'ETAG_BYPASS_URLS', []))
+        if topic is None: return None
+        user = getattr(request, 'user', None)
+        # The responses of a user can be about this user (ie: summary/mine)
+        fingerprint = "%s:%s" % (getattr(user, 'id', None), permissions_fingerprint(request, topic))
+        return '"%s"' % response_digest(request, topic, fingerprint)
+
+    def process_request(self, request):
+        etag = request._topic_etag = self.get_etag(request)
+        if etag is not None:
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+            if etag in [ tag.strip() for tag in if_none_match.split(',') ]:
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+        return None
+
+    def process_response(self, request, response):
+        etag = getattr(request, '_topic_etag', None)
+        if etag is not None and response.status_code == 200 and not response.has_header('ETag') \
+                and not getattr(request, '_topic_volatile', False):
+            response['ETag'] = etag
+        return response
+
+class TopicResponseCache(object):
+    """
+    Cache the GET responses of a topic's API until something changes in the
+    topic. A cached response is shared by every user with the same
+    permissions on the topic (not only by its user).
+    Must be used after app.middleware.storage.TopicRouting.
+    """
+    def get_cache_key(self, request):
+        topic = get_cacheable_topic(request, getattr(settings, 'RESPONSE_CACHE_BYPASS_URLS', []))
+        if topic is None: return None
+        return "response_%s" % response_digest(request, topic, permissions_fingerprint(request, topic))
+
+    def process_request(self, request):
+        from app.detective.utils import topic_cache
+        cache_key = request._topic_response_key = self.get_cache_key(request)
+        if cache_key is None: return None
+        cached = topic_cache.get(request.current_topic, cache_key)
+        if cached is None: return None
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def process_response(self, request, response):
+        from app.detective.utils import topic_cache
+        cache_key = getattr(request, '_topic_response_key', None)
+        if cache_key is not None and response.status_code == 200 \
+                and not getattr(request, '_topic_volatile', False) \
+                and not getattr(request, '_topic_private', False) \
+                and not getattr(response, 'streaming', False):
+            timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 10)
+            topic_cache.set(request.current_topic, cache_key, (response.content, response['Content-Type']), timeout)
+        return response
@@ -27,21 +27,37 @@
 #   
 #   You should have received a copy of the GNU General Public License
 #   along with this program. If not, see <http://www.gnu.org/licenses/>.
+from django.http          import Http404
+from app.detective        import topics
 from app.detective.models import Topic
+from app.detective.utils  import topic_routes
+from app.detective.warmup import record_visit
 import re
 
-class StoreTopicList(object):
-    def process_request(self, request):
-        request.topic_list = Topic.objects.all()
-        return None
+TOPIC_PATH = re.compile(r'api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/')
 
-class StoreTopic(object):
+class TopicRouting(object):
+    """
+    Find the topic of an API request (see get_topic_from_request) and create
+    its API if needed. Topics are resolved from an in-process cache, so a warm
+    request doesn't hit the database. The list of every topic is only loaded
+    when it is used (see get_topics_from_request).
+    """
     def process_request(self, request):
-        regex = re.compile(r'api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/')
-        urlparts = regex.findall(request.path)
+        urlparts = TOPIC_PATH.findall(request.path)
         if urlparts:
+            username, slug = urlparts[0]
+            topic = topic_routes.get(username, slug)
+            if topic is None:
+                raise Http404(Topic.DoesNotExist())
             try:
-                request.current_topic = Topic.objects.get(slug=urlparts[0][1], author__username=urlparts[0][0])
-            except Topic.DoesNotExist:
-                pass
-        return None
\ No newline at end of file
+                # This will automaticly create the API if needed
+                # or failed if the topic is unknown
+                getattr(topics, topic.ontology_as_mod)
+            except AttributeError as e:
+                raise Http404(e)
+            request.current_topic = topic
+            record_visit(topic)
+        return None
+
+# EOF
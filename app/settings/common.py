@@ -137,12 +137,29 @@ CACHE_BYPASS_URLS               = (
     r"/api/(?P<user>[\w\-\.]+)/(?P<topic>[\w\-]+)/v1/summary/export/",
     r"/api/(?P<user>[\w\-\.]+)/(?P<topic>[\w\-]+)/v1/summary/forms/"
 )
+# Responses of a topic's API which may change while the topic doesn't (no ETag)
+ETAG_BYPASS_URLS                = (
+    # Users, topics, jobs... (not data of a topic)
+    r"/api/detective/common/",
+    r"/api/(?P<user>[\w\-\.]+)/(?P<topic>[\w\-]+)/v1/summary/export/",
+    r"/api/(?P<user>[\w\-\.]+)/(?P<topic>[\w\-]+)/v1/summary/bulk_upload/",
+    r"/api/(?P<user>[\w\-\.]+)/(?P<topic>[\w\-]+)/v1/[\w\-]+/bulk_upload/",
+)
+# Responses of a topic's API shared by the users with the same permissions
+# on the topic (see app.middleware.cache.TopicResponseCache)
+RESPONSE_CACHE_TIMEOUT          = 60 * 10
+RESPONSE_CACHE_BYPASS_URLS      = ETAG_BYPASS_URLS + (
+    # Responses about the current user (ie: summary/mine, <model>/mine), the
+    # resources also keep them out of the cache (see private_response)
+    r"/api/(?P<user>[\w\-\.]+)/(?P<topic>[\w\-]+)/v1/[\w\-]+/mine/",
+)
 
 MIDDLEWARE_CLASSES = [
     'django_seo_js.middleware.EscapedFragmentMiddleware',
     'django_seo_js.middleware.UserAgentMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'app.middleware.cache.TopicCacheRequest',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -287,6 +304,14 @@ RQ_QUEUES = {
     'low'    : RQ_CONFIG
 }
 
+# Topic cache keys recomputed by a job (the previous value is served meanwhile)
+TOPIC_CACHE_BACKGROUND_REFRESH = ('leafs_and_nodes_',)
+# Topic cache entries recomputed after a write or a deploy (see app.detective.warmup)
+TOPIC_CACHE_WARMUP = ('graph', 'types', 'forms', 'syntax', 'entities_count')
+TOPIC_CACHE_WARMUP_ON_WRITE = True
+# Number of topics (the most visited) whose API is built when the server starts
+TOPIC_PRELOAD = int(os.getenv('TOPIC_PRELOAD', 10))
+
 APP_TITLE = 'Detective.io'
 
 # GROUPS of user / Plans
@@ -17,4 +17,6 @@ DEBUG_TOOLBAR_PANELS = (
 INSTALLED_APPS += ('debug_toolbar',)
 USE_DEBUG_TOOLBAR = True
 
-ENABLE_PROFILING = False
\ No newline at end of file
+ENABLE_PROFILING = False
+# The development server reloads often
+TOPIC_PRELOAD = 0
\ No newline at end of file
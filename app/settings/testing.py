@@ -24,6 +24,10 @@ INSTALLED_APPS.remove('django_seo_js')
 ACCOUNT_ACTIVATION_ENABLED = True
 
 NEO4DJANGO_PROFILE_REQUESTS = False
+# Tests expect fresh values
+TOPIC_CACHE_BACKGROUND_REFRESH = ()
+TOPIC_CACHE_WARMUP_ON_WRITE = False
+TOPIC_PRELOAD = 0
 NEO4DJANGO_DEBUG_GREMLIN = False
 
 CACHES = {
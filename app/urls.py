@@ -1,6 +1,5 @@
-from app.middleware.virtualapi import VirtualApi
-from app.middleware.storage    import StoreTopic
-from app.middleware.storage    import StoreTopicList
+from app.middleware.storage    import TopicRouting
+from app.middleware.cache      import TopicETag, TopicResponseCache
 from django.conf               import settings
 from django.conf.urls          import patterns, include, url
 from django.contrib            import admin
@@ -12,9 +11,9 @@ admin.autodiscover()
 # If needed, this middleware will create the API endpoints and resources
 # that match to the given slug.
 middlewarepatterns = mpatterns('',
-    middleware(r'^api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/', StoreTopic),
-    middleware(r'^api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/', StoreTopicList),
-    middleware(r'^api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/', VirtualApi),
+    middleware(r'^api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/', TopicRouting),
+    middleware(r'^api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/', TopicETag),
+    middleware(r'^api/([a-zA-Z0-9_\-.]+)/([a-zA-Z0-9_\-]+)/', TopicResponseCache),
 )
 
 urlpatterns = patterns('',
@@ -27,6 +27,12 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "lib"))
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Build the API of the most visited topics before the first request (in the
+# gunicorn master when the app is preloaded, see app/gunicorn_conf.py)
+from app.detective.preload import preload_topics, close_connections
+preload_topics()
+close_connections()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)
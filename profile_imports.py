@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# Encoding: utf-8
+# -----------------------------------------------------------------------------
+# Project : Detective.io
+# -----------------------------------------------------------------------------
+# License : GNU GENERAL PUBLIC LICENSE v3
+# -----------------------------------------------------------------------------
+# Report the time spent importing every module (like `python -X importtime`
+# does in Python 3.7+), to find what slows down the boot of the workers and
+# the management commands. Usage:
+#
+#   python profile_imports.py [--settings=app.settings.development] [--top=20] [module ...]
+#
+# The modules default to the ones loaded by the web workers (app.wsgi loads
+# every topic, so it isn't one of them).
+# -----------------------------------------------------------------------------
+from optparse import OptionParser
+import __builtin__
+import importlib
+import os
+import sys
+import time
+
+DEFAULT_MODULES = ["app.detective.models", "app.urls"]
+
+class ImportProfiler(object):
+
+    def __init__(self):
+        self.original = __builtin__.__import__
+        # Imports in progress: [name, start, time spent by nested imports]
+        self.stack    = []
+        # Finished imports: (depth, name, self time, cumulative time)
+        self.imports  = []
+
+    def __import__(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        loaded = len(sys.modules)
+        self.stack.append([name, time.time(), 0.0])
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            name, start, nested = self.stack.pop()
+            cumulative = time.time() - start
+            if self.stack: self.stack[-1][2] += cumulative
+            # Modules already imported don't count
+            if len(sys.modules) > loaded:
+                if fromlist: name = "%s (%s)" % (name, ", ".join(fromlist))
+                self.imports.append((len(self.stack), name, cumulative - nested, cumulative))
+
+    def __enter__(self):
+        __builtin__.__import__ = self.__import__
+        return self
+
+    def __exit__(self, *args):
+        __builtin__.__import__ = self.original
+
+def main():
+    parser = OptionParser(usage="%prog [options] [module ...]")
+    parser.add_option("--settings", dest="settings", default="app.settings.development",
+        help="Django settings module (default: app.settings.development)")
+    parser.add_option("--top", dest="top", type="int", default=20,
+        help="Number of slowest imports to list (default: 20)")
+    options, modules = parser.parse_args()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", options.settings)
+    start = time.time()
+    with ImportProfiler() as profiler:
+        for module in modules or DEFAULT_MODULES:
+            importlib.import_module(module)
+    total = time.time() - start
+    print "import time: self [us] | cumulative | imported package"
+    for depth, name, own, cumulative in profiler.imports:
+        print "import time: %9d | %10d | %s%s" % (own * 1e6, cumulative * 1e6, "  " * depth, name)
+    print
+    print "%d slowest imports (self time):" % options.top
+    for depth, name, own, cumulative in sorted(profiler.imports, key=lambda i: i[2], reverse=True)[:options.top]:
+        print "%8.1fms  %s" % (own * 1e3, name)
+    print
+    print "%d modules imported in %.3fs" % (len(sys.modules), total)
+
+if __name__ == "__main__":
+    main()
+
+# EOF